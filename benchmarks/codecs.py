@@ -0,0 +1,98 @@
+"""Benchmark of the tensor codecs in `icyt.connectors`.
+
+Encodes the same images with every codec and reports the encoded size, the time to encode and serialize the examples
+and the decode throughput of a `tf.data` pipeline reading them back. Run it from the repository root, either on
+synthetic IFC-like images or on real TIFFs:
+
+    python -m benchmarks.codecs --examples 2000
+    python -m benchmarks.codecs --tiffs '/data/poldiv/**/*.tif'
+"""
+
+import argparse
+import glob
+import time
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets as tfds
+import tifffile as tiff
+
+from icyt import connectors
+
+
+def synthetic_images(num_examples, num_channels=14, seed=0):
+    """Yields IFC-like uint16 images of varying size with a bright cell in front of a noisy background."""
+
+    rng = np.random.default_rng(seed)
+
+    for _ in range(num_examples):
+        height, width = rng.integers(32, 160, size=2)
+        yy, xx = np.mgrid[:height, :width]
+        cell = np.exp(-(((yy - height / 2) / (height / 5)) ** 2 + ((xx - width / 2) / (width / 5)) ** 2))
+        intensity = rng.uniform(500, 4000, size=num_channels)
+        noise = rng.normal(0, 30, size=(height, width, num_channels))
+        yield (cell[..., None] * intensity + 200 + noise).clip(0, 65535).astype(np.uint16)
+
+
+def tiff_images(pattern, num_examples=None):
+    """Yields the images of the TIFFs matching a glob pattern."""
+
+    for i, path in enumerate(sorted(glob.glob(pattern, recursive=True))):
+        if num_examples is not None and i >= num_examples:
+            break
+
+        yield tiff.imread(path)
+
+
+def benchmark(images, codec):
+    """Returns encoded size, encode time and decode throughput of `images` for one codec."""
+
+    num_channels = images[0].shape[-1]
+    features = tfds.features.FeaturesDict({'image': connectors.tensor((None, None, num_channels), tf.uint16, codec)})
+    serializer = tfds.core.example_serializer.ExampleSerializer(features.get_serialized_info())
+    parser = tfds.core.example_parser.ExampleParser(features.get_serialized_info())
+
+    start = time.perf_counter()
+    serialized = [serializer.serialize_example(features.encode_example({'image': img})) for img in images]
+    encode_time = time.perf_counter() - start
+
+    ds = tf.data.Dataset.from_tensor_slices(serialized)
+    ds = ds.map(lambda x: features.decode_example(parser.parse_example(x)), num_parallel_calls=tf.data.AUTOTUNE)
+
+    start = time.perf_counter()
+    for _ in ds:
+        pass
+    decode_time = time.perf_counter() - start
+
+    return {
+        'codec': codec,
+        'size_mb': sum(len(s) for s in serialized) / 1e6,
+        'encode_s': encode_time,
+        'decode_ex_per_s': len(images) / decode_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--examples', type=int, default=1000, help='number of images')
+    parser.add_argument('--tiffs', help='glob pattern of TIFFs to use instead of synthetic images')
+    parser.add_argument('--codecs', nargs='+', default=connectors.CODECS, choices=connectors.CODECS)
+    args = parser.parse_args()
+
+    if args.tiffs:
+        images = list(tiff_images(args.tiffs, args.examples))
+    else:
+        images = list(synthetic_images(args.examples))
+
+    raw_mb = sum(img.nbytes for img in images) / 1e6
+    print(f'{len(images)} images, {raw_mb:.1f} MB raw')
+    print(f'{"codec":<6} {"size MB":>9} {"ratio":>6} {"encode s":>9} {"decode ex/s":>12}')
+
+    for codec in args.codecs:
+        result = benchmark(images, codec)
+        print(f'{result["codec"]:<6} {result["size_mb"]:>9.1f} {raw_mb / result["size_mb"]:>6.2f} '
+              f'{result["encode_s"]:>9.2f} {result["decode_ex_per_s"]:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
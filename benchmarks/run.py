@@ -0,0 +1,118 @@
+"""Build and read throughput benchmark of the builders on synthetic archives.
+
+Writes synthetic archives (see `benchmarks.synthetic`), builds every selected builder config from scratch in a
+separate process and reports build examples/sec, peak RSS and the read throughput measured with `tfds.benchmark`.
+Run it from the repository root before and after changing a generator:
+
+    python -m benchmarks.run --examples 1000
+    python -m benchmarks.run --builders poldiv romania --configs all all-stacked --workers 8 --output after.jsonl
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks import synthetic
+
+
+def benchmark(builder_name, config, manual_dir, env=None):
+    """Builds a builder config in a fresh process and returns its build and read statistics."""
+
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_build, args=(builder_name, config, manual_dir, env or {}, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _build(builder_name, config, manual_dir, env, queue):
+    os.environ.update(env)
+
+    import tensorflow_datasets as tfds
+
+    importlib.import_module(f'{builder_name}.{builder_name}')
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        # A build cache of earlier runs would make the build faster than a first build on a new archive
+        os.environ.setdefault('ICYT_CACHE_DIR', os.path.join(data_dir, 'icyt'))
+        builder = tfds.builder_cls(builder_name)(config=config, data_dir=data_dir)
+
+        start = time.perf_counter()
+        builder.download_and_prepare(download_config=tfds.download.DownloadConfig(manual_dir=manual_dir))
+        build_time = time.perf_counter() - start
+
+        num_examples = sum(split.num_examples for split in builder.info.splits.values())
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+        read = tfds.benchmark(builder.as_dataset(split='train'), batch_size=1)
+
+        queue.put({
+            'builder': builder_name,
+            'config': config,
+            'examples': num_examples,
+            'build_s': build_time,
+            'build_ex_per_s': num_examples / build_time,
+            'peak_rss_mb': peak_rss / 1024,
+            'read_ex_per_s': float(read.stats['avg']['lasts']),
+            'env': env,
+        })
+
+
+def _config_names(builder_name):
+    import tensorflow_datasets as tfds
+
+    importlib.import_module(f'{builder_name}.{builder_name}')
+    return [config.name for config in tfds.builder_cls(builder_name).BUILDER_CONFIGS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--builders', nargs='+', default=list(synthetic.ARCHIVES), choices=list(synthetic.ARCHIVES))
+    parser.add_argument('--configs', nargs='+', help='configs to build, defaults to the first config of each builder')
+    parser.add_argument('--all_configs', action='store_true', help='build all configs of each builder')
+    parser.add_argument('--examples', type=int, default=500, help='number of TIFFs per archive')
+    parser.add_argument('--min_size', type=int, default=32, help='minimum image height and width')
+    parser.add_argument('--max_size', type=int, default=128, help='maximum image height and width')
+    parser.add_argument('--workers', type=int, help='sets ICYT_NUM_WORKERS for the builds')
+    parser.add_argument('--manual_dir', help='reuse the archives in this dir instead of writing new ones')
+    parser.add_argument('--output', help='appends the results as JSON lines to this file')
+    args = parser.parse_args()
+
+    env = {'ICYT_NUM_WORKERS': str(args.workers)} if args.workers is not None else {}
+    print(f'{"builder":<16} {"config":<28} {"examples":>8} {"build ex/s":>10} {"peak RSS MB":>11} '
+          f'{"read ex/s":>10}')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manual_dir = args.manual_dir or tmp_dir
+
+        for builder_name in args.builders:
+            if not args.manual_dir:
+                synthetic.write_archive(builder_name, manual_dir, args.examples, args.min_size, args.max_size)
+
+            configs = _config_names(builder_name)
+
+            if args.configs:
+                configs = [config for config in configs if config in args.configs]
+            elif not args.all_configs:
+                configs = configs[:1]
+
+            for config in configs:
+                result = benchmark(builder_name, config, manual_dir, env)
+                print(f'{builder_name:<16} {config:<28} {result["examples"]:>8} {result["build_ex_per_s"]:>10.1f} '
+                      f'{result["peak_rss_mb"]:>11.0f} {result["read_ex_per_s"]:>10.1f}')
+
+                if args.output:
+                    with open(args.output, 'a') as f:
+                        f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
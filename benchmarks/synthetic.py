@@ -0,0 +1,210 @@
+"""Synthetic IFC archives in the layouts the builders expect.
+
+The archives contain IFC-like TIFFs with a bright cell in front of a noisy background and binary default masks, named
+like the members of the real archives, so that every builder and config can be built without the restricted data:
+
+    python -m benchmarks.synthetic --examples 500 --manual_dir /tmp/icyt/manual
+    python -m benchmarks.synthetic --dummy_data  # small archives for the builder tests
+"""
+
+import argparse
+import io
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import tifffile as tiff
+
+from icyt import ifc
+
+# Number of planes of the poldiv, poldiv_balanced and romania exports, all instrument layouts are used in turn
+_IFC_PLANES = sorted(ifc.POLDIV_LAYOUTS)
+
+# Number of members in the dummy data of the builder tests
+DUMMY_EXAMPLES = {
+    'poldiv': 6,
+    'poldiv_balanced': 9,
+    'romania': 12,
+    'phytoplankton': 12,
+    'blood_quality': 4,
+}
+
+
+def ifc_image(rng, num_planes, height, width, masks=(), dtype=np.uint16):
+    """Returns an (H, W, `num_planes`) image of a cell, with its binary mask in the planes at the indices `masks`.
+
+    Args:
+      rng: `np.random.Generator`.
+      num_planes: `int`, number of planes of the export.
+      height: `int`, image height.
+      width: `int`, image width.
+      masks: sequence of `int`, plane indices of the masks, e.g. the `masks` of an `ifc.Layout`. All other planes hold
+        channel intensities.
+      dtype: dtype of the image.
+    """
+
+    yy, xx = np.mgrid[:height, :width]
+    cy, cx = rng.uniform(0.35, 0.65) * height, rng.uniform(0.35, 0.65) * width
+    ry, rx = rng.uniform(0.15, 0.3) * height, rng.uniform(0.15, 0.3) * width
+    cell = np.exp(-(((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2))
+
+    maximum = np.iinfo(dtype).max
+    intensity = rng.uniform(0.05, 0.5, size=num_planes) * maximum
+    noise = rng.normal(0, 0.005 * maximum, size=(height, width, num_planes))
+    image = (cell[..., None] * intensity + 0.01 * maximum + noise).clip(0, maximum).astype(dtype)
+    image[..., list(masks)] = (cell > 0.3)[..., None]
+
+    return image
+
+
+def poldiv_archive(path, num_examples, min_size=32, max_size=128, seed=0):
+    """Writes a poldiv archive with species from the poldiv class list."""
+
+    rng = np.random.default_rng(seed)
+    species = _read_lines('poldiv/classes-all-species.txt')
+
+    with tarfile.open(path, 'w:gz') as tar:
+        for i in range(num_examples):
+            year = rng.choice(['2018', '2019', '2020', '2021'])
+            image = _poldiv_image(rng, i, min_size, max_size)
+            _add(tar, f'{year}/{rng.choice(species)}_{i:06d}.tif', _tiff(image))
+
+
+def poldiv_balanced_archive(path, num_examples, min_size=32, max_size=128, seed=0):
+    """Writes a poldiv_balanced archive with train/valid/test dirs and some members of the "others" class."""
+
+    rng = np.random.default_rng(seed)
+    species = _read_lines('poldiv_balanced/classes-species.txt') + ['others']
+
+    with tarfile.open(path, 'w:gz') as tar:
+        for i in range(num_examples):
+            split = ['train', 'valid', 'test'][i % 3]
+            image = _poldiv_image(rng, i, min_size, max_size)
+            _add(tar, f'{split}/{rng.choice(species)}_{i:06d}.tif', _tiff(image))
+
+
+def romania_archive(path, num_examples, min_size=32, max_size=128, seed=0):
+    """Writes a romania archive whose measurements are picked from the measurement lists of all configs.
+
+    The species of a measurement is valid in every config that selects the measurement. A share of the measurements
+    is in no list and only ends up in the `all` config.
+    """
+
+    rng = np.random.default_rng(seed)
+    selections = ['artificial-mixtures', 'metabarcoding', 'metabarcoding2', 'metabarcoding3']
+    lists = {selection: _read_lines(f'romania/{selection}-measurements.txt') for selection in selections}
+    classes = {selection: set(_read_lines(f'romania/{selection}-classes-species.txt')) for selection in selections}
+    measurements = sorted(set().union(*lists.values())) + [f'20190101_unlisted_{i}' for i in range(10)]
+
+    with tarfile.open(path, 'w:gz') as tar:
+        for i in range(num_examples):
+            measurement = measurements[rng.integers(len(measurements))]
+            species = set(_read_lines('romania/all-classes-species.txt'))
+
+            for selection in selections:
+                if measurement.startswith(tuple(lists[selection])):
+                    species &= classes[selection]
+
+            image = _poldiv_image(rng, i, min_size, max_size)
+            _add(tar, f'{rng.choice(sorted(species))}/{measurement}/{i:06d}.tif', _tiff(image))
+
+
+def phytoplankton_archive(path, num_examples, min_size=32, max_size=128, seed=0):
+    """Writes a phytoplankton archive with 12-channel images without masks in both reps."""
+
+    rng = np.random.default_rng(seed)
+    species = _read_lines('phytoplankton/classes.txt')
+
+    with tarfile.open(path, 'w:gz') as tar:
+        for i in range(num_examples):
+            rep, split = f'rep-{i % 2}', ['train', 'validation', 'test'][(i // 2) % 3]
+            image = ifc_image(rng, 12, *_size(rng, min_size, max_size))
+            _add(tar, f'{rep}/{split}/20200101_{i % 100:02d}_{rng.choice(species)}_{i}.tif', _tiff(image))
+
+
+def blood_quality_archive(path, num_examples, min_size=32, max_size=128, seed=0):
+    """Writes a blood_quality zip with `_Ch1`, `_Ch9` and `_Ch12` triplets of Canadian and Swiss samples."""
+
+    rng = np.random.default_rng(seed)
+    morphologies = _read_lines('blood_quality/classes.txt') + ['Undecidable']
+
+    with zipfile.ZipFile(path, 'w') as zf:
+        for i in range(num_examples):
+            origin = ['Canadian', 'Swiss'][i % 2]
+            morphology = rng.choice(morphologies)
+            image = ifc_image(rng, 3, *_size(rng, min_size, max_size), dtype=np.uint8)
+
+            for j, channel in enumerate([1, 9, 12]):
+                name = f'Training_Test2/{origin}_Training/Donor/Bag/{morphology}/cell_{i:06d}_Ch{channel}.ome.tif'
+                zf.writestr(name, _tiff(image[:, :, j]))
+
+
+# Builder name to archive writer and file name of the archive in the manual dir
+ARCHIVES = {
+    'poldiv': (poldiv_archive, 'poldiv-dataset-3.0.0.tar.gz'),
+    'poldiv_balanced': (poldiv_balanced_archive, 'poldiv-dataset-balanced-3.0.0.tar.gz'),
+    'romania': (romania_archive, 'romania-train-3.0.0.tar.gz'),
+    'phytoplankton': (phytoplankton_archive, 'phytoplankton-1.0.0.tar.gz'),
+    'blood_quality': (blood_quality_archive, 'Training_Test2_Canada_Swiss.zip'),
+}
+
+
+def write_archive(builder, manual_dir, num_examples, min_size=32, max_size=128, seed=0):
+    """Writes the synthetic archive of a builder into `manual_dir` and returns its path."""
+
+    write_fn, filename = ARCHIVES[builder]
+    os.makedirs(manual_dir, exist_ok=True)
+    path = os.path.join(manual_dir, filename)
+    write_fn(path, num_examples, min_size, max_size, seed)
+    return path
+
+
+def _poldiv_image(rng, i, min_size, max_size):
+    num_planes = _IFC_PLANES[i % len(_IFC_PLANES)]
+    return ifc_image(rng, num_planes, *_size(rng, min_size, max_size), masks=ifc.POLDIV_LAYOUTS[num_planes].masks)
+
+
+def _size(rng, min_size, max_size):
+    return rng.integers(min_size, max_size + 1, size=2)
+
+
+def _tiff(image):
+    buffer = io.BytesIO()
+    tiff.imwrite(buffer, image)
+    return buffer.getvalue()
+
+
+def _add(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [line.rstrip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--builders', nargs='+', default=list(ARCHIVES), choices=list(ARCHIVES))
+    parser.add_argument('--examples', type=int, default=500, help='number of TIFFs (triplets for blood_quality)')
+    parser.add_argument('--min_size', type=int, default=32, help='minimum image height and width')
+    parser.add_argument('--max_size', type=int, default=128, help='maximum image height and width')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--manual_dir', default=os.path.expanduser('~/tensorflow_datasets/downloads/manual'))
+    parser.add_argument('--dummy_data', action='store_true', help='write small archives into the dummy_data dirs')
+    args = parser.parse_args()
+
+    for builder in args.builders:
+        if args.dummy_data:
+            path = write_archive(builder, os.path.join(builder, 'dummy_data'), DUMMY_EXAMPLES[builder], 8, 16)
+        else:
+            path = write_archive(builder, args.manual_dir, args.examples, args.min_size, args.max_size, args.seed)
+
+        print(f'Wrote {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,17 @@ import tensorflow as tf
 import tifffile as tiff
 import os
 import re
-import collections
+import logging
+import functools
+
+from icyt import archive
+from icyt import beam
+from icyt import connectors
+from icyt import index
+from icyt import instrument
+from icyt import metadata
+from icyt import parallel
+from icyt import quarantine
 
 _DESCRIPTION = """"""
 
@@ -15,20 +25,35 @@ _CITATION = """
 
 _DATA_OPTIONS = ['canadian', 'swiss']
 
+_CHANNELS = ['1', '9', '12']
+
+_CHANNEL_REGEX = r'^.*_Ch(\d+)\.ome\.tif$'
+
+_INCOMPLETE_EXAMPLES = 5
+
 class BloodQualityConfig(tfds.core.BuilderConfig):
     """BuilderConfig for blood_quality dataset."""
 
-    def __init__(self, dataset=None, selection=None, **kwargs):
+    def __init__(self, dataset=None, selection=None, codec='zlib', num_workers=None, use_beam=None,
+                 quarantine=None, **kwargs):
         """Constructs a BloodQualityConfig.
 
         Args:
           selection: `str`, one of `_DATA_OPTIONS`.
+          codec: `str`, one of `connectors.CODECS`, compression of the image tensors.
+          num_workers: `int`, number of processes that decode the TIFFs, 0 for serial decoding. Defaults to the
+            `ICYT_NUM_WORKERS` environment variable.
+          use_beam: `bool`, whether to build with Apache Beam. Defaults to the `ICYT_BEAM` environment variable.
+          quarantine: `bool`, whether to skip and record members that fail to decode instead of aborting the build.
+            Defaults to the `ICYT_QUARANTINE` environment variable.
           **kwargs: keyword arguments forwarded to super.
         """
 
         if selection not in _DATA_OPTIONS:
             raise ValueError('Selection must be one of %s' % _DATA_OPTIONS)
 
+        connectors.validate(codec=codec)
+
         super(BloodQualityConfig, self).__init__(
             version=tfds.core.Version('1.1.0'),
             release_notes={
@@ -38,6 +63,10 @@ class BloodQualityConfig(tfds.core.BuilderConfig):
             **kwargs)
         self.selection = selection
         self.dataset = dataset
+        self.codec = codec
+        self.num_workers = num_workers
+        self.use_beam = use_beam
+        self.quarantine = quarantine
 
 class BloodQuality(tfds.core.GeneratorBasedBuilder):
   """DatasetBuilder for blood_quality dataset."""
@@ -54,11 +83,11 @@ class BloodQuality(tfds.core.GeneratorBasedBuilder):
 
   def _info(self) -> tfds.core.DatasetInfo:
     """Returns the dataset metadata."""
-    channels = {str(i): tfds.features.Tensor(dtype=tf.uint8, shape=(None, None), encoding='zlib') for i in [1,9,12]}
+    channels = connectors.image(_CHANNELS, tf.uint8, codec=self.builder_config.codec)
 
     features = {'channels': {**channels},
                 'filename': tf.string,
-                'morphology': tfds.features.ClassLabel(names_file=f'blood_quality/classes.txt')}
+                'morphology': tfds.features.ClassLabel(names_file=metadata.class_file('blood_quality', 'morphology'))}
 
     return tfds.core.DatasetInfo(
         builder=self,
@@ -77,35 +106,90 @@ class BloodQuality(tfds.core.GeneratorBasedBuilder):
         raise AssertionError(
             f'You must download the dataset .zip file and place it into {dl_manager.manual_dir}')
 
-    path_iter = dl_manager.iter_archive(path)
+    preparation = instrument.Preparation(f'{self.name}/{self.builder_config.name}')
+
+    with preparation.stage('plan'):
+        groups = _complete_groups(_plan_groups(path, self._path_regex()))
+
+    decode = quarantine.decoder(self.builder_config, functools.partial(_decode_group, path=path))
+
+    if beam.enabled(self.builder_config):
+        return {
+            'train': beam.generate_examples(groups, decode)
+        }
+
     return {
-        'train': self._generate_examples(path_iter)
+        'train': self._generate_examples(groups, decode, preparation)
     }
 
-  def _generate_examples(self, path_iter):
+  def _path_regex(self):
+    """Returns the regex matching morphology, basename and channel of the channel images of the config."""
+    return fr'^.*/{self.builder_config.selection.title()}.*/.*/.*/(.*)/(.*)_Ch(\d+)\.ome\.tif$'
+
+  def _generate_examples(self, groups, decode_fn, preparation=None):
         """Yields examples."""
-        path_regex = fr'^.*/{self.builder_config.selection.title()}.*/.*/.*/(.*)/(.*)_Ch(\d+)\.ome\.tif$'
-        d = collections.defaultdict(dict)
-        for filename, fobj in path_iter:
-            assert filename is not None
-            assert fobj is not None
-
-            m = re.match(path_regex, filename)
-            if m:
-              morphology = m.group(1)
-              if morphology == 'Undecidable':
-                continue
-              basename = m.group(2)
-              channel = m.group(3)
-              d[basename][channel] = tiff.imread(fobj)
-
-              if len(d[basename]) == 3:
-                channels = d[basename]
-                d.pop(basename)
-
-                features = {
-                    'channels': {**channels},
-                    'filename': filename,
-                    'morphology': morphology}
-
-                yield filename, features
+        decode_fn = instrument.Measured(decode_fn)
+        examples = parallel.apply(decode_fn, groups, parallel.num_workers(self.builder_config))
+        examples = instrument.track(examples, f'{self.name}/{self.builder_config.name}/train', len(groups),
+                                    preparation)
+        yield from quarantine.skip_failed(examples, self, 'train')
+
+  def _download_and_prepare(self, dl_manager, download_config):
+        """Generates the splits and writes their index."""
+        super(BloodQuality, self)._download_and_prepare(dl_manager, download_config)
+        index.write(self)
+
+
+def _plan_groups(path, path_regex):
+    """Groups the channel images of the zip by basename using its central directory, without decompressing anything.
+
+    Returns:
+      List of `(morphology, basename, names)` tuples with the member names of all channels in archive order.
+    """
+    groups = archive.route_zip(path, functools.partial(_route, path_regex=path_regex))
+    return [(morphology, basename, names) for (morphology, basename), names in groups.items()]
+
+
+def _route(name, path_regex):
+    """Routes a channel image of the config to its `(morphology, basename)` group, skipping the "Undecidable" class."""
+    m = re.match(path_regex, name)
+    return m.group(1, 2) if m and m.group(1) != 'Undecidable' else None
+
+
+def _complete_groups(groups):
+    """Drops the groups without exactly one image per channel and logs how many were dropped."""
+    complete, incomplete = [], []
+    for group in groups:
+        channels = sorted(re.match(_CHANNEL_REGEX, name).group(1) for name in group[2])
+        (complete if channels == sorted(_CHANNELS) else incomplete).append(group)
+
+    if incomplete:
+        logging.warning('Skipped %d of %d channel groups without exactly one image of channels %s, e.g. %s',
+                        len(incomplete), len(groups), '/'.join(_CHANNELS),
+                        ', '.join(names[0] for _, _, names in incomplete[:_INCOMPLETE_EXAMPLES]))
+
+    return complete
+
+
+def _decode_group(group, path):
+    """Reads and decodes a group of channel images into a `(key, features)` tuple.
+
+    The members are read by name from the zip, so the groups can be decoded in any order and in parallel.
+    """
+    morphology, _, names = group
+    channels = {}
+    for name in names:
+        channel = re.match(_CHANNEL_REGEX, name).group(1)
+        with instrument.stage('read') as counter:
+            _, fobj = archive.read_zip_member(path, name)
+            counter.nbytes += fobj.getbuffer().nbytes
+        with instrument.stage('decode'):
+            channels[channel] = tiff.imread(fobj)
+
+    filename = names[-1]
+    features = {
+        'channels': {**channels},
+        'filename': filename,
+        'morphology': morphology}
+
+    return filename, features
@@ -0,0 +1,18 @@
+"""blood_quality dataset."""
+
+import tensorflow_datasets as tfds
+from icyt import testing
+from . import blood_quality
+
+
+class BloodQualityTest(testing.DatasetBuilderTestCase):
+  """Tests for blood_quality dataset."""
+  DATASET_CLASS = blood_quality.BloodQuality
+  BUILDER_CONFIG_NAMES_TO_TEST = ['canadian']
+  SPLITS = {
+      'train': 2
+  }
+
+
+if __name__ == '__main__':
+  tfds.testing.test_main()
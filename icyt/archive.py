@@ -0,0 +1,288 @@
+"""Single-pass access to the tar.gz archives of the iCyt datasets."""
+
+import collections
+import functools
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import zipfile
+import zlib
+
+_CHUNK_SIZE = 16 * 1024 * 1024
+_GZIP_MAGIC = b'\x1f\x8b'
+_FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+Member = collections.namedtuple('Member', ['name', 'offset', 'size'])
+ManifestEntry = collections.namedtuple('ManifestEntry', ['name', 'offset', 'size', 'fields'])
+
+
+def cache_dir(dl_manager):
+    """Returns the directory in which decompressed archives and manifests are cached.
+
+    Defaults to `icyt/` in the download dir, the `ICYT_CACHE_DIR` environment variable overrides it.
+    """
+
+    return os.environ.get('ICYT_CACHE_DIR') or os.path.join(dl_manager.download_dir, 'icyt')
+
+
+def unpack(path, target_dir, progress_fn=None):
+    """Decompresses a tar.gz archive once into an uncompressed tar in `target_dir`.
+
+    The uncompressed tar is shared by all splits and builder configs that read the same archive and is reused as long
+    as the `fingerprint` of the archive does not change. Archives that are not gzip-compressed are returned as
+    they are.
+
+    Args:
+      path: `str`, path of the tar.gz archive.
+      target_dir: `str`, directory of the decompressed archive.
+      progress_fn: callable that is called with the number of compressed bytes read after every chunk, e.g.
+        `instrument.Step.advance`.
+
+    Returns:
+      Path of the uncompressed tar.
+    """
+
+    with open(path, 'rb') as f:
+        if f.read(2) != _GZIP_MAGIC:
+            return path
+
+    name = os.path.basename(path)
+    for suffix in ('.tar.gz', '.tgz', '.gz'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+
+    tar_path = os.path.join(target_dir, f'{name}.tar')
+    stamp_path = f'{tar_path}.fingerprint.json'
+    stamp = fingerprint(path)
+
+    if os.path.exists(tar_path) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if json.load(f) == stamp:
+                return tar_path
+
+    os.makedirs(target_dir, exist_ok=True)
+    tmp_path = _tmp_path(tar_path)
+
+    try:
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            _decompress(src, dst, path, progress_fn)
+
+        os.replace(tmp_path, tar_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    _write_json(stamp_path, stamp)
+    return tar_path
+
+
+def _decompress(src, dst, path, progress_fn=None):
+    """Decompresses all members of a gzip file, e.g. of bgzip, `pigz --independent` or concatenated archives."""
+
+    decompressor = None
+
+    while True:
+        chunk = src.read(_CHUNK_SIZE)
+
+        if not chunk:
+            break
+
+        if progress_fn is not None:
+            progress_fn(len(chunk))
+
+        while chunk:
+            if decompressor is None:
+                # Members may be followed by zero padding, like the gzip module allows
+                chunk = chunk.lstrip(b'\0')
+
+                if not chunk:
+                    break
+
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+            dst.write(decompressor.decompress(chunk))
+
+            if not decompressor.eof:
+                break
+
+            chunk = decompressor.unused_data
+            decompressor = None
+
+    if decompressor is not None:
+        raise EOFError(f'{path} ended before the end of its last gzip member')
+
+
+def route(tar_path, route_fn):
+    """Groups the files of an uncompressed tar by the key that `route_fn` returns for their name.
+
+    Only the tar headers are read, the file contents are skipped. Files for which `route_fn` returns `None` are
+    dropped.
+
+    Args:
+      tar_path: `str`, path of the uncompressed tar.
+      route_fn: callable mapping a member name to a routing key, e.g. the split name.
+
+    Returns:
+      `dict` of routing key to a list of `Member`s in archive order.
+    """
+
+    routes = collections.defaultdict(list)
+
+    with tarfile.open(tar_path, 'r:') as tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+
+            filename = os.path.normpath(info.name)
+            key = route_fn(filename)
+
+            if key is not None:
+                routes[key].append(Member(filename, info.offset_data, info.size))
+
+    return routes
+
+
+def iter_members(tar_path, members):
+    """Yields `(filename, fobj)` tuples of the given members, like `DownloadManager.iter_archive`."""
+
+    with open(tar_path, 'rb') as f:
+        for member in members:
+            f.seek(member.offset)
+            yield member.name, io.BytesIO(f.read(member.size))
+
+
+def read_member(tar_path, member):
+    """Returns a `(filename, fobj)` tuple of a single member."""
+
+    with open(tar_path, 'rb') as f:
+        f.seek(member.offset)
+        return member.name, io.BytesIO(f.read(member.size))
+
+
+def route_zip(path, route_fn):
+    """Groups the files of a zip by the key that `route_fn` returns for their name.
+
+    Only the central directory is read, nothing is decompressed. Files for which `route_fn` returns `None` are dropped.
+
+    Args:
+      path: `str`, path of the zip.
+      route_fn: callable mapping a member name to a routing key.
+
+    Returns:
+      `dict` of routing key to a list of member names in archive order.
+    """
+
+    routes = collections.defaultdict(list)
+
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+
+            key = route_fn(info.filename)
+
+            if key is not None:
+                routes[key].append(info.filename)
+
+    return routes
+
+
+def read_zip_member(path, name):
+    """Returns a `(filename, fobj)` tuple of a single zip member.
+
+    Every process opens the zip once and keeps it open, so members can be read in any order and worker processes
+    inflate their members independently of each other.
+    """
+
+    return name, io.BytesIO(_open_zip(path, os.getpid()).read(name))
+
+
+@functools.lru_cache(maxsize=None)
+def _open_zip(path, pid):
+    # Keyed by the process id, as a forked worker must not share the file offset of a handle opened by its parent
+    return zipfile.ZipFile(path)
+
+
+def manifest(path, tar_path, parse_fn, version, target_dir):
+    """Returns the member manifest of an archive, creating it on first use.
+
+    The manifest is cached as `<archive>.manifest.json` in `target_dir` and lists name, offset and size of every
+    file in the uncompressed tar together with the fields that `parse_fn` extracts from the name, e.g. species and
+    measurement. It lets a build select members by these fields and seek straight to them without scanning the
+    archive. The manifest is recreated when the `fingerprint` of the archive or `version` changes.
+
+    Args:
+      path: `str`, path of the archive.
+      tar_path: `str`, path of the uncompressed tar, see `unpack`.
+      parse_fn: callable mapping a member name to a `dict` of fields, or `None` to leave the member out.
+      version: `str`, version of `parse_fn`, change it whenever the parsed fields change.
+      target_dir: `str`, directory of the manifest, e.g. the `cache_dir` of the decompressed archive.
+
+    Returns:
+      List of `ManifestEntry`s in archive order.
+    """
+
+    manifest_path = os.path.join(target_dir, f'{os.path.basename(path)}.manifest.json')
+    stamp = fingerprint(path)
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            cached = json.load(f)
+
+        if cached['fingerprint'] == stamp and cached['version'] == version:
+            return [ManifestEntry(**entry) for entry in cached['members']]
+
+    entries = []
+
+    for member in route(tar_path, lambda filename: True).get(True, []):
+        fields = parse_fn(member.name)
+
+        if fields is not None:
+            entries.append(ManifestEntry(*member, fields))
+
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        _write_json(manifest_path, {'fingerprint': stamp,
+                                    'version': version,
+                                    'members': [entry._asdict() for entry in entries]})
+
+    except OSError as e:
+        logging.warning('Could not write manifest %s: %s', manifest_path, e)
+
+    return entries
+
+
+def fingerprint(path):
+    """Returns size, modification time and a checksum of the head and tail of a file.
+
+    The checksum only covers the first and last MiB, so that fingerprinting multi-GB archives stays cheap while
+    still catching archives that were replaced with the same size and timestamp.
+    """
+
+    stat = os.stat(path)
+    sha256 = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        sha256.update(f.read(_FINGERPRINT_SAMPLE_SIZE))
+        f.seek(max(stat.st_size - _FINGERPRINT_SAMPLE_SIZE, 0))
+        sha256.update(f.read(_FINGERPRINT_SAMPLE_SIZE))
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+
+
+def _tmp_path(path):
+    # Unique per process, so that concurrent builds of different configs do not write the same file
+    return f'{path}.{os.getpid()}.incomplete'
+
+
+def _write_json(path, obj):
+    tmp_path = _tmp_path(path)
+
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+
+    os.replace(tmp_path, path)
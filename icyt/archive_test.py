@@ -0,0 +1,107 @@
+"""Tests for icyt.archive."""
+
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from icyt import archive
+
+
+def _tar(files):
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    return buffer.getvalue()
+
+
+class UnpackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = {f'train/{i}.tif': os.urandom(1000 + i) for i in range(8)}
+        self.tar = _tar(self.files)
+
+    def _write(self, data, name='data.tar.gz'):
+        path = os.path.join(self.tmp_dir, name)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return path
+
+    def _unpack(self, path):
+        return archive.unpack(path, os.path.join(self.tmp_dir, 'cache'))
+
+    def test_single_member(self):
+        tar_path = self._unpack(self._write(gzip.compress(self.tar)))
+
+        with open(tar_path, 'rb') as f:
+            self.assertEqual(f.read(), self.tar)
+
+    def test_multiple_members(self):
+        # Like bgzip, `pigz --independent` or concatenated archives, with zero padding after a member
+        half = len(self.tar) // 2
+        data = gzip.compress(self.tar[:half]) + b'\0' * 16 + gzip.compress(self.tar[half:]) + gzip.compress(b'')
+        tar_path = self._unpack(self._write(data))
+
+        with open(tar_path, 'rb') as f:
+            self.assertEqual(f.read(), self.tar)
+
+        members = archive.route(tar_path, lambda filename: filename.split('/')[0])['train']
+        self.assertEqual({name: fobj.read() for name, fobj in archive.iter_members(tar_path, members)}, self.files)
+
+    def test_truncated(self):
+        path = self._write(gzip.compress(self.tar)[:-100])
+
+        with self.assertRaises(EOFError):
+            self._unpack(path)
+
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'cache')), [])
+
+    def test_cached_until_changed(self):
+        path = self._write(gzip.compress(self.tar))
+        tar_path = self._unpack(path)
+        modified = os.stat(tar_path).st_mtime_ns
+
+        self.assertEqual(self._unpack(path), tar_path)
+        self.assertEqual(os.stat(tar_path).st_mtime_ns, modified)
+
+        self._write(gzip.compress(_tar({'train/0.tif': b'changed'})))
+
+        with open(self._unpack(path), 'rb') as f:
+            self.assertEqual(f.read(), _tar({'train/0.tif': b'changed'}))
+
+    def test_uncompressed(self):
+        path = self._write(self.tar, 'data.tar')
+        self.assertEqual(self._unpack(path), path)
+
+
+class ManifestTest(unittest.TestCase):
+
+    def test_written_to_target_dir(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'data.tar')
+
+        with open(path, 'wb') as f:
+            f.write(_tar({'a/1.tif': b'1', 'b/2.tif': b'22', 'c/3.tif': b'333'}))
+
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        parse_fn = lambda name: None if name.startswith('c') else {'group': name[0]}
+        entries = archive.manifest(path, path, parse_fn, '1', cache_dir)
+
+        self.assertEqual([(entry.name, entry.size, entry.fields) for entry in entries],
+                         [('a/1.tif', 1, {'group': 'a'}), ('b/2.tif', 2, {'group': 'b'})])
+        self.assertEqual(os.listdir(cache_dir), ['data.tar.manifest.json'])
+        self.assertEqual(archive.manifest(path, path, None, '1', cache_dir), entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Apache Beam build path of the iCyt datasets.
+
+Set `ICYT_BEAM=1` (or `use_beam` of the builder config) and pass a Beam runner to `tfds build`, e.g. the local
+multi-processing DirectRunner:
+
+    ICYT_BEAM=1 tfds build --config all poldiv \
+        --beam_pipeline_options="runner=DirectRunner,direct_running_mode=multi_processing,direct_num_workers=8"
+
+The archive members are listed up front, redistributed across the workers and read by offset from the uncompressed
+archive cache, so the same pipeline runs unchanged on a cluster runner as long as the cache and the manual dir are on
+storage shared by all workers.
+"""
+
+import logging
+import os
+
+import tensorflow_datasets as tfds
+
+from icyt import archive
+from icyt import ifc
+from icyt import quarantine
+
+
+def enabled(config):
+    """Returns whether a builder config is built with Beam.
+
+    Falls back to the `ICYT_BEAM` environment variable if `use_beam` is not set.
+    """
+
+    use_beam = getattr(config, 'use_beam', None)
+
+    if use_beam is None:
+        use_beam = os.environ.get('ICYT_BEAM', '0').lower() in ('1', 'true', 'yes')
+
+    return use_beam
+
+
+def generate_examples(elements, process_fn):
+    """Returns a `beam.PTransform` that applies `process_fn` to `elements` in parallel.
+
+    Args:
+      elements: list of picklable work items, e.g. archive members.
+      process_fn: picklable callable mapping a work item to a `(key, features)` tuple, or `None` to drop it. Dropped
+        `ifc.Unknown` and `quarantine.Failed` results are counted in the `icyt` Beam metrics namespace.
+    """
+
+    beam = tfds.core.lazy_imports.apache_beam
+
+    return (
+            beam.Create(elements)
+            | beam.Reshuffle()
+            | beam.FlatMap(_process, process_fn)
+    )
+
+
+def generate_tar_examples(tar_path, members, decode_fn, keys=None):
+    """Returns a `beam.PTransform` that applies `decode_fn(filename, fobj)` to members of an uncompressed tar.
+
+    Args:
+      tar_path: `str`, path of the uncompressed tar, see `archive.unpack`.
+      members: list of `archive.Member`s, see `archive.route`.
+      decode_fn: picklable callable returning a `(key, features)` tuple, or `None` to drop the member.
+      keys: list of example keys of the members that replace the keys returned by `decode_fn`, see `sharding.order`.
+    """
+
+    keys = keys or [None] * len(members)
+    return generate_examples([(tar_path, member, key) for member, key in zip(members, keys)], _TarDecoder(decode_fn))
+
+
+class _TarDecoder:
+
+    def __init__(self, decode_fn):
+        self.decode_fn = decode_fn
+
+    def __call__(self, element):
+        tar_path, member, key = element
+        example = self.decode_fn(*archive.read_member(tar_path, member))
+
+        if key is None or example is None or isinstance(example, (ifc.Unknown, quarantine.Failed)):
+            return example
+
+        return key, example[1]
+
+
+def _process(element, process_fn):
+    example = process_fn(element)
+
+    if isinstance(example, ifc.Unknown):
+        beam = tfds.core.lazy_imports.apache_beam
+        beam.metrics.Metrics.counter('icyt', f'unknown_layout_{example.planes}_planes').inc()
+        return
+
+    if isinstance(example, quarantine.Failed):
+        beam = tfds.core.lazy_imports.apache_beam
+        beam.metrics.Metrics.counter('icyt', 'quarantined').inc()
+        logging.warning('Quarantined %s: %s', example.member, example.error)
+        return
+
+    if example is not None:
+        yield example
@@ -0,0 +1,107 @@
+"""Tests for icyt.beam, building with the Beam DirectRunner."""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from blood_quality import blood_quality
+from icyt import archive
+from icyt import beam
+from icyt import ifc
+from icyt import quarantine
+from icyt import testing
+from poldiv import poldiv
+
+
+def _decode(filename, fobj):
+    data = fobj.read()
+
+    if data == b'unknown':
+        return ifc.Unknown(filename, 5)
+
+    if data == b'broken':
+        return quarantine.Failed(filename, 'ValueError: broken', '')
+
+    return filename, {'data': data}
+
+
+class TarDecoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tar_path = os.path.join(tempfile.mkdtemp(), 'archive.tar')
+
+        with open(self.tar_path, 'wb') as f:
+            f.write(b'imageunknownbroken')
+
+        self.members = [archive.Member('a.tif', 0, 5), archive.Member('b.tif', 5, 7), archive.Member('c.tif', 12, 6)]
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.tar_path))
+
+    def test_keys(self):
+        decode = beam._TarDecoder(_decode)
+
+        self.assertEqual(decode((self.tar_path, self.members[0], None)), ('a.tif', {'data': b'image'}))
+        self.assertEqual(decode((self.tar_path, self.members[0], 7)), (7, {'data': b'image'}))
+        self.assertEqual(decode((self.tar_path, self.members[1], 8)), ifc.Unknown('b.tif', 5))
+        self.assertIsInstance(decode((self.tar_path, self.members[2], 9)), quarantine.Failed)
+
+    def test_process_drops_unknown_and_failed(self):
+        decode = beam._TarDecoder(_decode)
+        results = [list(beam._process((self.tar_path, member, None), decode)) for member in self.members]
+
+        self.assertEqual(results, [[('a.tif', {'data': b'image'})], [], []])
+
+
+@unittest.skipUnless(importlib.util.find_spec('apache_beam'), 'needs apache_beam')
+class BuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def _build(self, builder_cls, config, use_beam):
+        with mock.patch.dict(os.environ, {'ICYT_BEAM': '1' if use_beam else '0'}):
+            builder = testing.build(builder_cls, config, os.path.join(self.data_dir, 'beam' if use_beam else 'serial'))
+
+        return {example['filename']: example for example in builder.as_dataset(split='train').as_numpy_iterator()}
+
+    def _assert_same(self, examples, expected):
+        self.assertEqual(set(examples), set(expected))
+
+        for filename, example in examples.items():
+            for key, value in example.items():
+                if isinstance(value, dict):
+                    for name in value:
+                        np.testing.assert_array_equal(value[name], expected[filename][key][name])
+                else:
+                    np.testing.assert_array_equal(value, expected[filename][key])
+
+    def test_poldiv(self):
+        for config in ['all', 'all-by-species']:
+            with self.subTest(config=config):
+                with mock.patch.object(beam, '_TarDecoder', wraps=beam._TarDecoder) as decoder:
+                    examples = self._build(poldiv.Poldiv, config, use_beam=True)
+
+                decoder.assert_called_once()
+                self.assertEqual(len(examples), 6)
+                self._assert_same(examples, self._build(poldiv.Poldiv, config, use_beam=False))
+
+    def test_blood_quality(self):
+        with mock.patch.object(beam, 'generate_examples', wraps=beam.generate_examples) as generate:
+            examples = self._build(blood_quality.BloodQuality, 'canadian', use_beam=True)
+
+        generate.assert_called()
+        self.assertEqual(len(examples), 2)
+        self._assert_same(examples, self._build(blood_quality.BloodQuality, 'canadian', use_beam=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Size-bucketed output of the iCyt datasets.
+
+The frames of the IFC datasets vary in height and width, and padding them to the largest image of a batch wastes much
+of the compute and memory bandwidth. Builder configs with `shard_by='size'` read the frame size of every member from
+its TIFF header before the build, choose bucket boundaries of the longer image side at quantiles of its histogram and
+write the examples grouped by bucket, like the class-sharded configs. The boundaries are stored in the metadata under
+`boundaries`, the number of examples and the record range of every bucket under `buckets`:
+
+    builder = tfds.builder('poldiv/all-by-size')
+    builder.info.metadata['boundaries']  # e.g. [44, 52, 58, 64, 70, 78, 90]
+    builder.info.metadata['buckets']['train']['52-57']  # {'count': ..., 'start': ..., 'end': ...}
+
+`loader.load(..., buckets=True)` batches the examples of each bucket together with the stored boundaries, or with
+boundaries computed from the index for the other configs.
+"""
+
+import logging
+
+import numpy as np
+import tifffile as tiff
+
+from icyt import archive
+from icyt import index
+from icyt import sharding
+
+NUM_BUCKETS = 8
+
+
+def sides(tar_path, members, skip_failed=False):
+    """Returns a `dict` of member name to the longer side of its frame, read from the TIFF header without decoding.
+
+    Only the header and the image file directories of the members are read from the uncompressed archive, not their
+    pixels.
+
+    Args:
+      tar_path: `str`, path of the uncompressed archive.
+      members: list of `archive.Member`s.
+      skip_failed: `bool`, whether to leave out members whose header fails to read instead of raising, for builds
+        that quarantine them when they are decoded.
+    """
+
+    result = {}
+    failed = 0
+
+    with open(tar_path, 'rb') as fobj:
+        for member in members:
+            try:
+                with tiff.TiffFile(fobj, name=member.name, offset=member.offset, size=member.size) as f:
+                    result[member.name] = int(max(f.series[0].shape[:2]))
+            except Exception:
+                if not skip_failed:
+                    raise
+
+                failed += 1
+
+    if failed:
+        logging.warning('Failed to read the frame size of %d members, they are put in the first bucket', failed)
+
+    return result
+
+
+def boundaries(sides, num_buckets=NUM_BUCKETS):
+    """Returns bucket boundaries at quantiles of the longer image sides, so that the buckets are about equally full.
+
+    Bucket `i` holds the sides from `boundaries[i - 1]` up to `boundaries[i]` exclusive, like the buckets of
+    `tf.data.Dataset.bucket_by_sequence_length`.
+
+    Args:
+      sides: array of `int`, longer image sides.
+      num_buckets: `int`, maximum number of buckets, fewer if sides repeat.
+
+    Returns:
+      Sorted list of `int`.
+    """
+
+    sides = np.sort(np.asarray(sides))
+
+    if len(sides) == 0:
+        return []
+
+    quantiles = sides[np.arange(1, num_buckets) * len(sides) // num_buckets]
+    return sorted({int(side) for side in quantiles if side > sides[0]})
+
+
+def assign(sides, boundaries):
+    """Returns the bucket numbers of longer image sides."""
+
+    return np.searchsorted(boundaries, sides, side='right')
+
+
+def names(boundaries):
+    """Returns the names of the buckets, the range of their longer sides, e.g. `'52-57'` and `'90+'` for the last."""
+
+    lows = [0] + list(boundaries)
+    highs = list(boundaries) + [None]
+    return [f'{low}-{high - 1}' if high is not None else f'{low}+' for low, high in zip(lows, highs)]
+
+
+def order(members, sides, boundaries):
+    """Orders archive members by bucket like `sharding.order`, returns the ordered members and their example keys.
+
+    Members without a side, whose header failed to read, are put in the first bucket.
+    """
+
+    bucket_names = names(boundaries)
+    return sharding.order(members, lambda name: bucket_names[assign(sides.get(name, 0), boundaries)], bucket_names)
+
+
+def bucket_counts(columns, boundaries):
+    """Returns the number of examples and the record range of every bucket in the index columns of a split."""
+
+    buckets = assign(np.maximum(columns['height'], columns['width']), boundaries)
+    return sharding.class_counts({'bucket': buckets, 'position': columns['position']}, 'bucket', names(boundaries))
+
+
+def load_boundaries(builder, split='train', num_buckets=NUM_BUCKETS):
+    """Returns the stored bucket boundaries of a size-sharded dataset, or boundaries computed from the index.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder` of a built dataset.
+      split: `str`, name of the split whose image sizes determine the boundaries if none are stored.
+      num_buckets: `int`, maximum number of buckets if the boundaries are computed.
+    """
+
+    if 'boundaries' in builder.info.metadata:
+        return list(builder.info.metadata['boundaries'])
+
+    ix = index.load(builder, split)
+    return boundaries(np.maximum(ix['height'], ix['width']), num_buckets)
@@ -0,0 +1,142 @@
+"""Tests for icyt.bucketing."""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+import tifffile as tiff
+
+from benchmarks import synthetic
+from icyt import archive
+from icyt import bucketing
+from icyt import ifc
+from icyt import index
+from icyt import quarantine
+from icyt import testing
+from poldiv import poldiv
+
+
+def _tiff(seed, height, width):
+    buffer = io.BytesIO()
+    tiff.imwrite(buffer, synthetic.ifc_image(np.random.default_rng(seed), 18, height, width,
+                                             masks=ifc.POLDIV_LAYOUTS[18].masks))
+    return buffer.getvalue()
+
+
+class BoundariesTest(unittest.TestCase):
+
+    def test_equally_full(self):
+        sides = np.random.default_rng(0).integers(20, 120, size=8000)
+        boundaries = bucketing.boundaries(sides)
+        counts = np.bincount(bucketing.assign(sides, boundaries))
+
+        self.assertEqual(len(boundaries), bucketing.NUM_BUCKETS - 1)
+        self.assertEqual(boundaries, sorted(boundaries))
+        np.testing.assert_allclose(counts, len(sides) / bucketing.NUM_BUCKETS, rtol=0.1)
+
+    def test_repeated_sides(self):
+        self.assertEqual(bucketing.boundaries([50] * 80 + [60] * 20), [60])
+        self.assertEqual(bucketing.boundaries([50] * 10), [])
+        self.assertEqual(bucketing.boundaries([]), [])
+
+    def test_assign(self):
+        # Like `tf.data.Dataset.bucket_by_sequence_length`, a side equal to a boundary starts the next bucket
+        np.testing.assert_array_equal(bucketing.assign([1, 43, 44, 51, 52, 90, 500], [44, 52, 90]),
+                                      [0, 0, 1, 1, 2, 3, 3])
+
+    def test_names(self):
+        self.assertEqual(bucketing.names([44, 52, 90]), ['0-43', '44-51', '52-89', '90+'])
+        self.assertEqual(bucketing.names([]), ['0+'])
+
+
+class OrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sides = {'a': 60, 'b': 40, 'c': 52, 'd': 41, 'e': 90}
+        self.members = [archive.Member(name, 0, 0) for name in self.sides]
+
+    def test_order(self):
+        members, keys = bucketing.order(self.members, self.sides, [52, 90])
+
+        self.assertEqual([member.name for member in members], ['b', 'd', 'a', 'c', 'e'])
+        self.assertEqual(keys, list(range(5)))
+
+    def test_bucket_counts(self):
+        columns = {'height': np.array([40, 20, 52, 60, 90]), 'width': np.array([10, 41, 60, 10, 10]),
+                   'position': np.arange(5)}
+
+        self.assertEqual(bucketing.bucket_counts(columns, [52, 90]), {
+            '0-51': {'count': 2, 'start': 0, 'end': 2},
+            '52-89': {'count': 2, 'start': 2, 'end': 4},
+            '90+': {'count': 1, 'start': 4, 'end': 5},
+        })
+
+    def test_stored_boundaries(self):
+        builder = types.SimpleNamespace(info=types.SimpleNamespace(metadata={'boundaries': [52, 90]}))
+        self.assertEqual(bucketing.load_boundaries(builder), [52, 90])
+
+
+class SidesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tar_path = os.path.join(self.tmp_dir, 'archive.tar')
+
+        with tarfile.open(self.tar_path, 'w') as tar:
+            for name, data in [('a.tif', _tiff(0, 40, 50)), ('b.tif', b'not a tiff'), ('c.tif', _tiff(1, 70, 30))]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+        self.members = archive.route(self.tar_path, lambda name: 'train')['train']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sides(self):
+        self.assertEqual(bucketing.sides(self.tar_path, [self.members[0], self.members[2]]), {'a.tif': 50, 'c.tif': 70})
+
+    def test_failed(self):
+        with self.assertRaises(tiff.TiffFileError):
+            bucketing.sides(self.tar_path, self.members)
+
+        with self.assertLogs(level='WARNING'):
+            sides = bucketing.sides(self.tar_path, self.members, skip_failed=True)
+
+        self.assertEqual(sides, {'a.tif': 50, 'c.tif': 70})
+
+        members, _ = bucketing.order(self.members, sides, [60])
+        self.assertEqual([member.name for member in members], ['a.tif', 'b.tif', 'c.tif'])
+
+
+class QuarantineBuildTest(unittest.TestCase):
+
+    def test_corrupt_member(self):
+        data_dir = tempfile.mkdtemp()
+        manual_dir = tempfile.mkdtemp()
+        testing.add_members(poldiv.Poldiv, 'poldiv-dataset-3.0.0.tar.gz',
+                            [('2021/carpinus.betulus_000099.tif', _tiff(0, 40, 50)[:64])], manual_dir)
+
+        try:
+            with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '1'}):
+                builder = testing.build(poldiv.Poldiv, 'all-by-size', data_dir, manual_dir=manual_dir)
+
+            records = quarantine.load(builder, 'train')
+
+            self.assertEqual(len(index.load(builder, 'train')['filename']), 6)
+            self.assertEqual(sum(bucket['count'] for bucket in builder.info.metadata['buckets']['train'].values()), 6)
+            self.assertEqual([record['member'] for record in records], ['2021/carpinus.betulus_000099.tif'])
+            self.assertTrue(records[0]['error'].startswith('TiffFileError'))
+        finally:
+            shutil.rmtree(data_dir)
+            shutil.rmtree(manual_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
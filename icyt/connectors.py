@@ -0,0 +1,291 @@
+"""Feature connectors for the multichannel images of the iCyt datasets."""
+
+import collections
+import importlib
+import zlib
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+# 'channels' stores every channel as a separate 2D tensor, 'stacked' stores all channels in one (H, W, C) tensor
+LAYOUTS = ['channels', 'stacked']
+
+# 'none' and 'zlib' are decoded by native TensorFlow ops, 'zstd' and 'lz4' need the `zstandard` and `lz4` packages
+CODECS = ['none', 'zlib', 'zstd', 'lz4']
+
+# 'tensor' stores masks like the channels, 'bits' stores binary masks as 1-bit bitmaps that are read as uint8 0/1
+MASK_CODECS = ['tensor', 'bits']
+
+_ZSTD_LEVEL = 3
+
+# Values of the bits of a packed byte, most significant first as written by `np.packbits`
+_BIT_SHIFTS = [7, 6, 5, 4, 3, 2, 1, 0]
+
+# Tensor payload that was encoded ahead of time, e.g. read from the decode cache, and is written as it is
+Encoded = collections.namedtuple('Encoded', ['payload'])
+
+
+def validate(layout='channels', codec='zlib', mask_codec='tensor', size=None, crop_margin=None):
+    """Raises a `ValueError` if the image options of a builder config are invalid.
+
+    Args:
+      layout: `str`, one of `LAYOUTS`.
+      codec: `str`, one of `CODECS`.
+      mask_codec: `str`, one of `MASK_CODECS`.
+      size: `int`, static height and width of the images, `None` for varying sizes.
+      crop_margin: `int`, margin of the crop to the masks, `None` for the full frame. Excludes `size`.
+    """
+
+    if layout not in LAYOUTS:
+        raise ValueError('Layout must be one of %s' % LAYOUTS)
+
+    if codec not in CODECS:
+        raise ValueError('Codec must be one of %s' % CODECS)
+
+    if mask_codec not in MASK_CODECS:
+        raise ValueError('Mask codec must be one of %s' % MASK_CODECS)
+
+    if size is not None and crop_margin is not None:
+        raise ValueError('Only one of size and crop_margin can be set')
+
+
+def image(channels, dtype, layout='channels', codec='zlib', size=None):
+    """Returns the feature of a multichannel image.
+
+    Args:
+      channels: list of `str`, channel names in stacking order.
+      dtype: dtype of the pixels.
+      layout: `str`, one of `LAYOUTS`.
+      codec: `str`, one of `CODECS`.
+      size: `int`, static height and width of the images, `None` for varying sizes.
+    """
+
+    if layout == 'channels':
+        return {channel: tensor((size, size), dtype, codec) for channel in channels}
+
+    if layout == 'stacked':
+        return tensor((size, size, len(channels)), dtype, codec)
+
+    raise ValueError(f'Layout must be one of {LAYOUTS}')
+
+
+def mask(channels, layout='channels', codec='zlib', size=None, mask_codec='tensor'):
+    """Returns the feature of the masks of a multichannel image.
+
+    Args:
+      channels: list of `str`, channel names in stacking order.
+      layout: `str`, one of `LAYOUTS`.
+      codec: `str`, one of `CODECS`, compression of uint16 masks if `mask_codec` is `'tensor'`.
+      size: `int`, static height and width of the masks, `None` for varying sizes.
+      mask_codec: `str`, one of `MASK_CODECS`.
+    """
+
+    if mask_codec == 'tensor':
+        return image(channels, tf.uint16, layout, codec, size)
+
+    if mask_codec != 'bits':
+        raise ValueError(f'Mask codec must be one of {MASK_CODECS}')
+
+    if layout == 'channels':
+        return {channel: BitMask(shape=(size, size)) for channel in channels}
+
+    if layout == 'stacked':
+        return BitMask(shape=(size, size, len(channels)))
+
+    raise ValueError(f'Layout must be one of {LAYOUTS}')
+
+
+def layout_image(images, channels, layout='channels'):
+    """Lays out a `dict` of 2D channel images as expected by the feature returned by `image`."""
+
+    if layout == 'channels':
+        return images
+
+    if layout == 'stacked':
+        return np.stack([images[channel] for channel in channels], axis=-1)
+
+    raise ValueError(f'Layout must be one of {LAYOUTS}')
+
+
+def tensor(shape, dtype, codec='zlib'):
+    """Returns a tensor feature compressed with `codec`, one of `CODECS`."""
+
+    if codec == 'none':
+        return Tensor(dtype=dtype, shape=shape, encoding='bytes')
+
+    if codec == 'zlib':
+        return Tensor(dtype=dtype, shape=shape, encoding='zlib')
+
+    if codec in ('zstd', 'lz4'):
+        return CompressedTensor(shape=shape, dtype=dtype, codec=codec)
+
+    raise ValueError(f'Codec must be one of {CODECS}')
+
+
+def encode(feature, value):
+    """Encodes an image of a feature returned by `image` ahead of time.
+
+    Returns:
+      `value` with every tensor replaced by an `Encoded` payload, which the feature writes without encoding it again.
+    """
+
+    if isinstance(feature, tfds.features.FeaturesDict):
+        return {key: encode(feature[key], value[key]) for key in feature.keys()}
+
+    return Encoded(feature.encode_example(value))
+
+
+class Tensor(tfds.features.Tensor):
+    """`tfds.features.Tensor` that writes `Encoded` payloads as they are."""
+
+    def encode_example(self, example_data):
+        if isinstance(example_data, Encoded):
+            return example_data.payload
+
+        return super(Tensor, self).encode_example(example_data)
+
+
+class CompressedTensor(tfds.features.FeatureConnector):
+    """Tensor compressed with a codec that TensorFlow has no native op for.
+
+    The raw bytes are compressed in Python when building and decompressed with `tf.numpy_function` when reading. The
+    shape is stored next to the data, so dimensions may be `None`.
+    """
+
+    def __init__(self, *, shape, dtype, codec):
+        super(CompressedTensor, self).__init__()
+
+        if codec not in ('zstd', 'lz4'):
+            raise ValueError(f'Codec must be one of zstd, lz4, got {codec}')
+
+        self._shape = tuple(shape)
+        self._dtype = tf.dtypes.as_dtype(dtype)
+        self._codec = codec
+
+    def get_tensor_info(self):
+        return tfds.features.TensorInfo(shape=self._shape, dtype=self._dtype)
+
+    def get_serialized_info(self):
+        return {
+            'data': tfds.features.TensorInfo(shape=(), dtype=tf.string),
+            'shape': tfds.features.TensorInfo(shape=(len(self._shape),), dtype=tf.int64),
+        }
+
+    def encode_example(self, example_data):
+        if isinstance(example_data, Encoded):
+            return example_data.payload
+
+        array = np.ascontiguousarray(example_data, dtype=self._dtype.as_numpy_dtype)
+
+        if array.ndim != len(self._shape) or any(s is not None and s != a for s, a in zip(self._shape, array.shape)):
+            raise ValueError(f'Shape {array.shape} does not match {self._shape}')
+
+        return {
+            'data': compress(self._codec, array.tobytes()),
+            'shape': np.array(array.shape, dtype=np.int64),
+        }
+
+    def decode_example(self, tfexample_data):
+        codec = self._codec
+        dtype = self._dtype.as_numpy_dtype
+
+        def _decode(data, shape):
+            return np.frombuffer(decompress(codec, data), dtype=dtype).reshape(shape)
+
+        decoded = tf.numpy_function(_decode, [tfexample_data['data'], tfexample_data['shape']], self._dtype)
+        decoded.set_shape(self._shape)
+        return decoded
+
+    @classmethod
+    def from_json_content(cls, value):
+        return cls(shape=value['shape'], dtype=value['dtype'], codec=value['codec'])
+
+    def to_json_content(self):
+        return {'shape': list(self._shape), 'dtype': self._dtype.name, 'codec': self._codec}
+
+
+class BitMask(tfds.features.FeatureConnector):
+    """Binary mask stored as a zlib-compressed 1-bit bitmap.
+
+    Masks are packed with `np.packbits` when building and unpacked with native TensorFlow ops into uint8 0/1 tensors
+    when reading. Masks with values other than 0 and 1 fail the build. The shape is stored next to the data, so
+    dimensions may be `None`.
+    """
+
+    def __init__(self, *, shape):
+        super(BitMask, self).__init__()
+        self._shape = tuple(shape)
+
+    def get_tensor_info(self):
+        return tfds.features.TensorInfo(shape=self._shape, dtype=tf.uint8)
+
+    def get_serialized_info(self):
+        return {
+            'data': tfds.features.TensorInfo(shape=(), dtype=tf.string),
+            'shape': tfds.features.TensorInfo(shape=(len(self._shape),), dtype=tf.int64),
+        }
+
+    def encode_example(self, example_data):
+        if isinstance(example_data, Encoded):
+            return example_data.payload
+
+        array = np.asarray(example_data)
+
+        if array.ndim != len(self._shape) or any(s is not None and s != a for s, a in zip(self._shape, array.shape)):
+            raise ValueError(f'Shape {array.shape} does not match {self._shape}')
+
+        if np.any((array != 0) & (array != 1)):
+            raise ValueError(f'Mask is not binary, it has the values {np.unique(array)[:10].tolist()}')
+
+        return {
+            'data': zlib.compress(np.packbits(array.astype(bool), axis=None).tobytes()),
+            'shape': np.array(array.shape, dtype=np.int64),
+        }
+
+    def decode_example(self, tfexample_data):
+        shape = tfexample_data['shape']
+        packed = tf.io.decode_raw(tf.io.decode_compressed(tfexample_data['data'], compression_type='ZLIB'), tf.uint8)
+        bits = tf.bitwise.bitwise_and(tf.bitwise.right_shift(packed[:, None], tf.constant(_BIT_SHIFTS, tf.uint8)), 1)
+        decoded = tf.reshape(tf.reshape(bits, [-1])[:tf.reduce_prod(shape)], shape)
+        decoded.set_shape(self._shape)
+        return decoded
+
+    @classmethod
+    def from_json_content(cls, value):
+        return cls(shape=value['shape'])
+
+    def to_json_content(self):
+        return {'shape': list(self._shape)}
+
+
+def compress(codec, data):
+    """Compresses `bytes` with `codec`, one of `zstd`, `lz4`."""
+
+    if codec == 'zstd':
+        return _import('zstandard').ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+
+    if codec == 'lz4':
+        return _import('lz4.frame').compress(data)
+
+    raise ValueError(f'Codec must be one of zstd, lz4, got {codec}')
+
+
+def decompress(codec, data):
+    """Decompresses `bytes` compressed with `compress`."""
+
+    if codec == 'zstd':
+        return _import('zstandard').ZstdDecompressor().decompress(data)
+
+    if codec == 'lz4':
+        return _import('lz4.frame').decompress(data)
+
+    raise ValueError(f'Codec must be one of zstd, lz4, got {codec}')
+
+
+def _import(module):
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        package = module.split('.')[0]
+        raise ImportError(f'The codec needs the `{package}` package, install it with `pip install {package}`') from e
@@ -0,0 +1,71 @@
+"""Tests for icyt.connectors."""
+
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from icyt import connectors
+
+
+def _round_trip(feature, array):
+    encoded = feature.encode_example(array)
+    return feature.decode_example({key: tf.constant(value) for key, value in encoded.items()}).numpy()
+
+
+class BitMaskTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+
+        # Sizes that are not multiples of 8 leave padding bits in the last byte
+        for shape in [(13, 7), (1, 1), (16, 8), (5, 9, 7)]:
+            mask = rng.integers(0, 2, size=shape, dtype=np.uint16)
+            decoded = _round_trip(connectors.BitMask(shape=(None,) * len(shape)), mask)
+
+            self.assertEqual(decoded.dtype, np.uint8)
+            np.testing.assert_array_equal(decoded, mask)
+
+    def test_static_shape(self):
+        mask = np.eye(64, dtype=np.uint16)
+        np.testing.assert_array_equal(_round_trip(connectors.BitMask(shape=(64, 64)), mask), mask)
+
+    def test_encoded(self):
+        feature = connectors.BitMask(shape=(None, None))
+        mask = np.ones((3, 5), dtype=np.uint16)
+        encoded = connectors.encode(feature, mask)
+
+        self.assertIsInstance(encoded, connectors.Encoded)
+        self.assertIs(feature.encode_example(encoded), encoded.payload)
+
+    def test_not_binary(self):
+        with self.assertRaisesRegex(ValueError, 'not binary'):
+            connectors.BitMask(shape=(None, None)).encode_example(np.array([[0, 1], [2, 65535]], dtype=np.uint16))
+
+    def test_shape_mismatch(self):
+        with self.assertRaisesRegex(ValueError, 'does not match'):
+            connectors.BitMask(shape=(4, 4)).encode_example(np.zeros((4, 5), dtype=np.uint16))
+
+    def test_mask_feature(self):
+        self.assertIsInstance(connectors.mask(['1', '2'], 'stacked', mask_codec='bits'), connectors.BitMask)
+        self.assertEqual(set(connectors.mask(['1', '2'], mask_codec='bits')), {'1', '2'})
+
+        with self.assertRaises(ValueError):
+            connectors.mask(['1'], mask_codec='png')
+
+
+class ValidateTest(unittest.TestCase):
+
+    def test_valid(self):
+        connectors.validate()
+        connectors.validate('stacked', 'lz4', 'bits', size=64)
+        connectors.validate(crop_margin=4)
+
+    def test_invalid(self):
+        for options in [{'layout': 'planar'}, {'codec': 'gzip'}, {'mask_codec': 'rle'}, {'size': 64, 'crop_margin': 4}]:
+            with self.assertRaises(ValueError):
+                connectors.validate(**options)
+
+
+if __name__ == '__main__':
+    unittest.main()
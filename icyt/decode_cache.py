@@ -0,0 +1,228 @@
+"""Decode cache of the iCyt datasets.
+
+Set `ICYT_DECODE_CACHE=1` (or `decode_cache` of the builder config) to keep the encoded images of every decoded member
+in a store in the build cache, keyed by a hash of the member name and content. When a dataset is rebuilt, e.g. after
+its archive was replaced by one with additional measurements, only new or changed members are decoded and encoded
+again, all others are read from the store. This is not a delta build: every build still reads the whole archive of the
+config and writes all shards of the dataset version.
+
+The store is specific to a builder and to the options that change the images (layout, codecs, size, crop margin), so
+configs that only select other members share it, e.g. all romania configs. It is capped at `ICYT_STORE_MAX_GB`
+(default 50) gigabytes: when a build starts and whenever its writes push the store over the cap, the least recently
+used examples are evicted until the store fits. Delete `~/tensorflow_datasets/downloads/icyt/examples/` after changing
+how members are decoded.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+
+from icyt import archive
+from icyt import connectors
+from icyt import ifc
+from icyt import instrument
+
+# Builder config options that change the encoded images
+_SPEC_ATTRIBUTES = ['layout', 'codec', 'mask_codec', 'size', 'crop_margin']
+
+_DEFAULT_MAX_GB = 50
+
+# Share of the size limit that eviction frees the store down to, so that it is not scanned after every write
+_LOW_WATER = 0.9
+
+# Features that are encoded ahead of time and stored, all other features are stored as decoded
+_IMAGE_FEATURES = ['channels', 'masks']
+
+
+def enabled(config):
+    """Returns whether a builder config caches decoded members.
+
+    Falls back to the `ICYT_DECODE_CACHE` environment variable if `decode_cache` is not set.
+    """
+
+    decode_cache = getattr(config, 'decode_cache', None)
+
+    if decode_cache is None:
+        decode_cache = os.environ.get('ICYT_DECODE_CACHE', '0').lower() in ('1', 'true', 'yes')
+
+    return decode_cache
+
+
+def decoder(builder, dl_manager, decode_fn):
+    """Returns `decode_fn` backed by the example store of a builder if its config caches decoded members.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder`.
+      dl_manager: the `tfds.download.DownloadManager` of the build.
+      decode_fn: picklable callable mapping `(filename, fobj)` to a `(key, features)` tuple, `None` or `ifc.Unknown`.
+    """
+
+    if not enabled(builder.builder_config):
+        return decode_fn
+
+    features = {name: builder.info.features[name] for name in _IMAGE_FEATURES
+                if name in builder.info.features.keys()}
+    spec = {
+        'builder': builder.name,
+        'config': {attribute: getattr(builder.builder_config, attribute, None) for attribute in _SPEC_ATTRIBUTES},
+        'features': {name: feature.to_json() for name, feature in features.items()},
+    }
+    spec_hash = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+    store_dir = os.path.join(archive.cache_dir(dl_manager), 'examples')
+    limit = max_bytes()
+    size = evict(store_dir, limit)
+
+    return StoredDecoder(decode_fn, features, os.path.join(store_dir, builder.name, spec_hash), store_dir, limit, size)
+
+
+def max_bytes():
+    """Returns the size limit of the example store from the `ICYT_STORE_MAX_GB` environment variable."""
+
+    max_gb = float(os.environ.get('ICYT_STORE_MAX_GB', _DEFAULT_MAX_GB))
+
+    if max_gb < 0:
+        raise ValueError(f'Size limit of the example store must not be negative, got {max_gb}')
+
+    return int(max_gb * 1024 ** 3)
+
+
+def evict(store_dir, limit):
+    """Deletes the least recently used examples of a store until it takes at most `limit` bytes.
+
+    Reading an example marks it as used by updating its modification time. Examples that are still being written are
+    left alone.
+
+    Returns:
+      Size of the store in bytes after eviction.
+    """
+
+    entries = []
+
+    for root, _, filenames in os.walk(store_dir):
+        for filename in filenames:
+            if not filename.endswith('.pkl'):
+                continue
+
+            path = os.path.join(root, filename)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+    size = sum(entry_size for _, entry_size, _ in entries)
+    evicted = 0
+
+    for _, entry_size, path in sorted(entries):
+        if size <= limit:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        size -= entry_size
+        evicted += 1
+
+    if evicted:
+        logging.info('Evicted %d examples from %s, %d bytes left', evicted, store_dir, size)
+
+    return size
+
+
+class StoredDecoder:
+    """Decoder that looks members up in an example store before decoding them.
+
+    Picklable, so it can be used with `parallel.imap` and Beam. Examples of new members are stored as soon as they are
+    decoded, so an interrupted build keeps its progress and a rerun only decodes the members that were not stored yet.
+    Entries that are truncated or corrupt are decoded again.
+
+    If a `limit` is given, the decoder adds the size of every stored example to the size of the store and evicts the
+    least recently used examples of `store_dir` once it exceeds the limit. Every process counts only its own writes
+    since its last eviction, so with several workers the store may exceed the limit by up to a tenth of it per worker.
+    """
+
+    def __init__(self, decode_fn, features, directory, store_dir=None, limit=None, size=0):
+        """Constructs a StoredDecoder.
+
+        Args:
+          decode_fn: picklable callable mapping `(filename, fobj)` to a `(key, features)` tuple, `None` or
+            `ifc.Unknown`.
+          features: `dict` of the names of the features to encode ahead of time to their feature connectors.
+          directory: `str`, directory of the examples.
+          store_dir: `str`, directory of the whole store to evict from, e.g. the parent of the directories of all
+            builders. Defaults to `directory`.
+          limit: `int`, size limit of the store in bytes, `None` never evicts.
+          size: `int`, size of the store in bytes when the decoder is constructed.
+        """
+
+        self.decode_fn = decode_fn
+        self.features = features
+        self.directory = directory
+        self.store_dir = store_dir or directory
+        self.limit = limit
+        self.size = size
+
+    def __call__(self, filename, fobj):
+        data = fobj.read()
+        path = self._path(filename, data)
+
+        try:
+            with instrument.stage('store'):
+                with open(path, 'rb') as f:
+                    example = pickle.load(f)
+
+                os.utime(path)
+
+            return example
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Truncated, e.g. when the machine went down, or otherwise corrupt
+            logging.warning('Decoding %s again, its stored example %s is unreadable: %r', filename, path, e)
+
+        example = self.decode_fn(filename, io.BytesIO(data))
+
+        if example is None or isinstance(example, ifc.Unknown):
+            return example
+
+        key, features = example
+        features = dict(features)
+
+        with instrument.stage('encode'):
+            for name, feature in self.features.items():
+                features[name] = connectors.encode(feature, features[name])
+
+        with instrument.stage('store'):
+            self.size += _write(path, (key, features))
+
+            if self.limit is not None and self.size > self.limit:
+                self.size = evict(self.store_dir, int(self.limit * _LOW_WATER))
+
+        return key, features
+
+    def _path(self, filename, data):
+        digest = hashlib.sha256(filename.encode() + b'\0')
+        digest.update(data)
+        key = digest.hexdigest()
+        return os.path.join(self.directory, key[:2], f'{key}.pkl')
+
+
+def _write(path, example):
+    """Stores an example and returns its size in bytes."""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(example, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = f.tell()
+
+    os.replace(tmp_path, path)
+    return size
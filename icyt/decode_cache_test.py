@@ -0,0 +1,147 @@
+"""Tests for icyt.decode_cache."""
+
+import glob
+import io
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from icyt import connectors
+from icyt import decode_cache
+
+
+class StoredDecoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.decoded = []
+        self.feature = connectors.tensor((None, None), tf.uint16)
+        self.decoder = decode_cache.StoredDecoder(self._decode, {'channels': self.feature}, self.tmp_dir)
+
+    def _decode(self, filename, fobj):
+        self.decoded.append(filename)
+        data = fobj.read()
+        return filename, {'channels': np.frombuffer(data, dtype=np.uint16).reshape(2, -1), 'filename': filename}
+
+    def _call(self, filename, data):
+        return self.decoder(filename, io.BytesIO(data))
+
+    def _entries(self):
+        return glob.glob(os.path.join(self.tmp_dir, '*', '*.pkl'))
+
+    def test_hit(self):
+        data = np.arange(8, dtype=np.uint16).tobytes()
+        key, features = self._call('a.tif', data)
+
+        self.assertEqual(self._call('a.tif', data), (key, features))
+        self.assertEqual(self.decoded, ['a.tif'])
+        self.assertIsInstance(features['channels'], connectors.Encoded)
+        self.assertEqual(features['channels'].payload,
+                         self.feature.encode_example(np.arange(8, dtype=np.uint16).reshape(2, -1)))
+
+    def test_miss(self):
+        data = np.arange(8, dtype=np.uint16).tobytes()
+        self._call('a.tif', data)
+        self._call('a.tif', data[::-1])
+        self._call('b.tif', data)
+
+        self.assertEqual(self.decoded, ['a.tif', 'a.tif', 'b.tif'])
+        self.assertEqual(len(self._entries()), 3)
+
+    def test_truncated_or_corrupt(self):
+        data = np.arange(8, dtype=np.uint16).tobytes()
+        expected = self._call('a.tif', data)
+        path, = self._entries()
+
+        with open(path, 'rb') as f:
+            stored = f.read()
+
+        for broken in [stored[:len(stored) // 2], b'', b'not a pickle']:
+            with open(path, 'wb') as f:
+                f.write(broken)
+
+            with self.assertLogs(level='WARNING'):
+                self.assertEqual(self._call('a.tif', data), expected)
+
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), stored)
+
+        self.assertEqual(len(self.decoded), 4)
+
+    def test_not_stored(self):
+        decoder = decode_cache.StoredDecoder(lambda filename, fobj: None, {}, self.tmp_dir)
+
+        self.assertIsNone(decoder('a.tif', io.BytesIO(b'data')))
+        self.assertEqual(self._entries(), [])
+
+
+def _slow_decode(filename, fobj):
+    # Examples stored in quick succession could otherwise share a coarse modification time
+    time.sleep(0.005)
+    return filename, {'data': fobj.read()}
+
+
+class EvictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def _store(self, name, size, used):
+        path = os.path.join(self.tmp_dir, name[:2], name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+        os.utime(path, ns=(used, used))
+        return path
+
+    def _names(self):
+        return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self.tmp_dir, '*', '*')))
+
+    def test_least_recently_used_first(self):
+        for i, used in enumerate([3, 1, 4, 2]):
+            self._store(f'{i:02d}.pkl', 100, used * 10 ** 9)
+
+        self.assertEqual(decode_cache.evict(self.tmp_dir, 250), 200)
+        self.assertEqual(self._names(), ['00.pkl', '02.pkl'])
+
+    def test_within_limit(self):
+        self._store('00.pkl', 100, 10 ** 9)
+
+        self.assertEqual(decode_cache.evict(self.tmp_dir, 100), 100)
+        self.assertEqual(self._names(), ['00.pkl'])
+
+    def test_keeps_partial_writes(self):
+        self._store('00.pkl', 100, 10 ** 9)
+        self._store('01.pkl.123.tmp', 100, 0)
+
+        self.assertEqual(decode_cache.evict(self.tmp_dir, 0), 0)
+        self.assertEqual(self._names(), ['01.pkl.123.tmp'])
+
+    def test_capped_during_build(self):
+        limit = 4096
+        decoder = decode_cache.StoredDecoder(_slow_decode, {}, os.path.join(self.tmp_dir, 'builder'), self.tmp_dir, limit)
+        paths = []
+
+        for i in range(50):
+            data = os.urandom(500)
+            decoder(f'{i}.tif', io.BytesIO(data))
+            paths.append(decoder._path(f'{i}.tif', data))
+            sizes = [os.path.getsize(path) for path in glob.glob(os.path.join(self.tmp_dir, '*', '*', '*.pkl'))]
+
+            self.assertLessEqual(sum(sizes), limit)
+            self.assertEqual(decoder.size, sum(sizes))
+
+        # The most recently stored examples are kept, the oldest ones were evicted
+        kept = [os.path.exists(path) for path in paths]
+        self.assertFalse(kept[0])
+        self.assertEqual(kept, sorted(kept))
+        self.assertTrue(kept[-1])
+
+if __name__ == '__main__':
+    unittest.main()
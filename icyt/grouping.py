@@ -0,0 +1,81 @@
+"""Grouped output of the builder configs with `shard_by` set.
+
+The configs write the examples of a split grouped by a class label with `icyt.sharding` or by image size bucket with
+`icyt.bucketing`. The builders validate the option with `validate`, order the archive members with `order` before the
+build and store the number of examples and the record range of every group with `write_counts` after it.
+"""
+
+from icyt import bucketing
+from icyt import quarantine
+from icyt import sharding
+
+
+def validate(shard_by, options, size=None, crop_margin=None):
+    """Raises a `ValueError` if the `shard_by` option of a builder config is invalid.
+
+    Args:
+      shard_by: `str`, the option, `None` for shuffled output.
+      options: list of `str`, the options of the builder, class labels or `'size'`.
+      size: `int`, the `size` option of the config.
+      crop_margin: `int`, the `crop_margin` option of the config.
+    """
+
+    if shard_by is not None and shard_by not in options:
+        raise ValueError('Shard by must be one of %s' % options)
+
+    if shard_by == 'size' and (size is not None or crop_margin is not None):
+        raise ValueError('Sharding by size needs the full frames, size and crop_margin must not be set')
+
+
+def order(builder, tar_path, members, label_fn, preparation):
+    """Orders the archive members of a split by the `shard_by` group of the builder config.
+
+    The bucket boundaries of size-sharded configs are stored in the metadata under `boundaries`. Members whose size
+    fails to read are put in the first bucket if the config quarantines members, so that they are recorded when they
+    fail to decode.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder`, called in its `_split_generators`.
+      tar_path: `str`, path of the uncompressed archive.
+      members: list of `archive.Member`s of the split.
+      label_fn: callable mapping a member name to its class name for class-sharded configs.
+      preparation: `instrument.Preparation` that times reading the image sizes.
+
+    Returns:
+      `(members, keys)` tuple of the ordered members and their integer example keys, `keys` is `None` for shuffled
+      output.
+    """
+
+    shard_by = builder.builder_config.shard_by
+
+    if shard_by is None:
+        return members, None
+
+    if shard_by == 'size':
+        with preparation.stage('sizes'):
+            sides = bucketing.sides(tar_path, members, quarantine.enabled(builder.builder_config))
+
+        builder.info.metadata['boundaries'] = bucketing.boundaries(list(sides.values()))
+        return bucketing.order(members, sides, builder.info.metadata['boundaries'])
+
+    return sharding.order(members, label_fn, builder.info.features[shard_by].names)
+
+
+def write_counts(builder, splits):
+    """Stores the group counts of every split in the metadata, under `buckets` or `classes`.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder`, called at the end of its `_download_and_prepare`.
+      splits: `dict` of split name to its index columns, as returned by `index.write`.
+    """
+
+    shard_by = builder.builder_config.shard_by
+
+    if shard_by == 'size':
+        boundaries = builder.info.metadata['boundaries']
+        builder.info.metadata['buckets'] = {split: bucketing.bucket_counts(columns, boundaries)
+                                            for split, columns in splits.items()}
+    elif shard_by is not None:
+        names = builder.info.features[shard_by].names
+        builder.info.metadata['classes'] = {split: sharding.class_counts(columns, shard_by, names)
+                                            for split, columns in splits.items()}
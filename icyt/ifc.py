@@ -0,0 +1,139 @@
+"""Channel layouts of the multipage TIFFs exported by the Amnis ImageStream.
+
+The exports store the channels followed by their masks as planes of one `(H, W, planes)` image. Which plane holds
+which channel depends on the instrument setup, so the layouts are kept in tables keyed by the number of planes. A new
+instrument setup only needs a new table entry. `decode` turns an export into the image features of a builder config,
+both for the builds and for `streaming`.
+"""
+
+import collections
+import logging
+
+import numpy as np
+import tifffile as tiff
+
+from icyt import connectors
+from icyt import instrument
+from icyt import transforms
+
+# Plane indices of the channels and of their masks, in the order of the channel names passed to `split`. `masks` is
+# `None` for exports without masks.
+Layout = collections.namedtuple('Layout', ['channels', 'masks'])
+
+# Returned by the decoders instead of an example for images whose number of planes has no layout
+Unknown = collections.namedtuple('Unknown', ['filename', 'planes'])
+
+# Channels 1/2/3/4/5/6/9 of the poldiv and romania exports, which were measured with 7, 9 or 12 channels
+POLDIV_LAYOUTS = {
+    14: Layout(channels=(0, 1, 2, 3, 4, 5, 6), masks=(7, 8, 9, 10, 11, 12, 13)),
+    # Copies the 14-plane mapping, so planes 14 to 17 are ignored, a quirk kept from the original builders
+    18: Layout(channels=(0, 1, 2, 3, 4, 5, 6), masks=(7, 8, 9, 10, 11, 12, 13)),
+    24: Layout(channels=(0, 1, 2, 3, 4, 5, 8), masks=(12, 13, 14, 15, 16, 17, 20)),
+}
+
+# Channels 1 to 12 of the phytoplankton exports, which have no masks
+PHYTOPLANKTON_LAYOUTS = {
+    12: Layout(channels=tuple(range(12)), masks=None),
+}
+
+_UNKNOWN_EXAMPLES = 5
+
+
+def split(img, layouts, names):
+    """Splits an `(H, W, planes)` image into channel and mask images.
+
+    All selected planes are gathered with one fancy index into a single contiguous `(planes, H, W)` buffer, so every
+    returned image is a contiguous view of it.
+
+    Args:
+      img: `np.ndarray`, the decoded TIFF.
+      layouts: `dict` mapping a number of planes to a `Layout`, e.g. `POLDIV_LAYOUTS`.
+      names: list of `str`, channel names in the order of the layout indices.
+
+    Returns:
+      `(channels, masks)` tuple of `dict`s of 2D images, `masks` is `None` if the layout has no masks. `None` if the
+      number of planes has no layout.
+    """
+
+    layout = layouts.get(num_planes(img))
+
+    if layout is None:
+        return None
+
+    indices = list(layout.channels) + list(layout.masks or ())
+    planes = np.moveaxis(img, -1, 0)[indices]
+    channels = dict(zip(names, planes[:len(layout.channels)]))
+    masks = dict(zip(names, planes[len(layout.channels):])) if layout.masks is not None else None
+
+    return channels, masks
+
+
+def decode(filename, fobj, layouts, names, config):
+    """Decodes an exported TIFF into the image features of a builder config.
+
+    Args:
+      filename: `str`, name of the TIFF.
+      fobj: file object of the TIFF.
+      layouts: `dict` mapping a number of planes to a `Layout`, e.g. `POLDIV_LAYOUTS`.
+      names: list of `str`, channel names in the order of the layout indices.
+      config: builder config with `layout` and `size`, and optionally `crop_margin`.
+
+    Returns:
+      `dict` of the `channels` and, if the layout has masks, `masks` features, with `frame_shape` and `crop_offset` if
+      the config crops to the masks. `Unknown` if the number of planes has no layout.
+    """
+
+    with instrument.stage('decode'):
+        img = tiff.imread(fobj)
+
+    with instrument.stage('layout'):
+        planes = split(img, layouts, names)
+
+    if planes is None:
+        return Unknown(filename, num_planes(img))
+
+    channels, masks = planes
+    crop_margin = getattr(config, 'crop_margin', None)
+    features = {}
+
+    with instrument.stage('transform'):
+        if config.size is not None:
+            channels, masks = transforms.center(channels, masks, config.size)
+
+        if crop_margin is not None:
+            channels, masks, features['crop_offset'], features['frame_shape'] = transforms.crop_to_masks(
+                channels, masks, crop_margin)
+
+    features['channels'] = connectors.layout_image(channels, names, config.layout)
+
+    if masks is not None:
+        features['masks'] = connectors.layout_image(masks, names, config.layout)
+
+    return features
+
+
+def num_planes(img):
+    """Returns the number of planes of a decoded TIFF, 1 for single-page TIFFs."""
+
+    return img.shape[-1] if img.ndim == 3 else 1
+
+
+def skip_unknown(examples):
+    """Drops the `Unknown` results of a decoder and logs how many images were dropped per number of planes.
+
+    Args:
+      examples: iterable of `(key, features)` tuples or `Unknown`s.
+    """
+
+    unknown = collections.defaultdict(list)
+
+    for example in examples:
+        if isinstance(example, Unknown):
+            unknown[example.planes].append(example.filename)
+            continue
+
+        yield example
+
+    for planes, filenames in sorted(unknown.items()):
+        logging.warning('Skipped %d images with unknown layout of %d planes, e.g. %s', len(filenames), planes,
+                        ', '.join(filenames[:_UNKNOWN_EXAMPLES]))
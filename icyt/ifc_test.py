@@ -0,0 +1,115 @@
+"""Tests for icyt.ifc."""
+
+import io
+import types
+import unittest
+
+import numpy as np
+import tifffile as tiff
+
+from benchmarks import synthetic
+from icyt import ifc
+
+_POLDIV_NAMES = ['1', '2', '3', '4', '5', '6', '9']
+
+
+def _planes(num_planes, height=5, width=4):
+    """Returns an `(H, W, planes)` image whose planes hold their own index."""
+
+    return np.broadcast_to(np.arange(num_planes, dtype=np.uint16), (height, width, num_planes)).copy()
+
+
+def _tiff(num_planes, height=40, width=50, masks=()):
+    buffer = io.BytesIO()
+    tiff.imwrite(buffer, synthetic.ifc_image(np.random.default_rng(0), num_planes, height, width, masks=masks))
+    buffer.seek(0)
+    return buffer
+
+
+def _config(layout='channels', size=None, crop_margin=None):
+    return types.SimpleNamespace(layout=layout, size=size, crop_margin=crop_margin)
+
+
+class SplitTest(unittest.TestCase):
+
+    def _assert_layouts(self, layouts, names):
+        for num_planes, layout in layouts.items():
+            with self.subTest(planes=num_planes):
+                channels, masks = ifc.split(_planes(num_planes), layouts, names)
+
+                self.assertEqual(list(channels), names)
+                self.assertEqual([int(channels[name][0, 0]) for name in names], list(layout.channels))
+                self.assertEqual(channels[names[0]].shape, (5, 4))
+                self.assertTrue(all(image.flags['C_CONTIGUOUS'] for image in channels.values()))
+
+                if layout.masks is None:
+                    self.assertIsNone(masks)
+                else:
+                    self.assertEqual([int(masks[name][0, 0]) for name in names], list(layout.masks))
+
+    def test_poldiv_layouts(self):
+        self._assert_layouts(ifc.POLDIV_LAYOUTS, _POLDIV_NAMES)
+
+    def test_phytoplankton_layouts(self):
+        self._assert_layouts(ifc.PHYTOPLANKTON_LAYOUTS, [str(i) for i in range(1, 13)])
+
+    def test_unknown(self):
+        self.assertIsNone(ifc.split(_planes(5), ifc.POLDIV_LAYOUTS, _POLDIV_NAMES))
+        self.assertIsNone(ifc.split(np.zeros((5, 4), dtype=np.uint16), ifc.POLDIV_LAYOUTS, _POLDIV_NAMES))
+
+
+class DecodeTest(unittest.TestCase):
+
+    def test_layouts(self):
+        for num_planes, layout in ifc.POLDIV_LAYOUTS.items():
+            with self.subTest(planes=num_planes):
+                image = tiff.imread(_tiff(num_planes, masks=layout.masks))
+                features = ifc.decode('a.tif', _tiff(num_planes, masks=layout.masks), ifc.POLDIV_LAYOUTS,
+                                      _POLDIV_NAMES, _config())
+
+                self.assertEqual(set(features), {'channels', 'masks'})
+
+                for name, plane, mask in zip(_POLDIV_NAMES, layout.channels, layout.masks):
+                    np.testing.assert_array_equal(features['channels'][name], image[..., plane])
+                    np.testing.assert_array_equal(features['masks'][name], image[..., mask])
+
+    def test_without_masks(self):
+        names = [str(i) for i in range(1, 13)]
+        features = ifc.decode('a.tif', _tiff(12), ifc.PHYTOPLANKTON_LAYOUTS, names, _config(layout='stacked'))
+
+        self.assertEqual(set(features), {'channels'})
+        self.assertEqual(features['channels'].shape, (40, 50, 12))
+
+    def test_transforms(self):
+        masks = ifc.POLDIV_LAYOUTS[18].masks
+        stacked = ifc.decode('a.tif', _tiff(18, masks=masks), ifc.POLDIV_LAYOUTS, _POLDIV_NAMES,
+                             _config(layout='stacked', size=32))
+        cropped = ifc.decode('a.tif', _tiff(18, masks=masks), ifc.POLDIV_LAYOUTS, _POLDIV_NAMES,
+                             _config(crop_margin=2))
+
+        self.assertEqual(stacked['channels'].shape, (32, 32, 7))
+        self.assertEqual(stacked['masks'].shape, (32, 32, 7))
+        self.assertEqual(set(cropped), {'channels', 'masks', 'crop_offset', 'frame_shape'})
+        self.assertEqual(tuple(cropped['frame_shape']), (40, 50))
+        self.assertLess(cropped['channels']['1'].size, 40 * 50)
+
+    def test_unknown(self):
+        result = ifc.decode('a.tif', _tiff(5), ifc.POLDIV_LAYOUTS, _POLDIV_NAMES, _config())
+        self.assertEqual(result, ifc.Unknown('a.tif', 5))
+
+
+class SkipUnknownTest(unittest.TestCase):
+
+    def test_skip_unknown(self):
+        examples = [('a.tif', {}), ifc.Unknown('b.tif', 5), None, ifc.Unknown('c.tif', 3), ifc.Unknown('d.tif', 5)]
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(list(ifc.skip_unknown(examples)), [('a.tif', {}), None])
+
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('2 images with unknown layout of 5 planes, e.g. b.tif, d.tif', logs.output[1])
+        self.assertIn('1 images with unknown layout of 3 planes, e.g. c.tif', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+"""Columnar index of the built iCyt datasets.
+
+Every build writes an `index-<split>.npz` file next to the shards of each split, with one row per example in the order
+of the records: its position, the filename, all labels, the image height and width and builder-specific fields such as
+the romania measurement. The index is read without touching the image data, so subsets and stratified splits are
+planned in milliseconds and read through a `tfds.core.ReadInstruction`:
+
+    builder = tfds.builder('poldiv/all')
+    species = index.load(builder, 'train')
+    train, valid, test = species.stratified_split('species', [0.8, 0.1, 0.1])
+    ds_train = builder.as_dataset(split=train)
+"""
+
+import collections
+import functools
+import importlib
+import io
+import operator
+import os
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+# Record formats the builds can write, `array_record` with `tfds build --file_format=array_record`
+FILE_FORMATS = ['tfrecord', 'array_record']
+
+_BATCH_SIZE = 1024
+
+# Feature that determines the `height` and `width` columns
+_IMAGE_FEATURE = 'channels'
+
+
+def write(builder, fields_fn=None):
+    """Writes the index of every split of a dataset that was just generated.
+
+    Only the scalar features and the image shapes are parsed from the records, the image tensors are not decoded.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder`, called at the end of its `_download_and_prepare`.
+      fields_fn: callable mapping a filename to a `dict` of additional `str` columns, or `None`.
+
+    Returns:
+      `dict` of split name to the columns written for it.
+    """
+
+    features = builder.info.features
+    spec = {name: tf.io.FixedLenFeature([], info.dtype) for name, info in features.get_serialized_info().items()
+            if isinstance(info, tfds.features.TensorInfo) and info.shape == ()}
+    shape_key, shape = _shape_source(features)
+
+    if shape_key is not None:
+        spec[shape_key] = tf.io.FixedLenFeature([len(shape)], tf.int64)
+
+    splits = {}
+
+    for split in builder.info.splits.keys():
+        columns = collections.defaultdict(list)
+        dataset = records(builder, split)
+
+        for batch in dataset.batch(_BATCH_SIZE).map(functools.partial(tf.io.parse_example, features=spec)):
+            for name, values in batch.items():
+                columns[name].append(values.numpy())
+
+        columns = {name: np.concatenate(values) for name, values in columns.items()}
+        num_examples = len(next(iter(columns.values()), []))
+
+        if shape_key is not None:
+            shapes = columns.pop(shape_key)
+            columns['height'], columns['width'] = shapes[:, 0], shapes[:, 1]
+        elif shape is not None:
+            columns['height'] = np.full(num_examples, shape[0], dtype=np.int64)
+            columns['width'] = np.full(num_examples, shape[1], dtype=np.int64)
+
+        if 'filename' in columns:
+            columns['filename'] = np.array([filename.decode() for filename in columns['filename']], dtype=str)
+
+            if fields_fn is not None:
+                fields = [fields_fn(filename) for filename in columns['filename']]
+
+                for name in (fields[0] if fields else {}):
+                    columns[name] = np.array([field[name] for field in fields], dtype=str)
+
+        columns['position'] = np.arange(num_examples, dtype=np.int64)
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+
+        with tf.io.gfile.GFile(os.path.join(builder.data_dir, f'index-{split}.npz'), 'wb') as f:
+            f.write(buffer.getvalue())
+
+        splits[split] = columns
+
+    return splits
+
+
+def load(builder, split):
+    """Returns the `Index` of a split of a built dataset."""
+
+    path = os.path.join(builder.data_dir, f'index-{split}.npz')
+
+    if not tf.io.gfile.exists(path):
+        raise FileNotFoundError(f'No index for split {split} in {builder.data_dir}, rebuild the dataset to create it')
+
+    with tf.io.gfile.GFile(path, 'rb') as f:
+        columns = dict(np.load(io.BytesIO(f.read())))
+
+    labels = {name: feature.names for name, feature in builder.info.features.items()
+              if isinstance(feature, tfds.features.ClassLabel) and name in columns}
+
+    return Index(split, columns, labels)
+
+
+class Index:
+    """Columns of the index of one split, with one row per example in record order.
+
+    Columns are NumPy arrays, e.g. `index['species']` holds the label ids and `index.names('species')` the label names.
+    """
+
+    def __init__(self, split, columns, labels=None):
+        self.split = split
+        self.columns = columns
+        self.labels = labels or {}
+
+    def __len__(self):
+        return len(self.columns['position'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def names(self, name):
+        """Returns the label names of a `ClassLabel` column."""
+
+        return np.asarray(self.labels[name])[self.columns[name]]
+
+    def select(self, mask):
+        """Returns a `tfds.core.ReadInstruction` reading the examples of a boolean mask or an array of positions.
+
+        Scattered selections are slow to read, see `read_instruction`.
+        """
+
+        positions = np.asarray(mask)
+
+        if positions.dtype == bool:
+            positions = self.columns['position'][positions]
+
+        return read_instruction(self.split, positions)
+
+    def stratified_split(self, column, fractions, seed=0):
+        """Splits the examples into parts with the same class distribution.
+
+        The examples of a part are scattered over the split, so the parts of shuffled datasets are slow to read through
+        `as_dataset`, see `read_instruction`. Datasets built in the ArrayRecord format read the positions of
+        `stratified_positions` with `random_access.Reader` instead.
+
+        Args:
+          column: `str`, name of the column to stratify by, e.g. `'species'`.
+          fractions: list of `float`, relative sizes of the parts.
+          seed: `int`, seed of the assignment of the examples to the parts.
+
+        Returns:
+          List of `tfds.core.ReadInstruction`s, one per part.
+
+        Raises:
+          ValueError: if a fraction is negative or a part would get no examples.
+        """
+
+        return [read_instruction(self.split, part) for part in self.stratified_positions(column, fractions, seed)]
+
+    def stratified_positions(self, column, fractions, seed=0):
+        """Like `stratified_split`, but returns the sorted record positions of every part as an array."""
+
+        fractions = np.asarray(fractions, dtype=np.float64)
+
+        if len(fractions) == 0 or np.any(fractions < 0) or fractions.sum() <= 0:
+            raise ValueError(f'Fractions must not be negative or all zero, got {fractions.tolist()}')
+
+        bounds = np.cumsum(np.concatenate([[0.], fractions])) / fractions.sum()
+        sizes = np.diff(np.round(bounds * len(self)).astype(int))
+
+        if np.any(sizes == 0):
+            raise ValueError(f'Fractions {fractions.tolist()} leave parts {np.flatnonzero(sizes == 0).tolist()} of '
+                             f'split {self.split} with {len(self)} examples empty')
+
+        rng = np.random.default_rng(seed)
+        parts = [[] for _ in fractions]
+        offset = 0
+
+        # Cuts are rounded on the running count over all classes, so the rounding errors of small classes do not add up
+        # and every part gets its share of the examples
+        for value in np.unique(self.columns[column]):
+            positions = rng.permutation(self.columns['position'][self.columns[column] == value])
+            cuts = np.round(bounds * (offset + len(positions))).astype(int) - np.round(bounds * offset).astype(int)
+            offset += len(positions)
+
+            for part, start, end in zip(parts, cuts[:-1], cuts[1:]):
+                part.append(positions[start:end])
+
+        return [np.sort(np.concatenate(part)) for part in parts]
+
+
+def read_instruction(split, positions):
+    """Returns a `tfds.core.ReadInstruction` reading the examples at `positions` of a split in record order.
+
+    Consecutive positions are merged into one slice, so contiguous selections stay cheap to read. The slices are added
+    pairwise, since every addition copies the slices of both sides.
+
+    Every other slice skips records of the TFRecord shards, which are read sequentially, so scattered positions cost
+    several times as much per example as contiguous ones: a random quarter of a 16000 example split reads about five
+    times slower than 4000 consecutive examples. Read random subsets of datasets built in the ArrayRecord format with
+    `random_access.Reader`, or group the examples with `shard_by` so that subsets of classes are contiguous.
+    """
+
+    positions = np.unique(positions)
+
+    if len(positions) == 0:
+        raise ValueError(f'No examples of split {split} selected')
+
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = np.concatenate([[positions[0]], positions[breaks]])
+    ends = np.concatenate([positions[breaks - 1], [positions[-1]]]) + 1
+
+    instructions = [tfds.core.ReadInstruction(split, from_=int(start), to=int(end), unit='abs')
+                    for start, end in zip(starts, ends)]
+
+    while len(instructions) > 1:
+        instructions = [functools.reduce(operator.add, instructions[i:i + 2]) for i in range(0, len(instructions), 2)]
+
+    return instructions[0]
+
+
+def _shape_source(features):
+    """Returns the shape of the first image tensor and the key of its serialized shape, `None` for static shapes."""
+
+    if _IMAGE_FEATURE not in features.keys():
+        return None, None
+
+    feature, key = features[_IMAGE_FEATURE], _IMAGE_FEATURE
+
+    if isinstance(feature, tfds.features.FeaturesDict):
+        channel = next(iter(feature.keys()))
+        feature, key = feature[channel], f'{key}/{channel}'
+
+    if all(dim is not None for dim in feature.shape):
+        return None, feature.shape
+
+    if isinstance(feature.get_serialized_info(), dict) and 'shape' in feature.get_serialized_info():
+        return f'{key}/shape', feature.shape
+
+    return None, None
+
+
+def records(builder, split):
+    """Returns a `tf.data.Dataset` of the serialized records of a split in record order, in any of `FILE_FORMATS`."""
+
+    file_format = _file_format(builder)
+    paths = shard_paths(builder.data_dir, builder.name, split, file_format)
+
+    if file_format == 'tfrecord':
+        return tf.data.TFRecordDataset(paths)
+
+    if file_format == 'array_record':
+        return tf.data.Dataset.from_generator(functools.partial(_read_array_records, paths),
+                                              output_signature=tf.TensorSpec(shape=(), dtype=tf.string))
+
+    raise ValueError(f'File format must be one of {FILE_FORMATS}, got {file_format}')
+
+
+def shard_paths(data_dir, name, split, file_format='tfrecord'):
+    return sorted(tf.io.gfile.glob(os.path.join(data_dir, f'{name}-{split}.{file_format}-*-of-*')))
+
+
+def _file_format(builder):
+    file_format = getattr(builder.info, 'file_format', None)
+    return file_format.value if file_format is not None else 'tfrecord'
+
+
+def _read_array_records(paths):
+    try:
+        data_source = importlib.import_module('array_record.python.array_record_data_source')
+    except ImportError as e:
+        raise ImportError('ArrayRecord files need the `array_record` package, install it with '
+                          '`pip install array_record`') from e
+
+    source = data_source.ArrayRecordDataSource(paths)
+
+    for start in range(0, len(source), _BATCH_SIZE):
+        yield from source.__getitems__(range(start, min(start + _BATCH_SIZE, len(source))))
@@ -0,0 +1,86 @@
+"""Tests for icyt.index."""
+
+import unittest
+
+import numpy as np
+import tensorflow_datasets as tfds
+
+from icyt import index
+
+
+def _positions(instruction, num_examples):
+    info = tfds.core.SplitInfo(name='train', shard_lengths=[num_examples], num_bytes=0)
+    return [position for absolute in instruction.to_absolute({'train': info})
+            for position in range(num_examples)[absolute.from_:absolute.to]]
+
+
+class ReadInstructionTest(unittest.TestCase):
+
+    def test_merges_consecutive_positions(self):
+        instruction = index.read_instruction('train', [7, 2, 3, 4, 9, 8, 0, 3])
+
+        self.assertEqual(len(instruction.to_absolute({'train': tfds.core.SplitInfo('train', [10], 0)})), 3)
+        self.assertEqual(_positions(instruction, 10), [0, 2, 3, 4, 7, 8, 9])
+
+    def test_many_slices(self):
+        positions = np.arange(0, 20000, 2)
+        self.assertEqual(_positions(index.read_instruction('train', positions), 20000), positions.tolist())
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            index.read_instruction('train', [])
+
+
+class IndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # 3 large classes and 2 with fewer examples than parts
+        self.labels = np.repeat(np.arange(5), [500, 300, 120, 2, 1])
+        np.random.default_rng(0).shuffle(self.labels)
+        self.index = index.Index('train', {'species': self.labels, 'position': np.arange(len(self.labels))})
+
+    def test_select(self):
+        mask = self.labels == 1
+
+        self.assertEqual(_positions(self.index.select(mask), len(self.labels)), np.flatnonzero(mask).tolist())
+        self.assertEqual(_positions(self.index.select(np.array([5, 1, 3])), len(self.labels)), [1, 3, 5])
+
+    def test_stratified_split(self):
+        parts = [_positions(instruction, len(self.labels))
+                 for instruction in self.index.stratified_split('species', [0.8, 0.1, 0.1])]
+
+        self.assertEqual([len(part) for part in parts], [738, 93, 92])
+        self.assertEqual(sorted(sum(parts, [])), list(range(len(self.labels))))
+
+        for part, fraction in zip(parts, [0.8, 0.1, 0.1]):
+            counts = np.bincount(self.labels[part], minlength=5)
+            np.testing.assert_allclose(counts[:3], fraction * np.array([500, 300, 120]), atol=1)
+
+    def test_stratified_positions(self):
+        positions = self.index.stratified_positions('species', [0.8, 0.1, 0.1])
+        parts = self.index.stratified_split('species', [0.8, 0.1, 0.1])
+
+        for part, instruction in zip(positions, parts):
+            self.assertEqual(part.tolist(), _positions(instruction, len(self.labels)))
+            self.assertTrue(np.all(np.diff(part) > 0))
+
+    def test_stratified_split_seed(self):
+        first = self.index.stratified_split('species', [1, 1], seed=1)
+
+        self.assertEqual([str(instruction) for instruction in first],
+                         [str(instruction) for instruction in self.index.stratified_split('species', [1, 1], seed=1)])
+        self.assertNotEqual(str(first[0]), str(self.index.stratified_split('species', [1, 1], seed=2)[0]))
+
+    def test_stratified_split_empty_part(self):
+        small = index.Index('train', {'species': np.array([0, 0, 1]), 'position': np.arange(3)})
+
+        with self.assertRaisesRegex(ValueError, r'parts \[2\]'):
+            small.stratified_split('species', [0.8, 0.1, 0.1])
+
+        for fractions in [[], [1, -1], [0, 0]]:
+            with self.assertRaises(ValueError):
+                self.index.stratified_split('species', fractions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,366 @@
+"""Per-stage instrumentation of the iCyt builds.
+
+The decoders time their stages with `stage`, e.g. reading the TIFF and splitting it into channels. `Measured` collects
+these timings for every member, also in the worker processes of `parallel`, and `track` sums them up in the main
+process together with the time spent waiting for the next member (`input`: reading and decompressing the archive, or
+waiting for the workers) and the time TFDS takes to encode and write the yielded examples (`write`).
+
+Every `ICYT_PROGRESS_SECONDS` seconds (default 30) and at the end of every split a structured progress line is logged
+and passed to the hooks registered with `add_hook`:
+
+    {"build": "poldiv/all/train", "members": 5120, "total": 61000, "examples_per_sec": 210.4, "mb_in_per_sec": 31.2,
+     "mb_out_per_sec": 96.5, "eta_seconds": 265.5, "bottleneck": "decode", "stages": {"decode": {...}, ...}, ...}
+
+The steps that prepare the splits before any member is decoded, e.g. decompressing and listing the archive, are timed
+with a `Preparation`. Each step is reported when it ends, and steps of known size, like decompressing the archive, also
+every `ICYT_PROGRESS_SECONDS` seconds with their MB per second and ETA. Their times are added to the stages of the
+split reports, so that e.g. `gunzip` shows up as the bottleneck of a build.
+
+Stage times of the workers are summed over all workers, so with a process pool they can add up to more than the
+elapsed time. Set `ICYT_PROFILE_DIR` to write a cProfile dump of the main process (`<build>.prof`, e.g. for snakeviz or
+`python -m pstats`) and the final progress report (`<build>.json`) for every split.
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+# Result of a `Measured` call: the decoder result, `dict` of stage name to `(seconds, bytes)`, the number of member
+# bytes read, the number of decoded bytes and the id of the process that decoded the member
+Result = collections.namedtuple('Result', ['example', 'stages', 'bytes_in', 'bytes_out', 'pid'])
+
+_DEFAULT_REPORT_SECONDS = 30
+
+_hooks = []
+
+# Stage counters of the `Measured` call running in this process
+_stages = None
+
+
+class Counter:
+    """Time and bytes of a stage. Decoders add the number of bytes they read to `nbytes`."""
+
+    def __init__(self):
+        self.seconds = 0.
+        self.nbytes = 0
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Times a stage of a decoder call, a no-op outside of `Measured` calls.
+
+    Yields:
+      a `Counter` whose `nbytes` the stage may increase, e.g. by the number of bytes read for the `read` stage.
+    """
+
+    counter = Counter()
+    start = time.perf_counter()
+
+    try:
+        yield counter
+    finally:
+        if _stages is not None:
+            total = _stages[name]
+            total.seconds += time.perf_counter() - start
+            total.nbytes += counter.nbytes
+
+
+def add_hook(hook):
+    """Registers a callable that is called with every progress report `dict`, the last one of a split has `done` set.
+
+    Reports of preparation steps have the name of the step under `stage`.
+    """
+
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Unregisters a hook registered with `add_hook`."""
+
+    _hooks.remove(hook)
+
+
+class Measured:
+    """Decoder that returns a `Result` with the stage timings of each call instead of the plain decoder result.
+
+    Picklable if the wrapped decoder is, so it can be used with `parallel.imap` and `parallel.apply`.
+    """
+
+    def __init__(self, decode_fn):
+        self.decode_fn = decode_fn
+
+    def __call__(self, *args):
+        global _stages
+
+        bytes_in = _size(args[1]) if len(args) == 2 else 0
+        _stages = collections.defaultdict(Counter)
+
+        try:
+            example = self.decode_fn(*args)
+        finally:
+            stages, _stages = _stages, None
+
+        bytes_in += stages['read'].nbytes if 'read' in stages else 0
+        bytes_out = _nbytes(example[1]) if isinstance(example, tuple) and len(example) == 2 else 0
+        stages = {name: (counter.seconds, counter.nbytes) for name, counter in stages.items()}
+
+        return Result(example, stages, bytes_in, bytes_out, os.getpid())
+
+
+def track(results, name, total=None, preparation=None):
+    """Yields the decoder results of `Measured` calls and reports the progress of the build.
+
+    Args:
+      results: iterable of `Result`s, e.g. `parallel.imap(Measured(decode_fn), ...)`.
+      name: `str`, name of the build in the reports, e.g. `'poldiv/all/train'`.
+      total: `int`, number of members of the split for the ETA, `None` if unknown.
+      preparation: `Preparation` of the build, whose step times are added to the stages of the reports.
+    """
+
+    progress = Progress(name, total, preparation=preparation)
+    profile_dir = os.environ.get('ICYT_PROFILE_DIR')
+    profile = cProfile.Profile() if profile_dir else None
+    iterator = iter(results)
+
+    if profile is not None:
+        profile.enable()
+
+    try:
+        while True:
+            start = time.perf_counter()
+
+            try:
+                result = next(iterator)
+            except StopIteration:
+                break
+
+            progress.add(result, time.perf_counter() - start)
+            start = time.perf_counter()
+            yield result.example
+            progress.add_stage('write', time.perf_counter() - start)
+            progress.maybe_report()
+    finally:
+        if profile is not None:
+            profile.disable()
+
+        report = progress.report(done=True)
+
+        if profile is not None:
+            _dump(profile_dir, name, profile, report)
+
+
+class Progress:
+    """Counters of a split that is being built."""
+
+    def __init__(self, name, total=None, interval=None, preparation=None):
+        self.name = name
+        self.total = total
+        self.interval = interval or _interval()
+        self.preparation = preparation
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.members = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.stages = collections.defaultdict(float)
+
+    def add(self, result, wait_seconds):
+        """Adds the `Result` of a member that took `wait_seconds` to arrive."""
+
+        self.members += 1
+        self.bytes_in += result.bytes_in
+        self.bytes_out += result.bytes_out
+        decoded_here = result.pid == os.getpid()
+
+        for stage_name, (seconds, _) in result.stages.items():
+            self.stages[stage_name] += seconds
+
+            if decoded_here:
+                wait_seconds -= seconds
+
+        self.add_stage('input', max(wait_seconds, 0.))
+
+    def add_stage(self, stage_name, seconds):
+        self.stages[stage_name] += seconds
+
+    def maybe_report(self):
+        if time.perf_counter() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self, done=False):
+        """Logs the progress, passes it to the hooks and returns it."""
+
+        now = time.perf_counter()
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.members / elapsed
+        stages = dict(self.stages)
+
+        if self.preparation is not None:
+            for stage_name, seconds in self.preparation.stages.items():
+                stages[stage_name] = stages.get(stage_name, 0.) + seconds
+
+        stage_seconds = sum(stages.values()) or 1.
+        eta = None
+
+        if self.total is not None and rate > 0:
+            eta = max(self.total - self.members, 0) / rate
+
+        report = {
+            'build': self.name,
+            'members': self.members,
+            'total': self.total,
+            'elapsed_seconds': round(elapsed, 3),
+            'examples_per_sec': round(rate, 2),
+            'mb_in_per_sec': round(self.bytes_in / elapsed / 1e6, 3),
+            'mb_out_per_sec': round(self.bytes_out / elapsed / 1e6, 3),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'bottleneck': max(stages, key=stages.get) if stages else None,
+            'stages': {stage_name: {'seconds': round(seconds, 3), 'share': round(seconds / stage_seconds, 3)}
+                       for stage_name, seconds in sorted(stages.items())},
+            'done': done,
+        }
+
+        return _publish(report)
+
+
+class Preparation:
+    """Step times of the preparation of the splits of a build, e.g. decompressing and listing the archive."""
+
+    def __init__(self, name):
+        """Constructs a Preparation.
+
+        Args:
+          name: `str`, name of the build in the reports, e.g. `'poldiv/all'`.
+        """
+
+        self.name = name
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, stage_name, total_bytes=None):
+        """Times a preparation step and reports it when it ends.
+
+        Args:
+          stage_name: `str`, name of the step, e.g. `'gunzip'`.
+          total_bytes: `int`, number of bytes the step processes for its ETA, `None` if unknown.
+
+        Yields:
+          a `Step` whose `advance` the step calls with the number of bytes it processed.
+        """
+
+        step = Step(f'{self.name}/{stage_name}', stage_name, total_bytes)
+
+        try:
+            yield step
+        finally:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.) + time.perf_counter() - step.start
+            step.report(done=True)
+
+
+class Step:
+    """Counters of a preparation step, see `Preparation.stage`."""
+
+    def __init__(self, name, stage_name, total_bytes=None, interval=None):
+        self.name = name
+        self.stage_name = stage_name
+        self.total_bytes = total_bytes
+        self.interval = interval or _interval()
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.nbytes = 0
+
+    def advance(self, nbytes):
+        """Adds processed bytes and reports the progress every `interval` seconds."""
+
+        self.nbytes += nbytes
+
+        if time.perf_counter() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self, done=False):
+        """Logs the progress, passes it to the hooks and returns it."""
+
+        now = time.perf_counter()
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.nbytes / elapsed
+        eta = None
+
+        if self.total_bytes is not None and rate > 0 and not done:
+            eta = max(self.total_bytes - self.nbytes, 0) / rate
+
+        report = {
+            'build': self.name,
+            'stage': self.stage_name,
+            'mb': round(self.nbytes / 1e6, 3),
+            'total_mb': round(self.total_bytes / 1e6, 3) if self.total_bytes is not None else None,
+            'elapsed_seconds': round(elapsed, 3),
+            'mb_per_sec': round(rate / 1e6, 3),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'done': done,
+        }
+
+        return _publish(report)
+
+
+def _publish(report):
+    logging.info('Build progress %s', json.dumps(report))
+
+    for hook in list(_hooks):
+        hook(report)
+
+    return report
+
+
+def _interval():
+    return float(os.environ.get('ICYT_PROGRESS_SECONDS', _DEFAULT_REPORT_SECONDS))
+
+
+def _size(fobj):
+    """Returns the number of bytes of a member file object without reading it."""
+
+    if isinstance(fobj, io.BytesIO):
+        return fobj.getbuffer().nbytes
+
+    try:
+        position = fobj.tell()
+        size = fobj.seek(0, io.SEEK_END)
+        fobj.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _nbytes(value):
+    """Returns the number of bytes of the arrays and byte strings in nested features."""
+
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, bytes):
+        return len(value)
+
+    return 0
+
+
+def _dump(directory, name, profile, report):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name.replace('/', '-'))
+    profile.dump_stats(f'{path}.prof')
+
+    with open(f'{path}.json', 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,181 @@
+"""Tests for icyt.instrument."""
+
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from icyt import instrument
+
+
+def _decode(filename, fobj):
+    with instrument.stage('decode'):
+        data = fobj.read()
+
+    with instrument.stage('read') as counter:
+        counter.nbytes += 10
+
+    return filename, {'image': np.frombuffer(data, dtype=np.uint8).astype(np.uint16)}
+
+
+class HookTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.reports = []
+        instrument.add_hook(self.reports.append)
+        self.addCleanup(instrument.remove_hook, self.reports.append)
+
+
+class MeasuredTest(unittest.TestCase):
+
+    def test_result(self):
+        result = instrument.Measured(_decode)('a.tif', io.BytesIO(b'12345678'))
+
+        self.assertEqual(result.example[0], 'a.tif')
+        self.assertEqual(set(result.stages), {'decode', 'read'})
+        self.assertEqual(result.stages['read'][1], 10)
+        self.assertEqual(result.bytes_in, 8 + 10)
+        self.assertEqual(result.bytes_out, 16)
+        self.assertEqual(result.pid, os.getpid())
+
+    def test_stage_outside_measured(self):
+        with instrument.stage('decode') as counter:
+            counter.nbytes += 1
+
+
+class TrackTest(HookTestCase):
+
+    def _results(self, n):
+        decode_fn = instrument.Measured(_decode)
+        return (decode_fn(f'{i}.tif', io.BytesIO(bytes(8))) for i in range(n))
+
+    def test_yields_examples_in_order(self):
+        examples = list(instrument.track(self._results(5), 'test/config/train', 5))
+
+        self.assertEqual([key for key, _ in examples], [f'{i}.tif' for i in range(5)])
+
+    def test_final_report(self):
+        list(instrument.track(self._results(4), 'test/config/train', 10))
+        report = self.reports[-1]
+
+        self.assertTrue(report['done'])
+        self.assertEqual(report['build'], 'test/config/train')
+        self.assertEqual((report['members'], report['total']), (4, 10))
+        self.assertEqual(set(report['stages']), {'decode', 'read', 'input', 'write'})
+        self.assertAlmostEqual(sum(stage['share'] for stage in report['stages'].values()), 1., places=2)
+        self.assertIsNotNone(report['eta_seconds'])
+
+    def test_report_on_error(self):
+        def results():
+            yield from self._results(2)
+            raise RuntimeError('broken archive')
+
+        with self.assertRaises(RuntimeError):
+            list(instrument.track(results(), 'test/config/train'))
+
+        self.assertEqual(self.reports[-1]['members'], 2)
+        self.assertTrue(self.reports[-1]['done'])
+
+    def test_preparation_stages(self):
+        preparation = instrument.Preparation('test/config')
+        preparation.stages['gunzip'] = 1000.
+
+        list(instrument.track(self._results(2), 'test/config/train', 2, preparation))
+        report = self.reports[-1]
+
+        self.assertEqual(report['bottleneck'], 'gunzip')
+        self.assertEqual(report['stages']['gunzip']['seconds'], 1000.)
+
+    def test_profile(self):
+        profile_dir = tempfile.mkdtemp()
+
+        with mock.patch.dict(os.environ, {'ICYT_PROFILE_DIR': profile_dir}):
+            list(instrument.track(self._results(2), 'test/config/train'))
+
+        self.assertEqual(sorted(os.listdir(profile_dir)), ['test-config-train.json', 'test-config-train.prof'])
+
+
+class ProgressTest(HookTestCase):
+
+    def test_eta(self):
+        progress = instrument.Progress('test/config/train', total=100, interval=3600)
+        progress.start -= 10.
+
+        for _ in range(20):
+            progress.add(instrument.Result(None, {}, 0, 0, os.getpid()), 0.)
+
+        report = progress.report()
+
+        # 20 members in about 10 seconds leave about 40 seconds for the other 80
+        self.assertAlmostEqual(report['examples_per_sec'], 2., delta=0.1)
+        self.assertAlmostEqual(report['eta_seconds'], 40., delta=2.)
+        self.assertFalse(report['done'])
+        self.assertEqual(self.reports, [report])
+
+    def test_unknown_total(self):
+        progress = instrument.Progress('test/config/train')
+        progress.add(instrument.Result(None, {}, 0, 0, os.getpid()), 0.)
+
+        self.assertIsNone(progress.report()['eta_seconds'])
+
+    def test_input_excludes_stages_of_this_process(self):
+        progress = instrument.Progress('test/config/train')
+        progress.add(instrument.Result(None, {'decode': (2., 0)}, 0, 0, os.getpid()), 3.)
+        progress.add(instrument.Result(None, {'decode': (2., 0)}, 0, 0, -1), 3.)
+
+        self.assertEqual(progress.stages['decode'], 4.)
+        self.assertEqual(progress.stages['input'], 1. + 3.)
+
+    def test_interval(self):
+        progress = instrument.Progress('test/config/train', interval=3600)
+        progress.maybe_report()
+        self.assertEqual(self.reports, [])
+
+        progress.last_report -= 3600
+        progress.maybe_report()
+        self.assertEqual(len(self.reports), 1)
+
+
+class PreparationTest(HookTestCase):
+
+    def test_stage(self):
+        preparation = instrument.Preparation('test/config')
+
+        with preparation.stage('gunzip', total_bytes=100 * 10 ** 6) as step:
+            step.interval = 0.
+            step.advance(25 * 10 ** 6)
+            time.sleep(0.01)
+            step.advance(25 * 10 ** 6)
+
+        with preparation.stage('route'):
+            pass
+
+        self.assertEqual(list(preparation.stages), ['gunzip', 'route'])
+        self.assertGreater(preparation.stages['gunzip'], 0.01)
+
+        gunzip = [report for report in self.reports if report['stage'] == 'gunzip']
+        self.assertEqual([report['done'] for report in gunzip], [False, False, True])
+        self.assertEqual(gunzip[0]['build'], 'test/config/gunzip')
+        self.assertEqual(gunzip[1]['mb'], 50.)
+        self.assertIsNotNone(gunzip[1]['eta_seconds'])
+        self.assertIsNone(gunzip[2]['eta_seconds'])
+        self.assertTrue(self.reports[-1]['done'])
+        self.assertEqual(self.reports[-1]['stage'], 'route')
+
+    def test_stage_on_error(self):
+        preparation = instrument.Preparation('test/config')
+
+        with self.assertRaises(EOFError):
+            with preparation.stage('gunzip'):
+                raise EOFError()
+
+        self.assertIn('gunzip', preparation.stages)
+        self.assertTrue(self.reports[-1]['done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
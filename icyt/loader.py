@@ -0,0 +1,145 @@
+"""Input pipelines that decode only the selected channels of the iCyt datasets.
+
+`tfds.load` decodes every channel and mask tensor of an example, even if the model only uses a few of them. `load`
+selects the channels and masks with `tfds.decode.PartialDecoding`, so the unused tensors are neither parsed nor
+decompressed, then stacks the selected channels into one `(H, W, C)` image, brings it to a common size and prefetches:
+
+    ds = loader.load('poldiv/all', 'train', channels=['1', '6', '9'], size=64, batch_size=256)
+
+With the stacked layout all channels are stored in one tensor, which is always decoded as a whole. Images of varying
+size are batched with `buckets=True`, which groups images of similar size and pads each batch to its largest image.
+"""
+
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+from icyt import bucketing
+from icyt import stats
+
+# 'pad' pads or crops the images around the center of the frame, 'resize' scales them, bilinearly for the channels
+# and to the nearest pixel for the masks
+METHODS = ['pad', 'resize']
+
+_IMAGE_FEATURES = ['channels', 'masks']
+
+
+def load(builder, split, channels=None, masks=False, size=None, method='pad', features=None, normalize=False,
+         cache=False, shuffle_files=False, batch_size=None, data_dir=None, read_config=None, buckets=False):
+    """Returns a `tf.data.Dataset` of the selected channels of a built dataset.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder` of a built dataset, or its name, e.g. `'poldiv/all:3.0.0'`.
+      split: `str` or `tfds.core.ReadInstruction`, the split to read, e.g. from `index.Index.select`.
+      channels: list of `str`, names of the channels in stacking order, `None` selects all channels.
+      masks: `bool`, whether to read the masks of the selected channels into `masks`.
+      size: `int`, brings the images to `size` x `size` with `method`, `None` keeps their size.
+      method: `str`, one of `METHODS`.
+      features: list of `str`, names of the other features to read, e.g. `['species']`. `None` reads all of them.
+      normalize: `bool`, whether to standardize the channels with the statistics of the train split, see `stats`.
+      cache: `bool` or `str`, caches the decoded examples in memory, or in files with this prefix.
+      shuffle_files: `bool`, whether to shuffle the order of the shards.
+      batch_size: `int`, batches the examples, `None` returns single examples.
+      data_dir: `str`, directory of the built datasets if `builder` is a name.
+      read_config: `tfds.ReadConfig` forwarded to `as_dataset`.
+      buckets: `bool`, whether to batch images of similar size together, with the bucket boundaries of
+        `bucketing.load_boundaries`, and pad them to the largest image of their batch. Needs `batch_size`.
+
+    Returns:
+      `tf.data.Dataset` of `dict`s with a `(H, W, C)` image under `channels`, the stacked masks under `masks` and the
+      selected other features.
+    """
+
+    if method not in METHODS:
+        raise ValueError(f'Method must be one of {METHODS}')
+
+    if buckets and (size is not None or batch_size is None):
+        raise ValueError('Buckets need a batch size and images of varying size, size must not be set')
+
+    if isinstance(builder, str):
+        builder = tfds.builder(builder, data_dir=data_dir)
+
+    names = list(builder.info.metadata['channels'])
+    channels = list(channels or names)
+    unknown = sorted(set(channels) - set(names))
+
+    if unknown:
+        raise ValueError(f'Unknown channels {unknown}, {builder.name} has channels {names}')
+
+    if masks and 'masks' not in builder.info.features.keys():
+        raise ValueError(f'{builder.name} has no masks')
+
+    if features is None:
+        features = [name for name in builder.info.features.keys() if name not in _IMAGE_FEATURES]
+
+    selection = {name: True for name in features}
+    selection['channels'] = _select(builder.info.features['channels'], channels)
+
+    if masks:
+        selection['masks'] = _select(builder.info.features['masks'], channels)
+
+    dataset = builder.as_dataset(split=split, shuffle_files=shuffle_files, read_config=read_config,
+                                 decoders=tfds.decode.PartialDecoding(selection))
+
+    mean, std = stats.normalization(builder, 'train') if normalize else (None, None)
+    indices = [names.index(channel) for channel in channels]
+
+    def _prepare(example):
+        example = dict(example)
+        example['channels'] = _stack(example['channels'], channels, indices)
+
+        if normalize:
+            example['channels'] = (tf.cast(example['channels'], tf.float32) - tf.gather(mean, indices)) / \
+                tf.gather(std, indices)
+
+        if masks:
+            example['masks'] = _stack(example['masks'], channels, indices)
+
+        if size is not None:
+            example['channels'] = _resize(example['channels'], size, method, 'bilinear')
+
+            if masks:
+                example['masks'] = _resize(example['masks'], size, method, 'nearest')
+
+        return example
+
+    dataset = dataset.map(_prepare, num_parallel_calls=tf.data.AUTOTUNE)
+
+    if cache:
+        dataset = dataset.cache(cache if isinstance(cache, str) else '')
+
+    if buckets:
+        boundaries = bucketing.load_boundaries(builder)
+        dataset = dataset.bucket_by_sequence_length(_longer_side, boundaries, [batch_size] * (len(boundaries) + 1))
+    elif batch_size is not None:
+        dataset = dataset.batch(batch_size, num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def _select(feature, channels):
+    """Returns the `PartialDecoding` selection of the channels of an image feature."""
+
+    if isinstance(feature, tfds.features.FeaturesDict):
+        return {channel: True for channel in channels}
+
+    return True
+
+
+def _stack(image, channels, indices):
+    """Stacks the selected channels of both the channels and the stacked layout into one `(H, W, C)` image."""
+
+    if isinstance(image, dict):
+        return tf.stack([image[channel] for channel in channels], axis=-1)
+
+    return tf.gather(image, indices, axis=-1)
+
+
+def _longer_side(example):
+    return tf.reduce_max(tf.shape(example['channels'])[:2])
+
+
+def _resize(image, size, method, interpolation):
+    if method == 'pad':
+        return tf.image.resize_with_crop_or_pad(image, size, size)
+
+    return tf.cast(tf.image.resize(image, (size, size), method=interpolation), image.dtype)
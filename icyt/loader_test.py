@@ -0,0 +1,159 @@
+"""Tests for icyt.loader, on datasets built from the dummy data."""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from icyt import bucketing
+from icyt import index
+from icyt import loader
+from icyt import stats
+from icyt import testing
+from poldiv import poldiv
+
+
+class LoaderTestCase(unittest.TestCase):
+
+    CONFIGS = []
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cls.builders = {config: testing.build(poldiv.Poldiv, config, cls.data_dir) for config in cls.CONFIGS}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_dir)
+
+
+class BucketsTest(LoaderTestCase):
+
+    CONFIGS = ['all', 'all-by-size']
+
+    def _batches(self, config, batch_size=2):
+        return list(loader.load(self.builders[config], 'train', channels=['1', '9'], masks=True,
+                                features=['filename'], batch_size=batch_size, buckets=True).as_numpy_iterator())
+
+    def test_batches_within_bucket(self):
+        for config, builder in self.builders.items():
+            with self.subTest(config=config):
+                ix = index.load(builder, 'train')
+                sides = dict(zip(ix['filename'], np.maximum(ix['height'], ix['width'])))
+                boundaries = bucketing.load_boundaries(builder)
+                batches = self._batches(config)
+
+                self.assertEqual(sorted(name.decode() for batch in batches for name in batch['filename']),
+                                 sorted(ix['filename']))
+
+                for batch in batches:
+                    batch_sides = [sides[name.decode()] for name in batch['filename']]
+                    self.assertEqual(len(set(bucketing.assign(batch_sides, boundaries))), 1)
+                    self.assertLessEqual(len(batch_sides), 2)
+
+                    # Padded to the largest image of the batch, not of the dataset
+                    heights = [ix['height'][ix['filename'] == name.decode()][0] for name in batch['filename']]
+                    widths = [ix['width'][ix['filename'] == name.decode()][0] for name in batch['filename']]
+                    self.assertEqual(batch['channels'].shape, (len(batch_sides), max(heights), max(widths), 2))
+                    self.assertEqual(batch['masks'].shape, batch['channels'].shape)
+
+    def test_stored_boundaries(self):
+        builder = self.builders['all-by-size']
+
+        self.assertEqual(bucketing.load_boundaries(builder), list(builder.info.metadata['boundaries']))
+        self.assertEqual(sum(bucket['count'] for bucket in builder.info.metadata['buckets']['train'].values()), 6)
+
+    def test_needs_batch_size(self):
+        with self.assertRaises(ValueError):
+            loader.load(self.builders['all'], 'train', buckets=True)
+
+        with self.assertRaises(ValueError):
+            loader.load(self.builders['all'], 'train', size=64, batch_size=2, buckets=True)
+
+
+class LoadTest(LoaderTestCase):
+
+    CONFIGS = ['all', 'all-stacked']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        dataset = cls.builders['all'].as_dataset(split='train')
+        cls.reference = {example['filename'].decode(): example for example in dataset.as_numpy_iterator()}
+
+    def _load(self, config='all', **kwargs):
+        kwargs.setdefault('features', ['filename'])
+        return {example['filename'].decode(): example
+                for example in loader.load(self.builders[config], 'train', **kwargs).as_numpy_iterator()}
+
+    def test_channel_selection(self):
+        examples = self._load(channels=['9', '1'], masks=True, features=['filename', 'species'])
+
+        self.assertEqual(set(examples), set(self.reference))
+
+        for filename, example in examples.items():
+            reference = self.reference[filename]
+
+            self.assertEqual(set(example), {'channels', 'masks', 'filename', 'species'})
+            self.assertEqual(example['species'], reference['species'])
+            np.testing.assert_array_equal(example['channels'],
+                                          np.stack([reference['channels']['9'], reference['channels']['1']], -1))
+            np.testing.assert_array_equal(example['masks'],
+                                          np.stack([reference['masks']['9'], reference['masks']['1']], -1))
+
+    def test_all_channels(self):
+        example = next(iter(self._load().values()))
+
+        self.assertEqual(set(example), {'channels', 'filename'})
+        self.assertEqual(example['channels'].shape[-1], 7)
+        self.assertEqual(example['channels'].dtype, np.uint16)
+
+    def test_stacked_layout(self):
+        channels = self._load(channels=['6', '2'], masks=True)
+        stacked = self._load('all-stacked', channels=['6', '2'], masks=True)
+
+        self.assertEqual(set(stacked), set(channels))
+
+        for filename, example in stacked.items():
+            np.testing.assert_array_equal(example['channels'], channels[filename]['channels'])
+            np.testing.assert_array_equal(example['masks'], channels[filename]['masks'])
+
+    def test_normalize(self):
+        mean, std = stats.normalization(self.builders['all'], 'train')
+        examples = self._load(channels=['1', '9'], normalize=True)
+
+        for filename, example in examples.items():
+            image = np.stack([self.reference[filename]['channels'][name] for name in ['1', '9']], -1)
+
+            self.assertEqual(example['channels'].dtype, np.float32)
+            np.testing.assert_allclose(example['channels'], (image - mean[[0, 6]]) / std[[0, 6]], rtol=1e-5, atol=1e-5)
+
+    def test_resize(self):
+        for method in loader.METHODS:
+            with self.subTest(method=method):
+                dataset = loader.load(self.builders['all'], 'train', channels=['1', '9'], masks=True, size=16,
+                                      method=method, features=[], batch_size=6)
+                batch = next(dataset.as_numpy_iterator())
+
+                self.assertEqual(batch['channels'].shape, (6, 16, 16, 2))
+                self.assertEqual(batch['channels'].dtype, np.uint16)
+                self.assertEqual(batch['masks'].shape, (6, 16, 16, 2))
+                self.assertTrue(set(np.unique(batch['masks'])) <= {0, 1})
+
+    def test_pad_around_center(self):
+        for filename, example in self._load(channels=['1'], size=16).items():
+            image = self.reference[filename]['channels']['1'][..., None]
+            np.testing.assert_array_equal(example['channels'], tf.image.resize_with_crop_or_pad(image, 16, 16))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            loader.load(self.builders['all'], 'train', channels=['1', '7'])
+
+        with self.assertRaises(ValueError):
+            loader.load(self.builders['all'], 'train', method='crop')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Metadata of the iCyt datasets without importing TensorFlow.
+
+Importing a builder module imports `tensorflow`, `tensorflow_datasets` and `tifffile`, which takes seconds. This module
+only uses the standard library, so scheduling and reporting tools read the configs, versions, split sizes, label
+vocabularies and stored metadata of the prepared datasets, and the class lists, species to genus mappings and romania
+measurement lists of the source tree, in milliseconds:
+
+    metadata.configs('poldiv')  # prepared configs, e.g. ['all', 'all-64']
+    metadata.split_counts('poldiv', 'all')  # {'train': 61000}
+    metadata.labels('poldiv', 'all', 'species')  # from the prepared dataset
+    metadata.class_names('romania', 'species', 'metabarcoding')  # from the source tree
+    metadata.genera('poldiv')['betula.pendula']  # 'betula'
+
+The prepared datasets are read from `data_dir`, which defaults to `TFDS_DATA_DIR` or `~/tensorflow_datasets` like
+TFDS. The builders read their class lists, mappings and measurement lists through this module as well.
+"""
+
+import csv
+import json
+import os
+import re
+
+DATASETS = ['blood_quality', 'phytoplankton', 'poldiv', 'poldiv_balanced', 'romania']
+
+# Directory of the dataset packages
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Class list of a label feature in the source tree, relative to the dataset package
+_CLASS_FILES = {
+    'blood_quality': 'classes.txt',
+    'phytoplankton': 'classes.txt',
+    'poldiv': 'classes-{selection}-{feature}.txt',
+    'poldiv_balanced': 'classes-{feature}.txt',
+    'romania': '{selection}-classes-{feature}.txt',
+}
+
+_VERSION_REGEX = re.compile(r'^\d+\.\d+\.\d+$')
+
+
+def configs(dataset, data_dir=None):
+    """Returns the names of the configs of a dataset that are prepared in `data_dir`."""
+
+    path = os.path.join(_data_dir(data_dir), dataset)
+
+    if not os.path.isdir(path):
+        return []
+
+    return sorted(name for name in os.listdir(path) if not name.startswith('.') and versions(dataset, name, data_dir))
+
+
+def versions(dataset, config, data_dir=None):
+    """Returns the prepared versions of a dataset config, oldest first."""
+
+    path = os.path.join(_data_dir(data_dir), dataset, config)
+
+    if not os.path.isdir(path):
+        return []
+
+    prepared = [name for name in os.listdir(path)
+                if _VERSION_REGEX.match(name) and os.path.exists(os.path.join(path, name, 'dataset_info.json'))]
+
+    return sorted(prepared, key=lambda version: tuple(int(part) for part in version.split('.')))
+
+
+def dataset_dir(dataset, config, version=None, data_dir=None):
+    """Returns the directory of a prepared dataset config, of its latest version if `version` is `None`."""
+
+    prepared = versions(dataset, config, data_dir)
+
+    if not prepared or (version is not None and version not in prepared):
+        raise FileNotFoundError(f'{dataset}/{config}:{version or "*"} is not prepared in '
+                                f'{_data_dir(data_dir)}, prepared versions: {prepared}')
+
+    return os.path.join(_data_dir(data_dir), dataset, config, version or prepared[-1])
+
+
+def info(dataset, config, version=None, data_dir=None):
+    """Returns the `dataset_info.json` of a prepared dataset config as a `dict`."""
+
+    return _read_json(os.path.join(dataset_dir(dataset, config, version, data_dir), 'dataset_info.json'))
+
+
+def split_counts(dataset, config, version=None, data_dir=None):
+    """Returns a `dict` of split name to the number of examples of a prepared dataset config."""
+
+    return {split['name']: sum(int(length) for length in split.get('shardLengths', []))
+            for split in info(dataset, config, version, data_dir).get('splits', [])}
+
+
+def metadata(dataset, config, version=None, data_dir=None):
+    """Returns the metadata stored by the build, e.g. `channels`, `statistics` and `classes`, empty if there is none."""
+
+    path = os.path.join(dataset_dir(dataset, config, version, data_dir), 'metadata.json')
+    return _read_json(path) if os.path.exists(path) else {}
+
+
+def labels(dataset, config, feature, version=None, data_dir=None):
+    """Returns the label names of a label feature of a prepared dataset config, in label order."""
+
+    return _read_lines(os.path.join(dataset_dir(dataset, config, version, data_dir), f'{feature}.labels.txt'))
+
+
+def class_file(dataset, feature, selection='all'):
+    """Returns the path of the class list of a label feature in the source tree.
+
+    Args:
+      dataset: `str`, one of `DATASETS`.
+      feature: `str`, name of the label feature, e.g. `'species'`.
+      selection: `str`, selection of the builder config, for the datasets with a class list per selection.
+    """
+
+    if dataset not in _CLASS_FILES:
+        raise ValueError(f'Dataset must be one of {DATASETS}')
+
+    return os.path.join(ROOT, dataset, _CLASS_FILES[dataset].format(selection=selection, feature=feature))
+
+
+def class_names(dataset, feature, selection='all'):
+    """Returns the class names of a label feature from the source tree, in label order."""
+
+    return _read_lines(class_file(dataset, feature, selection))
+
+
+def genera(dataset='poldiv'):
+    """Returns the `dict` of species to genus of `poldiv` or `poldiv_balanced`."""
+
+    with open(os.path.join(ROOT, dataset, 'mapping-species-genus.csv')) as f:
+        return {item['species']: item['genus'] for item in csv.DictReader(f, fieldnames=['species', 'genus'])}
+
+
+def measurements(selection):
+    """Returns the measurement prefixes of a romania selection, `None` for all measurements."""
+
+    if selection == 'all':
+        return None
+
+    with open(os.path.join(ROOT, 'romania', f'{selection}-measurements.txt')) as f:
+        return tuple([line.rstrip() for line in f])
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _data_dir(data_dir=None):
+    """Returns the directory of the prepared datasets, `data_dir` if given."""
+
+    return os.path.expanduser(data_dir or os.environ.get('TFDS_DATA_DIR') or '~/tensorflow_datasets')
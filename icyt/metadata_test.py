@@ -0,0 +1,107 @@
+"""Tests for icyt.metadata, on a dataset built from the dummy data."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from icyt import metadata
+from icyt import testing
+from poldiv import poldiv
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_without_tensorflow(self):
+        code = ('import sys\n'
+                'from icyt import metadata\n'
+                'metadata.class_names("poldiv", "species")\n'
+                'print(sorted(name for name in sys.modules if name.split(".")[0] in '
+                '("tensorflow", "tensorflow_datasets", "tifffile", "numpy")))')
+        result = subprocess.run([sys.executable, '-c', code], cwd=metadata.ROOT, capture_output=True, text=True,
+                                check=True)
+
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+class PreparedTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cls.builder = testing.build(poldiv.Poldiv, 'all', cls.data_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_dir)
+
+    def test_configs_and_versions(self):
+        self.assertEqual(metadata.configs('poldiv', self.data_dir), ['all'])
+        self.assertEqual(metadata.versions('poldiv', 'all', self.data_dir), [str(self.builder.version)])
+        self.assertEqual(metadata.configs('romania', self.data_dir), [])
+        self.assertEqual(metadata.dataset_dir('poldiv', 'all', data_dir=self.data_dir), self.builder.data_dir)
+
+        with self.assertRaises(FileNotFoundError):
+            metadata.dataset_dir('poldiv', 'all', '0.0.1', self.data_dir)
+
+    def test_split_counts(self):
+        self.assertEqual(metadata.split_counts('poldiv', 'all', data_dir=self.data_dir),
+                         {split: info.num_examples for split, info in self.builder.info.splits.items()})
+
+    def test_labels(self):
+        for feature in ['species', 'genus']:
+            with self.subTest(feature=feature):
+                labels = metadata.labels('poldiv', 'all', feature, data_dir=self.data_dir)
+
+                self.assertEqual(labels, metadata.class_names('poldiv', feature, 'all'))
+                self.assertEqual(labels, self.builder.info.features[feature].names)
+
+    def test_metadata(self):
+        stored = metadata.metadata('poldiv', 'all', data_dir=self.data_dir)
+
+        self.assertEqual(stored['channels'], list(self.builder.info.metadata['channels']))
+        self.assertIn('statistics', stored)
+
+    def test_default_data_dir(self):
+        with mock.patch.dict(os.environ, {'TFDS_DATA_DIR': self.data_dir}):
+            self.assertEqual(metadata.split_counts('poldiv', 'all'), {'train': 6})
+
+
+class SourceTreeTest(unittest.TestCase):
+
+    def _lines(self, *path):
+        with open(os.path.join(metadata.ROOT, *path)) as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def test_class_names(self):
+        self.assertEqual(metadata.class_names('poldiv', 'genus', 'all'), self._lines('poldiv', 'classes-all-genus.txt'))
+        self.assertEqual(metadata.class_names('romania', 'species', 'metabarcoding2'),
+                         self._lines('romania', 'metabarcoding2-classes-species.txt'))
+        self.assertEqual(metadata.class_names('poldiv_balanced', 'species'),
+                         self._lines('poldiv_balanced', 'classes-species.txt'))
+
+        with self.assertRaises(ValueError):
+            metadata.class_file('pollen', 'species')
+
+    def test_genera(self):
+        for dataset in ['poldiv', 'poldiv_balanced']:
+            with self.subTest(dataset=dataset):
+                mapping = dict(line.split(',') for line in self._lines(dataset, 'mapping-species-genus.csv'))
+                self.assertEqual(metadata.genera(dataset), mapping)
+
+    def test_measurements(self):
+        self.assertIsNone(metadata.measurements('all'))
+
+        for selection in ['artificial-mixtures', 'metabarcoding', 'metabarcoding2', 'metabarcoding3']:
+            with self.subTest(selection=selection):
+                measurements = metadata.measurements(selection)
+
+                self.assertIsInstance(measurements, tuple)
+                self.assertEqual(list(measurements), self._lines('romania', f'{selection}-measurements.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
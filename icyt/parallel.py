@@ -0,0 +1,84 @@
+"""Order-preserving parallel decoding of archive members."""
+
+import collections
+import concurrent.futures
+import functools
+import io
+import os
+
+_PENDING_PER_WORKER = 8
+
+
+def num_workers(config):
+    """Returns the number of decode workers of a builder config.
+
+    Falls back to the `ICYT_NUM_WORKERS` environment variable if `num_workers` is not set, so that the worker count can
+    also be chosen for `tfds build`. Zero means serial decoding in the main process.
+    """
+
+    workers = getattr(config, 'num_workers', None)
+
+    if workers is None:
+        workers = int(os.environ.get('ICYT_NUM_WORKERS', 0))
+
+    if workers < 0:
+        raise ValueError(f'Number of workers must not be negative, got {workers}')
+
+    return workers
+
+
+def imap(fn, path_iter, workers=0):
+    """Applies `fn(filename, fobj)` to all members of `path_iter` and yields the results in archive order.
+
+    The archive is read in the calling process. With `workers > 0` the raw member bytes are handed to a process pool,
+    so `fn` must be picklable, e.g. a module-level function or a `functools.partial` of one. At most a few members per
+    worker are in flight, so memory stays bounded regardless of the archive size.
+
+    Args:
+      fn: callable taking a member name and a file object.
+      path_iter: iterable of `(filename, fobj)` tuples, e.g. from `DownloadManager.iter_archive`.
+      workers: `int`, number of worker processes, 0 decodes serially.
+    """
+
+    if workers == 0:
+        for filename, fobj in path_iter:
+            yield fn(filename, fobj)
+        return
+
+    items = ((filename, fobj.read()) for filename, fobj in path_iter)
+    yield from apply(functools.partial(_apply, fn), items, workers)
+
+
+def apply(fn, items, workers=0):
+    """Applies `fn(item)` to all `items` and yields the results in order.
+
+    Like `imap`, but for arbitrary picklable work items, e.g. groups of archive members that are decoded together. The
+    items are produced lazily in the calling process and at most a few items per worker are in flight.
+
+    Args:
+      fn: picklable callable taking one item.
+      items: iterable of picklable items.
+      workers: `int`, number of worker processes, 0 applies `fn` serially.
+    """
+
+    if workers == 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+
+        for item in items:
+            pending.append(executor.submit(fn, item))
+
+            if len(pending) >= workers * _PENDING_PER_WORKER:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def _apply(fn, item):
+    filename, data = item
+    return fn(filename, io.BytesIO(data))
@@ -0,0 +1,129 @@
+"""Tests for icyt.parallel."""
+
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from icyt import parallel
+from icyt import testing
+from poldiv import poldiv
+
+
+def _square(item):
+    # Later items finish first, so the results complete out of order
+    time.sleep(0.01 * (5 - item % 5))
+    return item * item, os.getpid()
+
+
+def _fail(item):
+    if item == 3:
+        raise ValueError(f'cannot decode {item}')
+
+    return item
+
+
+def _size(filename, fobj):
+    return filename, len(fobj.read())
+
+
+class ApplyTest(unittest.TestCase):
+
+    def test_order(self):
+        results = list(parallel.apply(_square, range(20), workers=2))
+
+        self.assertEqual([result for result, _ in results], [i * i for i in range(20)])
+        self.assertNotIn(os.getpid(), {pid for _, pid in results})
+
+    def test_serial(self):
+        results = list(parallel.apply(_square, range(5)))
+
+        self.assertEqual([result for result, _ in results], [0, 1, 4, 9, 16])
+        self.assertEqual({pid for _, pid in results}, {os.getpid()})
+
+    def test_bounded_pending(self):
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        for workers in [1, 3]:
+            with self.subTest(workers=workers):
+                consumed.clear()
+
+                for yielded, _ in enumerate(parallel.apply(_square, items(), workers)):
+                    self.assertLessEqual(len(consumed) - yielded, workers * parallel._PENDING_PER_WORKER)
+
+                self.assertEqual(len(consumed), 100)
+
+    def test_worker_exception(self):
+        results = parallel.apply(_fail, range(10), workers=2)
+
+        self.assertEqual([next(results) for _ in range(3)], [0, 1, 2])
+
+        with self.assertRaisesRegex(ValueError, 'cannot decode 3'):
+            next(results)
+
+
+class ImapTest(unittest.TestCase):
+
+    def test_members(self):
+        members = [(f'{i}.tif', io.BytesIO(b'x' * i)) for i in range(12)]
+
+        for workers in [0, 2]:
+            with self.subTest(workers=workers):
+                for _, fobj in members:
+                    fobj.seek(0)
+
+                self.assertEqual(list(parallel.imap(_size, iter(members), workers)),
+                                 [(f'{i}.tif', i) for i in range(12)])
+
+    def test_num_workers(self):
+        with mock.patch.dict(os.environ, {'ICYT_NUM_WORKERS': '3'}):
+            self.assertEqual(parallel.num_workers(poldiv.PoldivConfig(name='test', selection='all')), 3)
+            self.assertEqual(parallel.num_workers(poldiv.PoldivConfig(name='test', selection='all', num_workers=0)), 0)
+
+        with self.assertRaises(ValueError):
+            parallel.num_workers(poldiv.PoldivConfig(name='test', selection='all', num_workers=-1))
+
+
+class BuildTest(unittest.TestCase):
+
+    def test_same_records(self):
+        data_dirs = {workers: tempfile.mkdtemp() for workers in ['0', '2']}
+        builders = {}
+
+        try:
+            for workers, data_dir in data_dirs.items():
+                with mock.patch.dict(os.environ, {'ICYT_NUM_WORKERS': workers}):
+                    builders[workers] = testing.build(poldiv.Poldiv, 'all', data_dir)
+
+            serial, pooled = [{example['filename']: example
+                               for example in builder.as_dataset(split='train').as_numpy_iterator()}
+                              for builder in builders.values()]
+
+            self.assertEqual(len(pooled), 6)
+            self.assertEqual(set(pooled), set(serial))
+
+            for filename, example in pooled.items():
+                self.assertEqual(example['species'], serial[filename]['species'])
+
+                for name in example['channels']:
+                    np.testing.assert_array_equal(example['channels'][name], serial[filename]['channels'][name])
+                    np.testing.assert_array_equal(example['masks'][name], serial[filename]['masks'][name])
+
+            self.assertEqual(builders['2'].info.metadata['statistics'], builders['0'].info.metadata['statistics'])
+        finally:
+            for data_dir in data_dirs.values():
+                shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
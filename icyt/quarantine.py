@@ -0,0 +1,107 @@
+"""Quarantine of members that fail to decode.
+
+By default a single member that fails to decode, e.g. a corrupt TIFF or a species without genus, aborts the build. Set
+`ICYT_QUARANTINE=1` (or `quarantine` of the builder config) to skip such members instead. They are recorded with
+their error in `quarantine-<split>.jsonl` next to the shards of the built dataset and summarized in a warning:
+
+    for record in quarantine.load(tfds.builder('poldiv/all'), 'train'):
+        print(record['member'], record['error'])
+"""
+
+import collections
+import json
+import logging
+import os
+import traceback
+
+import tensorflow as tf
+
+# Returned by quarantining decoders instead of raising
+Failed = collections.namedtuple('Failed', ['member', 'error', 'traceback'])
+
+_FAILED_EXAMPLES = 5
+
+
+def enabled(config):
+    """Returns whether a builder config quarantines members that fail to decode.
+
+    Falls back to the `ICYT_QUARANTINE` environment variable if `quarantine` is not set.
+    """
+
+    quarantine = getattr(config, 'quarantine', None)
+
+    if quarantine is None:
+        quarantine = os.environ.get('ICYT_QUARANTINE', '0').lower() in ('1', 'true', 'yes')
+
+    return quarantine
+
+
+def decoder(config, decode_fn):
+    """Returns `decode_fn` returning a `Failed` instead of raising if the builder config quarantines members."""
+
+    if not enabled(config):
+        return decode_fn
+
+    return QuarantinedDecoder(decode_fn)
+
+
+class QuarantinedDecoder:
+    """Decoder that returns a `Failed` for members that raise an `Exception`. Picklable if the wrapped decoder is."""
+
+    def __init__(self, decode_fn):
+        self.decode_fn = decode_fn
+
+    def __call__(self, *args):
+        try:
+            return self.decode_fn(*args)
+        except Exception as e:
+            member = args[0] if isinstance(args[0], str) else repr(args[0])
+            return Failed(member, f'{type(e).__name__}: {e}', traceback.format_exc())
+
+
+def skip_failed(examples, builder, split):
+    """Drops the `Failed` results of a decoder and records them next to the shards of the split.
+
+    Args:
+      examples: iterable of decoder results.
+      builder: the `tfds.core.DatasetBuilder` that is being built.
+      split: `str`, name of the split.
+    """
+
+    failed = []
+
+    for example in examples:
+        if isinstance(example, Failed):
+            failed.append(example)
+            continue
+
+        yield example
+
+    if not failed:
+        return
+
+    path = _path(builder.data_dir, split)
+
+    with tf.io.gfile.GFile(path, 'w') as f:
+        for record in failed:
+            f.write(json.dumps(record._asdict()) + '\n')
+
+    examples = ', '.join(f'{record.member} ({record.error})' for record in failed[:_FAILED_EXAMPLES])
+    logging.warning('Quarantined %d members of split %s that failed to decode, e.g. %s, see %s in the dataset '
+                    'directory', len(failed), split, examples, os.path.basename(path))
+
+
+def load(builder, split):
+    """Returns the records of the quarantined members of a split of a built dataset, empty if there were none."""
+
+    path = _path(builder.data_dir, split)
+
+    if not tf.io.gfile.exists(path):
+        return []
+
+    with tf.io.gfile.GFile(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _path(data_dir, split):
+    return os.path.join(data_dir, f'quarantine-{split}.jsonl')
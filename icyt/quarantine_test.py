@@ -0,0 +1,103 @@
+"""Tests for icyt.quarantine."""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+import tifffile as tiff
+
+from benchmarks import synthetic
+from icyt import ifc
+from icyt import quarantine
+from icyt import testing
+from poldiv import poldiv
+
+_TRUNCATED = '2021/carpinus.betulus_000099.tif'
+
+
+def _decode(filename, fobj):
+    if filename == 'broken.tif':
+        raise ValueError('broken')
+
+    return filename, {'data': fobj}
+
+
+class DecoderTest(unittest.TestCase):
+
+    def test_enabled(self):
+        with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '1'}):
+            self.assertTrue(quarantine.enabled(types.SimpleNamespace(quarantine=None)))
+            self.assertFalse(quarantine.enabled(types.SimpleNamespace(quarantine=False)))
+
+        with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '0'}):
+            self.assertFalse(quarantine.enabled(types.SimpleNamespace()))
+
+    def test_decoder(self):
+        decode = quarantine.decoder(types.SimpleNamespace(quarantine=True), _decode)
+        failed = decode('broken.tif', None)
+
+        self.assertEqual(decode('a.tif', 1), ('a.tif', {'data': 1}))
+        self.assertEqual((failed.member, failed.error), ('broken.tif', 'ValueError: broken'))
+        self.assertIn('Traceback', failed.traceback)
+
+        self.assertIs(quarantine.decoder(types.SimpleNamespace(quarantine=False), _decode), _decode)
+
+    def test_skip_failed(self):
+        builder = types.SimpleNamespace(data_dir=tempfile.mkdtemp())
+        failed = quarantine.Failed('broken.tif', 'ValueError: broken', '')
+
+        with self.assertLogs(level='WARNING'):
+            examples = list(quarantine.skip_failed([('a.tif', {}), failed, None], builder, 'train'))
+
+        self.assertEqual(examples, [('a.tif', {}), None])
+        self.assertEqual(quarantine.load(builder, 'train'), [failed._asdict()])
+        self.assertEqual(quarantine.load(builder, 'test'), [])
+
+        shutil.rmtree(builder.data_dir)
+
+
+class BuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.manual_dir = tempfile.mkdtemp()
+
+        buffer = io.BytesIO()
+        tiff.imwrite(buffer, synthetic.ifc_image(np.random.default_rng(0), 18, 40, 50,
+                                                 masks=ifc.POLDIV_LAYOUTS[18].masks))
+        data = buffer.getvalue()
+        testing.add_members(poldiv.Poldiv, 'poldiv-dataset-3.0.0.tar.gz', [(_TRUNCATED, data[:len(data) // 2])],
+                            self.manual_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        shutil.rmtree(self.manual_dir)
+
+    def test_truncated_tiff(self):
+        with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '1'}):
+            builder = testing.build(poldiv.Poldiv, 'all', self.data_dir, manual_dir=self.manual_dir)
+
+        filenames = [example['filename'].decode() for example in builder.as_dataset(split='train').as_numpy_iterator()]
+
+        with open(os.path.join(builder.data_dir, 'quarantine-train.jsonl')) as f:
+            records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(filenames), 6)
+        self.assertNotIn(_TRUNCATED, filenames)
+        self.assertEqual([record['member'] for record in records], [_TRUNCATED])
+        self.assertTrue(records[0]['error'].startswith('ValueError: '))
+
+    def test_raises_without_quarantine(self):
+        with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '0'}):
+            with self.assertRaises(Exception):
+                testing.build(poldiv.Poldiv, 'all', self.data_dir, manual_dir=self.manual_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Random access to the iCyt datasets built in the ArrayRecord format.
+
+TFRecord shards are read sequentially, so shuffling needs a large shuffle buffer and an example cannot be read without
+the records before it. Datasets built with `tfds build --file_format=array_record` are read by record position instead:
+
+    reader = random_access.Reader('poldiv/all:3.0.0', 'train', seed=0, num_workers=8, worker=rank)
+    example = reader[42]
+
+    for example in reader.iterate(start=step * batch_size):
+        ...
+
+Every epoch is a permutation of all examples, or of the `positions` selected with `index.Index`, drawn from `seed` and
+the epoch number, so it is the same on all workers and after a restart. Every worker reads only its strided part of
+the permutation, and `iterate(start)` resumes exactly at the `start`-th example of the worker.
+"""
+
+import numpy as np
+import tensorflow_datasets as tfds
+
+# Number of records requested from the data source at once
+_READ_SIZE = 64
+
+
+class Reader:
+    """Random-access reader of one split of a dataset built in the ArrayRecord format."""
+
+    def __init__(self, builder, split='train', positions=None, shuffle=True, seed=0, num_workers=1, worker=0,
+                 decoders=None, data_dir=None):
+        """Constructs a Reader.
+
+        Args:
+          builder: the `tfds.core.DatasetBuilder` of a dataset built in the ArrayRecord format, or its name, e.g.
+            `'poldiv/all:3.0.0'`.
+          split: `str`, name of the split.
+          positions: boolean mask or array of the record positions to read, e.g. from `index.Index`, `None` reads all.
+          shuffle: `bool`, whether every epoch is a new permutation of the positions, otherwise they are read in order.
+          seed: `int`, seed of the permutations, the same on all workers.
+          num_workers: `int`, number of data-parallel workers that read disjoint parts of every epoch.
+          worker: `int`, index of this worker, from 0 to `num_workers - 1`.
+          decoders: nested `dict` of `tfds.decode.Decoder`s forwarded to `as_data_source`.
+          data_dir: `str`, directory of the built datasets if `builder` is a name.
+        """
+
+        if num_workers < 1:
+            raise ValueError(f'Number of workers must be positive, got {num_workers}')
+
+        if not 0 <= worker < num_workers:
+            raise ValueError(f'Worker must be between 0 and {num_workers - 1}, got {worker}')
+
+        if isinstance(builder, str):
+            builder = tfds.builder(builder, data_dir=data_dir)
+
+        self.source = builder.as_data_source(split=split, decoders=decoders)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_workers = num_workers
+        self.worker = worker
+
+        if positions is None:
+            self.positions = np.arange(len(self.source), dtype=np.int64)
+        else:
+            positions = np.asarray(positions)
+            self.positions = np.flatnonzero(positions) if positions.dtype == bool else np.unique(positions)
+
+        if len(self.positions) < num_workers:
+            raise ValueError(f'{len(self.positions)} examples cannot be split among {num_workers} workers')
+
+    def __len__(self):
+        """Returns the number of examples of this worker per epoch, the same for all workers."""
+
+        return len(self.positions) // self.num_workers
+
+    def __getitem__(self, position):
+        """Returns the example at a record position of the split."""
+
+        return self.source[int(position)]
+
+    def read(self, positions):
+        """Returns the examples at record positions of the split, read together."""
+
+        return self.source.__getitems__([int(position) for position in positions])
+
+    def epoch(self, epoch):
+        """Returns the record positions this worker reads in an epoch, in reading order."""
+
+        positions = self.positions
+
+        if self.shuffle:
+            positions = np.random.default_rng([self.seed, epoch]).permutation(positions)
+
+        return positions[self.worker:len(self) * self.num_workers:self.num_workers]
+
+    def iterate(self, start=0, num_epochs=None):
+        """Yields the examples of this worker, epoch after epoch.
+
+        Args:
+          start: `int`, number of examples this worker already read, e.g. the restored step times the batch size. The
+            first yielded example is the one that followed them.
+          num_epochs: `int`, number of epochs, counted from the first one, after which to stop, `None` never stops.
+        """
+
+        epoch, offset = divmod(start, len(self))
+
+        while num_epochs is None or epoch < num_epochs:
+            positions = self.epoch(epoch)
+
+            for begin in range(offset, len(positions), _READ_SIZE):
+                yield from self.read(positions[begin:begin + _READ_SIZE])
+
+            epoch, offset = epoch + 1, 0
@@ -0,0 +1,88 @@
+"""Tests for icyt.random_access, on a dataset built in the ArrayRecord format from the dummy data."""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from icyt import index
+from icyt import random_access
+from icyt import testing
+from poldiv import poldiv
+
+
+class ReaderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cls.builder = testing.build(poldiv.Poldiv, 'all', cls.data_dir, file_format='array_record')
+        cls.filenames = index.load(cls.builder, 'train')['filename']
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_dir)
+
+    def _reader(self, **kwargs):
+        return random_access.Reader(self.builder, 'train', **kwargs)
+
+    def _filenames(self, examples):
+        return [example['filename'].decode() for example in examples]
+
+    def test_random_access(self):
+        reader = self._reader()
+
+        self.assertEqual(len(reader), 6)
+        self.assertEqual(reader[4]['filename'].decode(), self.filenames[4])
+        self.assertEqual(self._filenames(reader.read([5, 0, 3])), list(self.filenames[[5, 0, 3]]))
+
+    def test_epoch_permutation(self):
+        reader = self._reader(seed=3)
+        epochs = [reader.epoch(epoch) for epoch in range(4)]
+
+        for positions in epochs:
+            self.assertEqual(sorted(positions), list(range(6)))
+
+        self.assertGreater(len({tuple(positions) for positions in epochs}), 1)
+        np.testing.assert_array_equal(self._reader(seed=3).epoch(2), epochs[2])
+        np.testing.assert_array_equal(self._reader(shuffle=False).epoch(2), np.arange(6))
+
+    def test_worker_striding(self):
+        for positions in [None, [0, 1, 2, 3, 5]]:
+            with self.subTest(positions=positions):
+                readers = [self._reader(positions=positions, num_workers=2, worker=worker) for worker in range(2)]
+                expected = self._reader(positions=positions).positions
+
+                for epoch in range(3):
+                    parts = [reader.epoch(epoch) for reader in readers]
+
+                    # Every worker reads the same number of examples, the remainder of the epoch is dropped
+                    self.assertEqual([len(part) for part in parts], [len(expected) // 2] * 2)
+                    self.assertEqual(set(parts[0]) & set(parts[1]), set())
+                    self.assertTrue(set(parts[0]) | set(parts[1]) <= set(expected))
+
+    def test_positions(self):
+        mask = np.array([True, False, True, False, False, True])
+
+        np.testing.assert_array_equal(self._reader(positions=mask).positions, [0, 2, 5])
+        np.testing.assert_array_equal(self._reader(positions=[5, 0, 2, 2]).positions, [0, 2, 5])
+
+    def test_resume(self):
+        reader = self._reader(seed=1, num_workers=2, worker=1)
+        examples = self._filenames(reader.iterate(num_epochs=3))
+
+        self.assertEqual(examples, [self.filenames[p] for epoch in range(3) for p in reader.epoch(epoch)])
+
+        for start in [1, 3, 5, 9]:
+            with self.subTest(start=start):
+                self.assertEqual(self._filenames(reader.iterate(start=start, num_epochs=3)), examples[start:])
+
+    def test_invalid(self):
+        for kwargs in [{'num_workers': 0}, {'num_workers': 2, 'worker': 2}, {'num_workers': 7}]:
+            with self.assertRaises(ValueError):
+                self._reader(**kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
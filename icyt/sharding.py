@@ -0,0 +1,99 @@
+"""Class-sharded output of the iCyt datasets.
+
+Builder configs with `shard_by` set write the examples of a split grouped by a class label instead of shuffled, so
+every class occupies one contiguous range of records and only a few shards. The examples are keyed by their position
+in the class order and written with shuffling disabled. `sample_by_class` reads every class as a separate dataset and
+samples from them with the given weights, so class-balanced batches need neither a large shuffle buffer nor `filter`.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from icyt import ifc
+from icyt import index
+from icyt import quarantine
+
+
+def order(members, label_fn, names):
+    """Orders archive members by class, keeping the archive order within a class.
+
+    Args:
+      members: list of archive members with a `name`, e.g. `archive.Member`s.
+      label_fn: callable mapping a member name to its class name.
+      names: list of `str`, class names in label order. Members of other classes are ordered last.
+
+    Returns:
+      `(members, keys)` tuple of the ordered members and their integer example keys.
+    """
+
+    labels = {name: label for label, name in enumerate(names)}
+    members = sorted(members, key=lambda member: labels.get(label_fn(member.name), len(names)))
+    return members, list(range(len(members)))
+
+
+def rekey(examples, keys):
+    """Replaces the keys of decoded examples by the keys returned by `order`.
+
+    Args:
+      examples: iterable of decoder results in member order, `(key, features)` tuples, `None`, `ifc.Unknown`s or
+        `quarantine.Failed`s.
+      keys: list of `int`, example keys in member order.
+    """
+
+    for key, example in zip(keys, examples):
+        if example is None or isinstance(example, (ifc.Unknown, quarantine.Failed)):
+            yield example
+        else:
+            yield key, example[1]
+
+
+def class_counts(columns, column, names):
+    """Returns the number of examples and the record range of every class in the index columns of a split."""
+
+    counts = {}
+
+    for label in np.unique(columns[column]):
+        positions = columns['position'][columns[column] == label]
+        counts[names[label]] = {'count': len(positions), 'start': int(positions.min()), 'end': int(positions.max()) + 1}
+
+    return counts
+
+
+def sample_by_class(builder, split='train', column=None, weights=None, seed=None, **as_dataset_kwargs):
+    """Returns a dataset that samples the classes of a split with the given weights.
+
+    Every class is read as a separately repeated dataset from its records in the index, which is a single contiguous
+    slice for class-sharded configs. The result is infinite, use `take` to limit it.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder` of a built dataset.
+      split: `str`, name of the split.
+      column: `str`, class label to balance, defaults to the `shard_by` option of the builder config.
+      weights: `dict` of class name to sampling weight, classes without weight are not sampled. `None` samples all
+        classes of the split with equal probability.
+      seed: `int`, seed of the sampling.
+      **as_dataset_kwargs: keyword arguments forwarded to `builder.as_dataset`, e.g. `decoders` or `read_config`.
+    """
+
+    column = column or getattr(builder.builder_config, 'shard_by', None)
+
+    if column is None:
+        raise ValueError('The class column must be given for configs that are not sharded by class')
+
+    ix = index.load(builder, split)
+    names = ix.names(column)
+    weights = weights or {name: 1. for name in np.unique(names)}
+    datasets, class_weights = [], []
+
+    for name, weight in weights.items():
+        if weight <= 0:
+            continue
+
+        if not np.any(names == name):
+            raise ValueError(f'Class {name} has no examples in split {split}')
+
+        datasets.append(builder.as_dataset(split=ix.select(names == name), **as_dataset_kwargs).repeat())
+        class_weights.append(weight)
+
+    class_weights = np.asarray(class_weights) / np.sum(class_weights)
+    return tf.data.Dataset.sample_from_datasets(datasets, weights=class_weights.tolist(), seed=seed)
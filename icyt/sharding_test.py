@@ -0,0 +1,127 @@
+"""Tests for icyt.sharding and icyt.grouping."""
+
+import collections
+import os
+import tempfile
+import types
+import unittest
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+from icyt import archive
+from icyt import grouping
+from icyt import ifc
+from icyt import quarantine
+from icyt import sharding
+
+_NAMES = ['betula', 'corylus', 'urtica']
+
+
+class _Builder:
+    """Built dataset of one split whose examples are their class names, read through the index."""
+
+    def __init__(self, labels, shard_by='species'):
+        self.data_dir = tempfile.mkdtemp()
+        self.builder_config = types.SimpleNamespace(shard_by=shard_by)
+        self.info = types.SimpleNamespace(features=tfds.features.FeaturesDict({
+            'species': tfds.features.ClassLabel(names=_NAMES)}), metadata={})
+        self.labels = np.asarray(labels)
+
+        np.savez(os.path.join(self.data_dir, 'index-train.npz'), species=self.labels,
+                 position=np.arange(len(self.labels)))
+
+    def as_dataset(self, split):
+        info = tfds.core.SplitInfo(name='train', shard_lengths=[len(self.labels)], num_bytes=0)
+        positions = [position for absolute in split.to_absolute({'train': info})
+                     for position in range(len(self.labels))[absolute.from_:absolute.to]]
+        return tf.data.Dataset.from_tensor_slices(np.asarray(_NAMES)[self.labels[positions]])
+
+
+class OrderTest(unittest.TestCase):
+
+    def test_by_class_in_archive_order(self):
+        members = [archive.Member(name, 0, 0) for name in ['u1', 'b1', 'x1', 'c1', 'u2', 'b2']]
+        labels = {'u': 'urtica', 'b': 'betula', 'c': 'corylus'}
+        ordered, keys = sharding.order(members, lambda name: labels.get(name[0]), _NAMES)
+
+        self.assertEqual([member.name for member in ordered], ['b1', 'b2', 'c1', 'u1', 'u2', 'x1'])
+        self.assertEqual(keys, list(range(6)))
+
+    def test_rekey(self):
+        failed = quarantine.Failed('c.tif', 'ValueError', 'broken')
+        unknown = ifc.Unknown('d.tif', 3)
+        examples = [('a.tif', {'a': 1}), None, failed, unknown, ('e.tif', {'e': 5})]
+
+        self.assertEqual(list(sharding.rekey(examples, [10, 11, 12, 13, 14])),
+                         [(10, {'a': 1}), None, failed, unknown, (14, {'e': 5})])
+
+
+class SampleByClassTest(unittest.TestCase):
+
+    def setUp(self):
+        # Class-sharded records, 90 betula, 9 corylus and 1 urtica
+        self.builder = _Builder(np.repeat([0, 1, 2], [90, 9, 1]))
+
+    def _counts(self, dataset, n=3000):
+        return collections.Counter(name.decode() for name in dataset.take(n).as_numpy_iterator())
+
+    def test_balanced(self):
+        counts = self._counts(sharding.sample_by_class(self.builder, seed=0))
+
+        self.assertEqual(set(counts), set(_NAMES))
+
+        for name in _NAMES:
+            self.assertAlmostEqual(counts[name] / 3000, 1 / 3, delta=0.05)
+
+    def test_weights(self):
+        counts = self._counts(sharding.sample_by_class(self.builder, weights={'urtica': 3., 'betula': 1., 'corylus': 0.},
+                                                       seed=0))
+
+        self.assertEqual(set(counts), {'urtica', 'betula'})
+        self.assertAlmostEqual(counts['urtica'] / 3000, 0.75, delta=0.05)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            sharding.sample_by_class(_Builder([0, 1], shard_by=None))
+
+        with self.assertRaises(ValueError):
+            sharding.sample_by_class(_Builder([0, 1]), weights={'urtica': 1.})
+
+
+class GroupingTest(unittest.TestCase):
+
+    def test_validate(self):
+        grouping.validate(None, ['species', 'size'])
+        grouping.validate('size', ['species', 'size'])
+        grouping.validate('species', ['species', 'size'], size=64)
+
+        with self.assertRaises(ValueError):
+            grouping.validate('genus', ['species', 'size'])
+
+        for options in [{'size': 64}, {'crop_margin': 4}]:
+            with self.assertRaises(ValueError):
+                grouping.validate('size', ['species', 'size'], **options)
+
+    def test_class_counts(self):
+        builder = _Builder(np.repeat([0, 2], [3, 2]))
+        grouping.write_counts(builder, {'train': {'species': builder.labels, 'position': np.arange(5)}})
+
+        self.assertEqual(builder.info.metadata['classes'], {'train': {
+            'betula': {'count': 3, 'start': 0, 'end': 3},
+            'urtica': {'count': 2, 'start': 3, 'end': 5},
+        }})
+
+    def test_shuffled(self):
+        builder = _Builder([0], shard_by=None)
+        members = [archive.Member('a', 0, 0)]
+
+        self.assertEqual(grouping.order(builder, None, members, None, None), (members, None))
+
+        grouping.write_counts(builder, {'train': {}})
+        self.assertEqual(builder.info.metadata, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,318 @@
+"""Per-channel normalization statistics of the built iCyt datasets.
+
+Every build of the IFC datasets stores the pixel statistics of each channel and split in the dataset metadata, so
+training jobs normalize the images without a pass over the data of their own:
+
+    builder = tfds.builder('poldiv/all')
+    statistics = builder.info.metadata['statistics']['train']['1']
+    statistics['mean'], statistics['std'], statistics['percentiles']['99']
+    statistics['foreground']['mean']  # pixels inside the mask of the channel
+
+The decoders wrapped by `decoder` accumulate the statistics of each example where it is decoded, i.e. in the worker
+processes of parallel builds, and `collect` merges them while the builders generate a split, so no image is decoded
+twice. Only splits whose images reach the generator encoded, i.e. Beam builds and builds that read members from the
+decode cache, are accumulated in a pass over the written records by `write`. Mean and variance are merged with the parallel variant of Welford's algorithm and
+the percentiles are read from a histogram with one bin per pixel value between the minimum and the maximum, so the
+accumulators of examples, shards or workers can be merged in any order.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from icyt import beam
+from icyt import connectors
+from icyt import ifc
+from icyt import index
+from icyt import quarantine
+
+PERCENTILES = [0.1, 1, 5, 25, 50, 75, 95, 99, 99.9]
+
+# Features key of the partial statistics added by `StatisticsDecoder` and removed by `collect`
+_STATISTICS = '_icyt_statistics'
+
+
+class Accumulator:
+    """Streaming, mergeable statistics of the unsigned integer pixel values of one channel."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        # Counts of the values from `offset` to `offset + len(histogram) - 1`
+        self.offset = 0
+        self.histogram = np.zeros(0, dtype=np.int64)
+
+    def update(self, values):
+        """Adds an array of pixel values."""
+
+        values = np.asarray(values).ravel()
+
+        if values.size == 0:
+            return
+
+        other = Accumulator()
+        other.count = values.size
+        other.mean = float(values.mean(dtype=np.float64))
+        other.m2 = float(np.square(values - other.mean).sum())
+        other.offset = int(values.min())
+        other.histogram = np.bincount(values - values.dtype.type(other.offset))
+        self.merge(other)
+
+    def merge(self, other):
+        """Adds the values of another `Accumulator`."""
+
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+
+        if self.count == 0:
+            self.offset, self.histogram = other.offset, other.histogram.copy()
+        else:
+            self._extend(other.offset, other.offset + len(other.histogram))
+            start = other.offset - self.offset
+            self.histogram[start:start + len(other.histogram)] += other.histogram
+
+        self.count = count
+
+    def _extend(self, start, end):
+        """Grows the histogram to cover the values from `start` to `end - 1`."""
+
+        offset = min(self.offset, start)
+        end = max(self.offset + len(self.histogram), end)
+
+        if offset == self.offset and end == self.offset + len(self.histogram):
+            return
+
+        histogram = np.zeros(end - offset, dtype=np.int64)
+        histogram[self.offset - offset:self.offset - offset + len(self.histogram)] = self.histogram
+        self.offset, self.histogram = offset, histogram
+
+    def result(self):
+        """Returns the statistics as a JSON-serializable `dict`."""
+
+        if self.count == 0:
+            return {'count': 0}
+
+        values = np.flatnonzero(self.histogram) + self.offset
+        cdf = np.cumsum(self.histogram)
+
+        return {
+            'count': int(self.count),
+            'mean': self.mean,
+            'std': float(np.sqrt(self.m2 / self.count)),
+            'min': int(values[0]),
+            'max': int(values[-1]),
+            'percentiles': {f'{q:g}': int(np.searchsorted(cdf, q / 100 * self.count)) + self.offset
+                            for q in PERCENTILES},
+        }
+
+
+class Collector:
+    """Statistics of the channels of one split, accumulated from decoded examples."""
+
+    def __init__(self, names, masks=False):
+        """Constructs a Collector.
+
+        Args:
+          names: list of `str`, channel names in stacking order.
+          masks: `bool`, whether the examples have masks for the `foreground` statistics.
+        """
+
+        self.names = names
+        self.pixels = {name: Accumulator() for name in names}
+        self.foreground = {name: Accumulator() for name in names} if masks else None
+        self.complete = True
+
+    def update(self, features):
+        """Adds the `channels` and `masks` of an example, marks the collector incomplete if they are encoded."""
+
+        if not self.complete or _encoded(features['channels']):
+            self.complete = False
+            return
+
+        channels = _by_channel(features['channels'], self.names)
+        masks = _by_channel(features['masks'], self.names) if self.foreground is not None else None
+
+        for name in self.names:
+            self.pixels[name].update(channels[name])
+
+            if masks is not None:
+                self.foreground[name].update(channels[name][masks[name] != 0])
+
+    def merge(self, other):
+        """Adds the statistics of another `Collector`, marks the collector incomplete if the other one is."""
+
+        if not self.complete or not other.complete:
+            self.complete = False
+            return
+
+        for name in self.names:
+            self.pixels[name].merge(other.pixels[name])
+
+            if self.foreground is not None:
+                self.foreground[name].merge(other.foreground[name])
+
+    def result(self):
+        """Returns `dict` of channel name to statistics, with the statistics inside the masks under `foreground`."""
+
+        statistics = {}
+
+        for name in self.names:
+            statistics[name] = self.pixels[name].result()
+
+            if self.foreground is not None:
+                statistics[name]['foreground'] = self.foreground[name].result()
+
+        return statistics
+
+
+def decoder(builder, decode_fn):
+    """Returns `decode_fn` adding the statistics of each decoded example for `collect`, unless built with Beam.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder` that is being built.
+      decode_fn: decoder returning `(key, features)` tuples, `None`, `ifc.Unknown` or `quarantine.Failed`.
+    """
+
+    if beam.enabled(builder.builder_config):
+        return decode_fn
+
+    return StatisticsDecoder(decode_fn, list(builder.info.metadata['channels']), 'masks' in builder.info.features.keys())
+
+
+class StatisticsDecoder:
+    """Decoder that adds a `Collector` of each decoded example to its features, so the pixels are accumulated where the
+    example is decoded and only merged by `collect`. Picklable if the wrapped decoder is."""
+
+    def __init__(self, decode_fn, names, masks):
+        self.decode_fn = decode_fn
+        self.names = names
+        self.masks = masks
+
+    def __call__(self, *args):
+        example = self.decode_fn(*args)
+
+        if example is None or isinstance(example, (ifc.Unknown, quarantine.Failed)):
+            return example
+
+        collector = Collector(self.names, self.masks)
+        collector.update(example[1])
+        example[1][_STATISTICS] = collector
+        return example
+
+
+# Statistics of the splits generated by `collect`, keyed by the data dir of the build and the split name
+_collected = {}
+
+
+def collect(examples, builder, split):
+    """Yields the `(key, features)` examples of a split and accumulates their statistics for `write`.
+
+    The statistics added by a `StatisticsDecoder` are merged and removed from the features, the statistics of other
+    examples are accumulated here.
+
+    Args:
+      examples: iterable of `(key, features)` tuples with `channels` and optionally `masks` images.
+      builder: the `tfds.core.DatasetBuilder` that is being built.
+      split: `str`, name of the split.
+    """
+
+    collector = _collector(builder)
+    _collected.pop((builder.data_dir, split), None)
+
+    for example in examples:
+        partial = example[1].pop(_STATISTICS, None)
+
+        if partial is not None:
+            collector.merge(partial)
+        else:
+            collector.update(example[1])
+
+        yield example
+
+    if collector.complete:
+        _collected[builder.data_dir, split] = collector.result()
+
+
+def write(builder):
+    """Stores the statistics of every split of a dataset that was just generated in its metadata.
+
+    The statistics accumulated by `collect` are used as they are. Splits without them are accumulated in a pass over
+    their written records.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder`, called at the end of its `_download_and_prepare`. Its features need
+        `channels` and optionally `masks` images, and its metadata the channel names under `channels`.
+
+    Returns:
+      `dict` of split name to channel name to statistics, with the statistics of the pixels inside the mask of the
+      channel under `foreground` if the dataset has masks.
+    """
+
+    features = builder.info.features
+    statistics = {}
+
+    for split in builder.info.splits.keys():
+        statistics[split] = _collected.pop((builder.data_dir, split), None)
+
+        if statistics[split] is not None:
+            continue
+
+        collector = _collector(builder)
+        dataset = index.records(builder, split)
+        dataset = dataset.map(features.deserialize_example, num_parallel_calls=tf.data.AUTOTUNE)
+
+        for example in dataset.as_numpy_iterator():
+            collector.update(example)
+
+        statistics[split] = collector.result()
+
+    builder.info.metadata['statistics'] = statistics
+    return statistics
+
+
+def normalization(builder, split='train', foreground=False):
+    """Returns the per-channel mean and standard deviation of a built dataset in channel order.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder` of a built dataset.
+      split: `str`, name of the split the statistics were computed on.
+      foreground: `bool`, whether to return the statistics of the pixels inside the masks.
+
+    Returns:
+      `(mean, std)` tuple of `np.ndarray`s of shape `(channels,)`, in the order of `builder.info.metadata['channels']`.
+    """
+
+    if 'statistics' not in builder.info.metadata:
+        raise KeyError(f'No statistics in the metadata of {builder.name}, rebuild the dataset to compute them')
+
+    statistics = builder.info.metadata['statistics'][split]
+    channels = [statistics[name]['foreground'] if foreground else statistics[name]
+                for name in builder.info.metadata['channels']]
+
+    return (np.array([channel['mean'] for channel in channels], dtype=np.float32),
+            np.array([channel['std'] for channel in channels], dtype=np.float32))
+
+
+def _collector(builder):
+    return Collector(list(builder.info.metadata['channels']), 'masks' in builder.info.features.keys())
+
+
+def _encoded(image):
+    if isinstance(image, dict):
+        return any(isinstance(value, connectors.Encoded) for value in image.values())
+
+    return isinstance(image, connectors.Encoded)
+
+
+def _by_channel(image, names):
+    """Returns a `dict` of 2D channel images for both the channels and the stacked layout."""
+
+    if isinstance(image, dict):
+        return image
+
+    return {name: image[..., i] for i, name in enumerate(names)}
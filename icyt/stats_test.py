@@ -0,0 +1,195 @@
+"""Tests for icyt.stats."""
+
+import types
+import unittest
+
+import numpy as np
+import tensorflow_datasets as tfds
+
+from icyt import connectors
+from icyt import stats
+
+
+def _accumulate(values):
+    accumulator = stats.Accumulator()
+    accumulator.update(values)
+    return accumulator
+
+
+class AccumulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.parts = [rng.integers(0, 4096, size=size, dtype=np.uint16) for size in [1, 1000, 57, 20000]]
+        self.values = np.concatenate(self.parts)
+
+    def test_statistics(self):
+        result = _accumulate(self.values).result()
+
+        self.assertEqual(result['count'], len(self.values))
+        self.assertAlmostEqual(result['mean'], self.values.mean(), places=6)
+        self.assertAlmostEqual(result['std'], self.values.std(), places=6)
+        self.assertEqual((result['min'], result['max']), (self.values.min(), self.values.max()))
+
+    def test_percentiles(self):
+        percentiles = _accumulate(self.values).result()['percentiles']
+
+        self.assertEqual(list(percentiles), [f'{q:g}' for q in stats.PERCENTILES])
+
+        for q in stats.PERCENTILES:
+            self.assertEqual(percentiles[f'{q:g}'], np.percentile(self.values, q, method='inverted_cdf'))
+
+    def test_percentiles_of_constant(self):
+        percentiles = _accumulate(np.full(10, 7, dtype=np.uint16)).result()['percentiles']
+        self.assertEqual(set(percentiles.values()), {7})
+
+    def test_merge_in_any_order(self):
+        expected = _accumulate(self.values).result()
+
+        for order in [[0, 1, 2, 3], [3, 2, 1, 0], [2, 0, 3, 1]]:
+            merged = stats.Accumulator()
+
+            for i in order:
+                merged.merge(_accumulate(self.parts[i]))
+
+            result = merged.result()
+            self.assertEqual(result['count'], expected['count'])
+            self.assertAlmostEqual(result['mean'], expected['mean'], places=6)
+            self.assertAlmostEqual(result['std'], expected['std'], places=6)
+            self.assertEqual(result['percentiles'], expected['percentiles'])
+
+    def test_merge_empty(self):
+        accumulator = _accumulate(self.values)
+        accumulator.merge(stats.Accumulator())
+        accumulator.update(np.array([], dtype=np.uint16))
+
+        self.assertEqual(accumulator.result(), _accumulate(self.values).result())
+
+        empty = stats.Accumulator()
+        empty.merge(stats.Accumulator())
+        self.assertEqual(empty.result(), {'count': 0})
+
+    def test_histogram_covers_value_range(self):
+        accumulator = _accumulate(np.array([1000, 1003, 1001], dtype=np.uint16))
+
+        self.assertEqual((accumulator.offset, len(accumulator.histogram)), (1000, 4))
+
+        accumulator.merge(_accumulate(np.array([990, 1001], dtype=np.uint16)))
+        accumulator.merge(_accumulate(np.array([65535], dtype=np.uint16)))
+
+        self.assertEqual((accumulator.offset, len(accumulator.histogram)), (990, 65535 - 990 + 1))
+        self.assertEqual(accumulator.result()['percentiles']['50'], 1001)
+        self.assertEqual((accumulator.result()['min'], accumulator.result()['max']), (990, 65535))
+
+
+class CollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.names = ['1', '9']
+        self.examples = []
+
+        for i in range(3):
+            channels = {name: rng.integers(0, 4096, size=(5, 6), dtype=np.uint16) for name in self.names}
+            masks = {name: (rng.random((5, 6)) > 0.5).astype(np.uint16) for name in self.names}
+            self.examples.append((str(i), {'channels': channels, 'masks': masks}))
+
+    def test_channels_and_foreground(self):
+        collector = stats.Collector(self.names, masks=True)
+
+        for _, features in self.examples:
+            collector.update(features)
+
+        result = collector.result()
+
+        for name in self.names:
+            pixels = np.concatenate([features['channels'][name].ravel() for _, features in self.examples])
+            foreground = np.concatenate([features['channels'][name][features['masks'][name] != 0]
+                                         for _, features in self.examples])
+
+            self.assertAlmostEqual(result[name]['mean'], pixels.mean(), places=6)
+            self.assertAlmostEqual(result[name]['foreground']['mean'], foreground.mean(), places=6)
+            self.assertEqual(result[name]['foreground']['count'], len(foreground))
+
+    def test_stacked(self):
+        channels = stats.Collector(self.names, masks=True)
+        stacked = stats.Collector(self.names, masks=True)
+
+        for _, features in self.examples:
+            channels.update(features)
+            stacked.update({key: np.stack([image[name] for name in self.names], axis=-1)
+                            for key, image in features.items()})
+
+        self.assertEqual(channels.result(), stacked.result())
+
+    def test_encoded(self):
+        collector = stats.Collector(self.names)
+        collector.update(self.examples[0][1])
+        collector.update({'channels': {name: connectors.Encoded(b'') for name in self.names}})
+        collector.update(self.examples[1][1])
+
+        self.assertFalse(collector.complete)
+
+    def test_merge(self):
+        expected = stats.Collector(self.names, masks=True)
+        merged = stats.Collector(self.names, masks=True)
+
+        for _, features in self.examples:
+            expected.update(features)
+            partial = stats.Collector(self.names, masks=True)
+            partial.update(features)
+            merged.merge(partial)
+
+        self.assertEqual(merged.result(), expected.result())
+
+        incomplete = stats.Collector(self.names, masks=True)
+        incomplete.complete = False
+        merged.merge(incomplete)
+        self.assertFalse(merged.complete)
+
+    def test_decoder(self):
+        builder = types.SimpleNamespace(builder_config=types.SimpleNamespace(use_beam=False),
+                                        info=types.SimpleNamespace(metadata={'channels': self.names},
+                                                                   features={'channels': None, 'masks': None}))
+        examples = dict(self.examples)
+        decode_fn = lambda key: (key, dict(examples[key])) if key in examples else None
+
+        self.assertIsNone(stats.decoder(builder, decode_fn)('unknown'))
+        self.assertIsInstance(stats.decoder(builder, decode_fn)('0')[1][stats._STATISTICS], stats.Collector)
+
+        builder.builder_config.use_beam = True
+        self.assertNotIn(stats._STATISTICS, stats.decoder(builder, decode_fn)('0')[1])
+
+    def test_collect(self):
+        builder = types.SimpleNamespace(data_dir='/tmp/collect', info=types.SimpleNamespace(
+            features=tfds.features.FeaturesDict({'channels': connectors.image(self.names, np.uint16)}),
+            metadata={'channels': self.names}))
+
+        self.assertEqual(list(stats.collect(iter(self.examples), builder, 'train')), self.examples)
+
+        collected = stats._collected.pop(('/tmp/collect', 'train'))
+        self.assertEqual(collected['9']['count'], 3 * 5 * 6)
+        self.assertNotIn('foreground', collected['9'])
+
+    def test_collect_decoded_statistics(self):
+        builder = types.SimpleNamespace(data_dir='/tmp/collect', builder_config=types.SimpleNamespace(use_beam=False),
+                                        info=types.SimpleNamespace(
+                                            features=tfds.features.FeaturesDict({
+                                                'channels': connectors.image(self.names, np.uint16)}),
+                                            metadata={'channels': self.names}))
+        examples = dict(self.examples)
+        decode = stats.decoder(builder, lambda key: (key, {'channels': examples[key]['channels']}))
+
+        collected = list(stats.collect(map(decode, ['0', '1', '2']), builder, 'train'))
+
+        self.assertEqual([key for key, _ in collected], ['0', '1', '2'])
+        self.assertTrue(all(set(features) == {'channels'} for _, features in collected))
+
+        result = stats._collected.pop(('/tmp/collect', 'train'))
+        pixels = np.concatenate([features['channels']['9'].ravel() for _, features in self.examples])
+        self.assertEqual(result['9']['count'], len(pixels))
+        self.assertAlmostEqual(result['9']['mean'], pixels.mean(), places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+"""Streaming decoding of live acquisitions without a TFDS build.
+
+`stream` decodes exported TIFFs as they arrive, with the channel and mask layout of a builder config, and yields
+examples or batches with the feature structure and dtypes that `as_dataset` returns for the built dataset, so new cells
+are classified by a model trained on it within milliseconds instead of after a rebuild:
+
+    builder = tfds.builder('poldiv/all-64')
+
+    for batch in streaming.stream(builder, '/data/acquisitions', batch_size=64, workers=4):
+        predictions = model.predict_on_batch(batch['channels'])
+
+A directory source is watched for new TIFFs with `watch`, any other source is an iterable of paths, TIFF bytes or
+`(name, bytes)` tuples. The TIFFs are read in a background thread and decoded by a pool of `workers` threads or
+processes. The decoded examples wait in a bounded queue, so reading pauses when the consumer falls behind. A batch is
+yielded as soon as it is full or `max_wait_seconds` after its first example, so a trickle of cells is not held back
+until a batch is full.
+
+The examples have the image features and `filename`, labels are not decoded. Images whose number of planes has no
+layout are skipped with a warning, and so are TIFFs that fail to decode if quarantine is enabled, see `quarantine`.
+"""
+
+import concurrent.futures
+import functools
+import io
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+from icyt import ifc
+from icyt import quarantine
+
+# 'thread' decodes in a thread pool, 'process' in a process pool, which needs picklable builder configs
+EXECUTORS = ['thread', 'process']
+
+SUFFIXES = ('.tif', '.tiff')
+
+_PENDING_PER_WORKER = 8
+
+# Interval at which blocked queue operations check whether the stream was closed
+_CHECK_SECONDS = 0.1
+
+# Marks the end of the source in the queue
+_END = object()
+
+
+def stream(builder, source, batch_size=None, workers=0, executor='thread', queue_size=None, max_wait_seconds=0.005,
+           poll_seconds=0.05, settle_seconds=0.2, idle_seconds=None, data_dir=None):
+    """Returns a generator of the decoded examples of TIFFs as they arrive, in the order of the source.
+
+    Args:
+      builder: the `tfds.core.DatasetBuilder` of an IFC dataset, or its name, e.g. `'poldiv/all-64'`. It needs not be
+        built.
+      source: `str`, directory to watch, or iterable of paths, TIFF bytes or `(name, bytes)` tuples.
+      batch_size: `int`, yields batches of up to `batch_size` examples, `None` yields single examples. Batches need a
+        config with `size`.
+      workers: `int`, number of decode workers, 0 decodes in the reading thread.
+      executor: `str`, one of `EXECUTORS`.
+      queue_size: `int`, maximum number of TIFFs that are read but not yet consumed, defaults to 8 per worker.
+      max_wait_seconds: `float`, time after the first example of a batch after which the batch is yielded even if it
+        is not full.
+      poll_seconds: `float`, interval at which a watched directory is listed.
+      settle_seconds: `float`, time since the last modification after which a TIFF in a watched directory is read.
+      idle_seconds: `float`, stops watching a directory after no new TIFF arrived for this long, `None` never stops.
+      data_dir: `str`, directory of the datasets if `builder` is a name.
+
+    Returns:
+      generator of `dict`s of the image features, `filename` and, for configs that crop to the masks, `frame_shape` and
+      `crop_offset`, as `np.ndarray`s with a leading batch dimension if `batch_size` is set.
+    """
+
+    if executor not in EXECUTORS:
+        raise ValueError(f'Executor must be one of {EXECUTORS}')
+
+    if workers < 0:
+        raise ValueError(f'Number of workers must not be negative, got {workers}')
+
+    if isinstance(builder, str):
+        builder = tfds.builder(builder, data_dir=data_dir)
+
+    layouts = getattr(builder, 'IFC_LAYOUTS', None)
+    config = builder.builder_config
+
+    if layouts is None:
+        raise ValueError(f'{builder.name} has no IFC layouts, only the exports of the IFC datasets can be streamed')
+
+    if batch_size is not None and config.size is None:
+        raise ValueError(f'Batches need images of one size, but config {config.name} of {builder.name} has no size')
+
+    decode = functools.partial(_decode, layouts=layouts, names=list(builder.info.metadata['channels']), config=config)
+    decode = quarantine.decoder(config, decode)
+    stop = threading.Event()
+
+    if isinstance(source, (str, os.PathLike)):
+        source = watch(source, poll_seconds, settle_seconds, idle_seconds, stop)
+
+    return _stream(decode, source, builder.info.features, batch_size, workers, executor,
+                   queue_size or max(workers, 1) * _PENDING_PER_WORKER, max_wait_seconds, stop)
+
+
+def _stream(decode_fn, source, features, batch_size, workers, executor, queue_size, max_wait_seconds, stop):
+    """Yields the examples or batches of `stream`, reading and decoding in the background until it is closed."""
+
+    pending = queue.Queue(queue_size)
+    pool = None
+
+    if workers > 0:
+        pool = (concurrent.futures.ThreadPoolExecutor if executor == 'thread' else
+                concurrent.futures.ProcessPoolExecutor)(workers)
+
+    thread = threading.Thread(target=_read, args=(decode_fn, source, pool, pending, stop), daemon=True,
+                              name='icyt-stream')
+    thread.start()
+
+    try:
+        for batch in _batches(pending, batch_size or 1, max_wait_seconds):
+            batch = [_cast(example, features) for example in batch]
+            yield _stack(batch) if batch_size is not None else batch[0]
+    finally:
+        stop.set()
+
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def watch(directory, poll_seconds=0.05, settle_seconds=0.2, idle_seconds=None, stop=None, suffixes=SUFFIXES):
+    """Yields the paths of the TIFFs in a directory, then the paths of new TIFFs as they are written.
+
+    A TIFF is yielded once it was not modified for `settle_seconds`, so TIFFs that are still being written are not
+    read. Writers that pause for longer should write to another suffix and rename the TIFF when it is complete. The
+    TIFFs of one listing are yielded in the order of their modification times.
+
+    Args:
+      directory: `str`, directory to watch, without subdirectories.
+      poll_seconds: `float`, interval at which the directory is listed.
+      settle_seconds: `float`, time since the last modification after which a TIFF is considered complete.
+      idle_seconds: `float`, stops after no new TIFF arrived for this long, `None` never stops.
+      stop: `threading.Event` that stops watching when it is set.
+      suffixes: tuple of `str`, lower case suffixes of the TIFFs.
+    """
+
+    stop = stop or threading.Event()
+    seen = set()
+    last_arrival = time.monotonic()
+
+    while not stop.is_set():
+        ready = []
+        now = time.time()
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.path in seen or not entry.name.lower().endswith(suffixes) or not entry.is_file():
+                    continue
+
+                modified = entry.stat().st_mtime
+
+                if now - modified >= settle_seconds:
+                    ready.append((modified, entry.path))
+
+        for _, path in sorted(ready):
+            seen.add(path)
+            yield path
+
+        if ready:
+            last_arrival = time.monotonic()
+        elif idle_seconds is not None and time.monotonic() - last_arrival >= idle_seconds:
+            return
+
+        stop.wait(poll_seconds)
+
+
+def _read(decode_fn, items, pool, pending, stop):
+    """Reads the items and queues the futures of their decoder results, runs in the background thread."""
+
+    try:
+        for i, item in enumerate(items):
+            if stop.is_set():
+                return
+
+            filename, data = _member(item, i)
+
+            if pool is not None:
+                future = pool.submit(decode_fn, filename, data)
+            else:
+                future = concurrent.futures.Future()
+
+                try:
+                    future.set_result(decode_fn(filename, data))
+                except Exception as e:
+                    future.set_exception(e)
+
+            _put(pending, future, stop)
+    except Exception as e:
+        future = concurrent.futures.Future()
+        future.set_exception(e)
+        _put(pending, future, stop)
+    finally:
+        _put(pending, _END, stop)
+
+
+def _put(pending, item, stop):
+    while not stop.is_set():
+        try:
+            pending.put(item, timeout=_CHECK_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def _member(item, i):
+    """Returns the `(filename, bytes)` of a source item."""
+
+    if isinstance(item, (bytes, bytearray, memoryview)):
+        return str(i), bytes(item)
+
+    if isinstance(item, tuple):
+        filename, data = item
+        return filename, data if isinstance(data, bytes) else data.read()
+
+    with open(item, 'rb') as f:
+        return os.fspath(item), f.read()
+
+
+def _decode(filename, data, layouts, names, config):
+    features = ifc.decode(filename, io.BytesIO(data), layouts, names, config)
+
+    if isinstance(features, ifc.Unknown):
+        return features
+
+    features['filename'] = filename
+    return features
+
+
+def _batches(pending, batch_size, max_wait_seconds):
+    """Groups the queued decoder results into lists of examples, yielded when full or after `max_wait_seconds`."""
+
+    batch = []
+    deadline = None
+    future = None
+
+    while True:
+        timeout = max(deadline - time.monotonic(), 0.) if batch else None
+
+        try:
+            future = future or pending.get(timeout=timeout)
+        except queue.Empty:
+            yield batch
+            batch = []
+            continue
+
+        if future is _END:
+            break
+
+        if batch and not concurrent.futures.wait([future], max(deadline - time.monotonic(), 0.)).done:
+            yield batch
+            batch = []
+            continue
+
+        example, future = future.result(), None
+
+        if isinstance(example, ifc.Unknown):
+            logging.warning('Skipped %s with unknown layout of %d planes', example.filename, example.planes)
+            continue
+
+        if isinstance(example, quarantine.Failed):
+            logging.warning('Skipped %s that failed to decode: %s', example.member, example.error)
+            continue
+
+        batch.append(example)
+
+        if len(batch) == 1:
+            deadline = time.monotonic() + max_wait_seconds
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def _cast(value, feature):
+    """Casts a decoded value to the dtype that `as_dataset` returns for its feature."""
+
+    if isinstance(feature, tfds.features.FeaturesDict):
+        return {key: _cast(item, feature[key]) for key, item in value.items()}
+
+    dtype = tf.as_dtype(feature.get_tensor_info().dtype)
+
+    if dtype == tf.string:
+        return value.encode() if isinstance(value, str) else value
+
+    return np.asarray(value, dtype=dtype.as_numpy_dtype)
+
+
+def _stack(examples):
+    """Stacks a list of examples into one example with a leading batch dimension."""
+
+    first = examples[0]
+
+    if isinstance(first, dict):
+        return {key: _stack([example[key] for example in examples]) for key in first}
+
+    if isinstance(first, bytes):
+        return np.array(examples, dtype=object)
+
+    return np.stack(examples)
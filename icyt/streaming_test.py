@@ -0,0 +1,145 @@
+"""Tests for icyt.streaming."""
+
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import tifffile as tiff
+
+from benchmarks import synthetic
+from icyt import ifc
+from icyt import streaming
+from poldiv import poldiv
+
+
+def _tiff(seed, num_planes=18):
+    rng = np.random.default_rng(seed)
+    masks = ifc.POLDIV_LAYOUTS[num_planes].masks if num_planes in ifc.POLDIV_LAYOUTS else ()
+    buffer = io.BytesIO()
+    tiff.imwrite(buffer, synthetic.ifc_image(rng, num_planes, 40 + seed, 50, masks=masks))
+    return buffer.getvalue()
+
+
+def _threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'icyt-stream']
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = poldiv.Poldiv(config='all-64', data_dir=tempfile.mkdtemp())
+        self.members = [(f'{i}.tif', _tiff(i)) for i in range(10)]
+
+    def test_examples(self):
+        examples = list(streaming.stream(self.builder, self.members[:3]))
+
+        self.assertEqual([example['filename'] for example in examples], [b'0.tif', b'1.tif', b'2.tif'])
+        self.assertEqual(set(examples[0]['channels']), {'1', '2', '3', '4', '5', '6', '9'})
+        self.assertEqual(examples[0]['channels']['1'].shape, (64, 64))
+        self.assertEqual(examples[0]['channels']['1'].dtype, np.uint16)
+
+    def test_batches_by_size(self):
+        for workers in [0, 3]:
+            with self.subTest(workers=workers):
+                batches = list(streaming.stream(self.builder, self.members, batch_size=4, workers=workers,
+                                                max_wait_seconds=10.))
+
+                self.assertEqual([len(batch['filename']) for batch in batches], [4, 4, 2])
+                self.assertEqual(batches[0]['channels']['9'].shape, (4, 64, 64))
+                self.assertEqual([name.decode() for batch in batches for name in batch['filename']],
+                                 [name for name, _ in self.members])
+
+    def test_batches_by_timeout(self):
+        def source():
+            yield self.members[0]
+            yield self.members[1]
+            time.sleep(0.5)
+            yield self.members[2]
+
+        batches = list(streaming.stream(self.builder, source(), batch_size=4, max_wait_seconds=0.05))
+
+        self.assertEqual([list(batch['filename']) for batch in batches], [[b'0.tif', b'1.tif'], [b'2.tif']])
+
+    def test_skips_unknown_and_failed(self):
+        members = [self.members[0], ('unknown.tif', _tiff(1, num_planes=5)), ('broken.tif', b'not a tiff'),
+                   self.members[2]]
+
+        with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '1'}):
+            with self.assertLogs(level='WARNING') as logs:
+                examples = list(streaming.stream(self.builder, members))
+
+        self.assertEqual([example['filename'] for example in examples], [b'0.tif', b'2.tif'])
+        self.assertTrue(any('unknown.tif' in line for line in logs.output))
+        self.assertTrue(any('broken.tif' in line for line in logs.output))
+
+    def test_raises_without_quarantine(self):
+        with mock.patch.dict(os.environ, {'ICYT_QUARANTINE': '0'}):
+            with self.assertRaises(Exception):
+                list(streaming.stream(self.builder, [self.members[0], ('broken.tif', b'not a tiff')]))
+
+    def test_close(self):
+        def endless():
+            while True:
+                yield from self.members
+
+        for workers in [0, 2]:
+            with self.subTest(workers=workers):
+                examples = streaming.stream(self.builder, endless(), batch_size=2, workers=workers, queue_size=4)
+                next(examples)
+                examples.close()
+
+                deadline = time.monotonic() + 5.
+
+                while _threads() and time.monotonic() < deadline:
+                    time.sleep(0.05)
+
+                self.assertEqual(_threads(), [])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            streaming.stream(poldiv.Poldiv(config='all', data_dir=self.builder.data_dir), self.members, batch_size=2)
+
+        with self.assertRaises(ValueError):
+            streaming.stream(self.builder, self.members, executor='fiber')
+
+
+class WatchTest(unittest.TestCase):
+
+    def test_new_files(self):
+        directory = tempfile.mkdtemp()
+
+        for i, name in enumerate(['b.tif', 'a.TIFF', 'notes.txt']):
+            path = os.path.join(directory, name)
+
+            with open(path, 'wb') as f:
+                f.write(b'data')
+
+            os.utime(path, (i, i))
+
+        def write_later():
+            time.sleep(0.2)
+
+            with open(os.path.join(directory, 'c.tif'), 'wb') as f:
+                f.write(b'data')
+
+        thread = threading.Thread(target=write_later)
+        thread.start()
+        paths = list(streaming.watch(directory, poll_seconds=0.02, settle_seconds=0.05, idle_seconds=0.5))
+        thread.join()
+
+        self.assertEqual([os.path.basename(path) for path in paths], ['b.tif', 'a.TIFF', 'c.tif'])
+
+    def test_stop(self):
+        stop = threading.Event()
+        stop.set()
+
+        self.assertEqual(list(streaming.watch(tempfile.mkdtemp(), stop=stop)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Test helpers of the iCyt datasets."""
+
+import inspect
+import io
+import os
+import tarfile
+from unittest import mock
+
+import tensorflow_datasets as tfds
+
+
+class DatasetBuilderTestCase(tfds.testing.DatasetBuilderTestCase):
+    """`tfds.testing.DatasetBuilderTestCase` that keeps the build cache out of the dummy data.
+
+    The TFDS test case uses the dummy data directory as download dir, so the decompressed archives, manifests and
+    example store are written to a temporary `ICYT_CACHE_DIR` instead.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(os.environ, {'ICYT_CACHE_DIR': os.path.join(self.tmp_dir, 'icyt')})
+        patcher.start()
+        self.patchers.append(patcher)
+
+
+def dummy_dir(builder_cls):
+    """Returns the dummy data directory next to a builder."""
+
+    return os.path.join(os.path.dirname(inspect.getfile(builder_cls)), 'dummy_data')
+
+
+def build(builder_cls, config, data_dir, manual_dir=None, **kwargs):
+    """Builds a config of a dataset from the dummy data next to its builder and returns the builder.
+
+    Args:
+      builder_cls: the `tfds.core.DatasetBuilder` class, e.g. `poldiv.Poldiv`.
+      config: `str`, name of the builder config.
+      data_dir: `str`, directory of the built dataset, the build cache is written to its `icyt` subdirectory.
+      manual_dir: `str`, directory of the archives to build from instead of the dummy data, e.g. from `add_members`.
+      **kwargs: keyword arguments forwarded to the builder, e.g. `file_format`.
+    """
+
+    builder = builder_cls(config=config, data_dir=data_dir, **kwargs)
+    manual_dir = manual_dir or dummy_dir(builder_cls)
+
+    with mock.patch.dict(os.environ, {'ICYT_CACHE_DIR': os.path.join(data_dir, 'icyt')}):
+        builder.download_and_prepare(download_config=tfds.download.DownloadConfig(manual_dir=manual_dir))
+
+    return builder
+
+
+def add_members(builder_cls, archive, members, target_dir):
+    """Writes a copy of a `.tar.gz` archive of the dummy data with extra members to `target_dir`.
+
+    Args:
+      builder_cls: the `tfds.core.DatasetBuilder` class whose dummy data holds the archive.
+      archive: `str`, file name of the archive.
+      members: list of `(name, bytes)` tuples appended to the archive, e.g. a corrupt TIFF.
+      target_dir: `str`, directory of the copy, to build from with `build(..., manual_dir=target_dir)`.
+    """
+
+    with tarfile.open(os.path.join(dummy_dir(builder_cls), archive), 'r:gz') as src, \
+            tarfile.open(os.path.join(target_dir, archive), 'w:gz') as dst:
+        for info in src.getmembers():
+            dst.addfile(info, src.extractfile(info))
+
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            dst.addfile(info, io.BytesIO(data))
@@ -0,0 +1,95 @@
+"""Build-time transformations of the multichannel images of the iCyt datasets."""
+
+import numpy as np
+
+
+def center(channels, masks, size):
+    """Pads or crops channel and mask images to `size` x `size` around the center of the cell.
+
+    The cell center is the center of the bounding box of all masks. Without masks, or if all masks are empty, the
+    images are cut around the center of the frame. Images are padded with the median background of each channel,
+    masks with zeros.
+
+    Args:
+      channels: `dict` of 2D channel images.
+      masks: `dict` of 2D mask images with the same keys as `channels`, or `None`.
+      size: `int`, height and width of the result.
+
+    Returns:
+      `(channels, masks)` tuple of `dict`s of `size` x `size` images, `masks` is `None` if no masks were given.
+    """
+
+    keys = list(channels)
+    image = np.stack([channels[key] for key in keys], axis=-1)
+    foreground = None
+
+    if masks is not None:
+        mask = np.stack([masks[key] for key in keys], axis=-1)
+        foreground = mask.any(axis=-1)
+
+    if foreground is not None and foreground.any():
+        ys, xs = np.nonzero(foreground)
+        cy, cx = (ys.min() + ys.max() + 1) // 2, (xs.min() + xs.max() + 1) // 2
+        background = image[~foreground] if not foreground.all() else image.reshape(-1, image.shape[-1])
+    else:
+        cy, cx = image.shape[0] // 2, image.shape[1] // 2
+        background = image.reshape(-1, image.shape[-1])
+
+    top, left = cy - size // 2, cx - size // 2
+    fill = np.median(background, axis=0).astype(image.dtype)
+    image = _window(image, top, left, size, fill)
+    channels = {key: image[:, :, i] for i, key in enumerate(keys)}
+
+    if masks is not None:
+        mask = _window(mask, top, left, size, np.zeros(mask.shape[-1], dtype=mask.dtype))
+        masks = {key: mask[:, :, i] for i, key in enumerate(keys)}
+
+    return channels, masks
+
+
+def crop_to_masks(channels, masks, margin=0):
+    """Crops channel and mask images to the bounding box of all masks.
+
+    The bounding box is the union over all masks, widened by `margin` pixels on each side and clipped to the frame, so
+    no pixel of the cell is lost. If all masks are empty, the full frame is kept.
+
+    Args:
+      channels: `dict` of 2D channel images.
+      masks: `dict` of 2D mask images.
+      margin: `int`, number of background pixels to keep around the masks.
+
+    Returns:
+      `(channels, masks, offset, frame_shape)` tuple with the cropped images, the `(top, left)` offset of the crop in
+      the frame and the `(height, width)` of the frame.
+    """
+
+    frame_shape = next(iter(channels.values())).shape
+    foreground = np.logical_or.reduce([mask != 0 for mask in masks.values()])
+
+    if not foreground.any():
+        return channels, masks, (0, 0), frame_shape
+
+    rows, cols = np.nonzero(foreground.any(axis=1))[0], np.nonzero(foreground.any(axis=0))[0]
+    top, bottom = max(rows[0] - margin, 0), min(rows[-1] + 1 + margin, frame_shape[0])
+    left, right = max(cols[0] - margin, 0), min(cols[-1] + 1 + margin, frame_shape[1])
+
+    channels = {key: np.ascontiguousarray(img[top:bottom, left:right]) for key, img in channels.items()}
+    masks = {key: np.ascontiguousarray(img[top:bottom, left:right]) for key, img in masks.items()}
+
+    return channels, masks, (int(top), int(left)), frame_shape
+
+
+def _window(image, top, left, size, fill):
+    """Cuts a `size` x `size` window out of an (H, W, C) image, filling the parts outside the image with `fill`."""
+
+    result = np.empty((size, size, image.shape[-1]), dtype=image.dtype)
+    result[...] = fill
+
+    src_top, src_left = max(top, 0), max(left, 0)
+    src_bottom, src_right = min(top + size, image.shape[0]), min(left + size, image.shape[1])
+
+    if src_top < src_bottom and src_left < src_right:
+        result[src_top - top:src_bottom - top, src_left - left:src_right - left] = \
+            image[src_top:src_bottom, src_left:src_right]
+
+    return result
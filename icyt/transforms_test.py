@@ -0,0 +1,155 @@
+"""Tests for icyt.transforms."""
+
+import unittest
+
+import numpy as np
+
+from icyt import transforms
+
+
+def _images(height=20, width=30, box=(8, 12, 10, 16)):
+    """Returns channels with a background of 100 and 200 and masks of a cell at the `(top, bottom, left, right)` box."""
+
+    rng = np.random.default_rng(0)
+    channels = {'1': np.full((height, width), 100, dtype=np.uint16), '9': np.full((height, width), 200, dtype=np.uint16)}
+    masks = {key: np.zeros((height, width), dtype=np.uint16) for key in channels}
+
+    if box is not None:
+        top, bottom, left, right = box
+
+        for key in channels:
+            channels[key][top:bottom, left:right] = rng.integers(1000, 2000, size=(bottom - top, right - left))
+
+        masks['1'][top:bottom, left:right] = 1
+
+    return channels, masks
+
+
+class WindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = np.arange(24, dtype=np.uint16).reshape(4, 3, 2)
+
+    def test_inside(self):
+        np.testing.assert_array_equal(transforms._window(self.image, 1, 0, 2, [0, 0]), self.image[1:3, 0:2])
+
+    def test_partly_outside(self):
+        window = transforms._window(self.image, -1, 2, 3, np.array([7, 9], dtype=np.uint16))
+
+        np.testing.assert_array_equal(window[1:, 0], self.image[:2, 2])
+        np.testing.assert_array_equal(window[0], [[7, 9]] * 3)
+        np.testing.assert_array_equal(window[:, 1:], np.broadcast_to([7, 9], (3, 2, 2)))
+
+    def test_outside(self):
+        window = transforms._window(self.image, 10, 10, 2, np.array([7, 9], dtype=np.uint16))
+        np.testing.assert_array_equal(window, np.broadcast_to([7, 9], (2, 2, 2)))
+
+
+class CenterTest(unittest.TestCase):
+
+    def test_crops_around_cell(self):
+        channels, masks = _images()
+        centered, centered_masks = transforms.center(channels, masks, 6)
+
+        # The cell box is rows 8-11 and columns 10-15, its center (10, 13)
+        for key in channels:
+            self.assertEqual(centered[key].shape, (6, 6))
+            self.assertEqual(centered[key].dtype, np.uint16)
+            np.testing.assert_array_equal(centered[key], channels[key][7:13, 10:16])
+            np.testing.assert_array_equal(centered_masks[key], masks[key][7:13, 10:16])
+
+    def test_cell_at_frame_edge(self):
+        channels, masks = _images(box=(0, 4, 26, 30))
+        centered, centered_masks = transforms.center(channels, masks, 8)
+
+        np.testing.assert_array_equal(centered['9'][2:, :6], channels['9'][:6, 24:])
+        np.testing.assert_array_equal(centered['9'][:2], 200)
+        np.testing.assert_array_equal(centered['9'][:, 6:], 200)
+        np.testing.assert_array_equal(centered_masks['1'][:2], 0)
+        self.assertEqual(centered_masks['1'].sum(), masks['1'].sum())
+
+    def test_size_larger_than_frame(self):
+        channels, masks = _images(height=6, width=8, box=(2, 4, 3, 5))
+        centered, centered_masks = transforms.center(channels, masks, 16)
+
+        self.assertEqual(centered['1'].shape, (16, 16))
+        np.testing.assert_array_equal(centered['1'][5:11, 4:12], channels['1'])
+        np.testing.assert_array_equal(centered_masks['1'][5:11, 4:12], masks['1'])
+        self.assertEqual(centered_masks['1'].sum(), masks['1'].sum())
+
+    def test_pads_with_median_background(self):
+        # The cell covers most of the frame, so the median of the whole frame would be a cell pixel
+        channels, masks = _images(height=6, width=8, box=(0, 6, 0, 6))
+        channels['1'][0, 7] = 60000
+        centered, _ = transforms.center(channels, masks, 16)
+
+        self.assertEqual(centered['1'][0, 0], 100)
+        self.assertEqual(centered['9'][0, 0], 200)
+
+    def test_empty_masks(self):
+        channels, masks = _images(box=None)
+        channels['1'][:, :10] = 50
+        centered, centered_masks = transforms.center(channels, masks, 40)
+
+        # Cut around the center of the frame, padded with the median of the whole frame
+        np.testing.assert_array_equal(centered['1'][10:30, 5:35], channels['1'])
+        self.assertEqual(centered['1'][0, 0], 100)
+        self.assertFalse(centered_masks['1'].any())
+
+    def test_without_masks(self):
+        channels, _ = _images()
+        centered, masks = transforms.center(channels, None, 4)
+
+        self.assertIsNone(masks)
+        np.testing.assert_array_equal(centered['9'], channels['9'][8:12, 13:17])
+
+
+class CropToMasksTest(unittest.TestCase):
+
+    def test_crop(self):
+        channels, masks = _images()
+        masks['9'][14, 20] = 1
+        cropped, cropped_masks, offset, frame_shape = transforms.crop_to_masks(channels, masks)
+
+        # Union of the masks of both channels
+        self.assertEqual((offset, frame_shape), ((8, 10), (20, 30)))
+
+        for key in channels:
+            self.assertTrue(cropped[key].flags['C_CONTIGUOUS'])
+            np.testing.assert_array_equal(cropped[key], channels[key][8:15, 10:21])
+            np.testing.assert_array_equal(cropped_masks[key], masks[key][8:15, 10:21])
+
+    def test_margin(self):
+        channels, masks = _images()
+        cropped, _, offset, _ = transforms.crop_to_masks(channels, masks, margin=3)
+
+        self.assertEqual(offset, (5, 7))
+        np.testing.assert_array_equal(cropped['1'], channels['1'][5:15, 7:19])
+
+    def test_cell_at_frame_edge(self):
+        channels, masks = _images(box=(0, 4, 26, 30))
+        cropped, cropped_masks, offset, _ = transforms.crop_to_masks(channels, masks, margin=3)
+
+        # The margin is clipped to the frame
+        self.assertEqual(offset, (0, 23))
+        np.testing.assert_array_equal(cropped['9'], channels['9'][0:7, 23:30])
+        self.assertEqual(cropped_masks['1'].sum(), masks['1'].sum())
+
+    def test_margin_larger_than_frame(self):
+        channels, masks = _images()
+        cropped, _, offset, _ = transforms.crop_to_masks(channels, masks, margin=100)
+
+        self.assertEqual(offset, (0, 0))
+        np.testing.assert_array_equal(cropped['1'], channels['1'])
+
+    def test_empty_masks(self):
+        channels, masks = _images(box=None)
+        cropped, cropped_masks, offset, frame_shape = transforms.crop_to_masks(channels, masks, margin=2)
+
+        self.assertEqual((offset, frame_shape), ((0, 0), (20, 30)))
+        self.assertIs(cropped, channels)
+        self.assertIs(cropped_masks, masks)
+
+
+if __name__ == '__main__':
+    unittest.main()
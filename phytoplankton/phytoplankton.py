@@ -2,10 +2,22 @@
 
 import tensorflow_datasets as tfds
 import tensorflow as tf
-import tifffile as tiff
+import functools
 import os
 import re
 
+from icyt import archive
+from icyt import beam
+from icyt import connectors
+from icyt import decode_cache
+from icyt import ifc
+from icyt import index
+from icyt import instrument
+from icyt import metadata
+from icyt import parallel
+from icyt import quarantine
+from icyt import stats
+
 # TODO(phytoplankton): Markdown description  that will appear on the catalog page.
 _DESCRIPTION = """
 Description is **formatted** as markdown.
@@ -20,21 +32,39 @@ _CITATION = """
 
 _DATA_OPTIONS = ['rep-0', 'rep-1']
 
+_PATH_REGEX = r'^(rep-\d)/(train|validation|test)/\d{8}_\d{2}_(\w)_\d+.*$'
+
+# Channels stored by the builder, in stacking order
+_CHANNELS = [str(i) for i in range(1, 13)]
+
 
 class PhytoplanktonConfig(tfds.core.BuilderConfig):
     """BuilderConfig for pythoplankton dataset."""
 
-    def __init__(self, dataset=None, selection=None, **kwargs):
+    def __init__(self, dataset=None, selection=None, layout='channels', codec='zlib', size=None, num_workers=None,
+                 use_beam=None, decode_cache=None, quarantine=None, **kwargs):
         """Constructs a PhytoplanktonConfig.
 
       Args:
         selection: `str`, one of `_DATA_OPTIONS`.
+        layout: `str`, one of `connectors.LAYOUTS`, whether channels are stored separately or stacked.
+        codec: `str`, one of `connectors.CODECS`, compression of the image tensors.
+        size: `int`, pads or crops the images to `size` x `size` around the cell, `None` keeps their size.
+        num_workers: `int`, number of processes that decode the TIFFs, 0 for serial decoding. Defaults to the
+          `ICYT_NUM_WORKERS` environment variable.
+        use_beam: `bool`, whether to build with Apache Beam. Defaults to the `ICYT_BEAM` environment variable.
+        decode_cache: `bool`, whether to cache the encoded images of every decoded member, so that rebuilds only decode
+          new or changed members. Defaults to the `ICYT_DECODE_CACHE` environment variable.
+        quarantine: `bool`, whether to skip and record members that fail to decode instead of aborting the build.
+          Defaults to the `ICYT_QUARANTINE` environment variable.
         **kwargs: keyword arguments forwarded to super.
       """
 
         if selection not in _DATA_OPTIONS:
             raise ValueError('Selection must be one of %s' % _DATA_OPTIONS)
 
+        connectors.validate(layout, codec, size=size)
+
         super(PhytoplanktonConfig, self).__init__(
             version=tfds.core.Version('1.0.0'),
             release_notes={
@@ -43,6 +73,13 @@ class PhytoplanktonConfig(tfds.core.BuilderConfig):
             **kwargs)
         self.selection = selection
         self.dataset = dataset
+        self.layout = layout
+        self.codec = codec
+        self.size = size
+        self.num_workers = num_workers
+        self.use_beam = use_beam
+        self.decode_cache = decode_cache
+        self.quarantine = quarantine
 
 
 class Phytoplankton(tfds.core.GeneratorBasedBuilder):
@@ -52,6 +89,9 @@ class Phytoplankton(tfds.core.GeneratorBasedBuilder):
   Place the dataset tar.gz file in the `~/tensorflow_datasets/downloads/manual` dir.
   """
 
+    # Plane layouts of the exported TIFFs, also used to decode live acquisitions with `icyt.streaming`
+    IFC_LAYOUTS = ifc.PHYTOPLANKTON_LAYOUTS
+
     VERSION = tfds.core.Version('1.0.0')
     RELEASE_NOTES = {
         '1.0.0': 'Initial release.',
@@ -59,17 +99,21 @@ class Phytoplankton(tfds.core.GeneratorBasedBuilder):
 
     BUILDER_CONFIGS = [
         PhytoplanktonConfig(name='rep-0', selection='rep-0', dataset="phytoplankton-1.0.0.tar.gz", description='rep-0'),
-        PhytoplanktonConfig(name='rep-1', selection='rep-1', dataset="phytoplankton-1.0.0.tar.gz", description='rep-1')
+        PhytoplanktonConfig(name='rep-1', selection='rep-1', dataset="phytoplankton-1.0.0.tar.gz", description='rep-1'),
+        PhytoplanktonConfig(name='rep-0-stacked', selection='rep-0', layout='stacked',
+                            dataset="phytoplankton-1.0.0.tar.gz", description='rep-0, stacked into one image'),
+        PhytoplanktonConfig(name='rep-1-stacked', selection='rep-1', layout='stacked',
+                            dataset="phytoplankton-1.0.0.tar.gz", description='rep-1, stacked into one image')
     ]
 
     def _info(self) -> tfds.core.DatasetInfo:
         """Returns the dataset metadata."""
 
-        channels = {str(i): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                    range(1, 13)}
-        features = {'channels': {**channels},
+        channels = connectors.image(_CHANNELS, tf.uint16, self.builder_config.layout, self.builder_config.codec,
+                                    self.builder_config.size)
+        features = {'channels': channels,
                     'filename': tf.string,
-                    'species': tfds.features.ClassLabel(names_file='phytoplankton/classes.txt')}
+                    'species': tfds.features.ClassLabel(names_file=metadata.class_file('phytoplankton', 'species'))}
 
         return tfds.core.DatasetInfo(
             builder=self,
@@ -78,6 +122,7 @@ class Phytoplankton(tfds.core.GeneratorBasedBuilder):
             supervised_keys=None,
             homepage='https://github.com/lahr/icyt-tfds',
             citation=_CITATION,
+            metadata=tfds.core.MetadataDict(channels=_CHANNELS),
         )
 
     def _split_generators(self, dl_manager: tfds.download.DownloadManager):
@@ -89,42 +134,69 @@ class Phytoplankton(tfds.core.GeneratorBasedBuilder):
             raise AssertionError(
                 f'You must download the dataset .tar.gz file and place it into {dl_manager.manual_dir}')
 
+        # The archive is decompressed once and shared by both reps, each split only reads its own members
+        preparation = instrument.Preparation(f'{self.name}/{self.builder_config.name}')
+
+        with preparation.stage('gunzip', os.path.getsize(path)) as step:
+            tar_path = archive.unpack(path, archive.cache_dir(dl_manager), step.advance)
+
+        with preparation.stage('route'):
+            members = archive.route(tar_path, _route)
+
+        rep = self.builder_config.selection
+
+        decode = functools.partial(_decode_example, config=self.builder_config)
+        decode = decode_cache.decoder(self, dl_manager, decode)
+        decode = stats.decoder(self, decode)
+        decode = quarantine.decoder(self.builder_config, decode)
+
+        if beam.enabled(self.builder_config):
+            return {
+                'train': beam.generate_tar_examples(tar_path, members.get((rep, 'train'), []), decode),
+                'valid': beam.generate_tar_examples(tar_path, members.get((rep, 'validation'), []), decode),
+                'test': beam.generate_tar_examples(tar_path, members.get((rep, 'test'), []), decode)
+            }
+
         return {
-            'train': self._generate_examples(dl_manager.iter_archive(path), self.builder_config.selection, 'train'),
-            'valid': self._generate_examples(dl_manager.iter_archive(path), self.builder_config.selection,
-                                             'validation'),
-            'test': self._generate_examples(dl_manager.iter_archive(path), self.builder_config.selection, 'test')
+            split: self._generate_examples(archive.iter_members(tar_path, members.get((rep, split_name), [])), split,
+                                           decode, len(members.get((rep, split_name), [])), preparation)
+            for split, split_name in [('train', 'train'), ('valid', 'validation'), ('test', 'test')]
         }
 
-    def _generate_examples(self, path_iter, rep, split_name=None):
+    def _generate_examples(self, path_iter, split, decode_fn, total=None, preparation=None):
         """Yields examples."""
 
-        path_regex = r'^(rep-\d)/(train|validation|test)/\d{8}_\d{2}_(\w)_\d+.*$'
+        decode_fn = instrument.Measured(decode_fn)
+        examples = parallel.imap(decode_fn, path_iter, parallel.num_workers(self.builder_config))
+        examples = instrument.track(examples, f'{self.name}/{self.builder_config.name}/{split}', total, preparation)
+        examples = quarantine.skip_failed(examples, self, split)
+        examples = ifc.skip_unknown(examples)
+        yield from stats.collect(examples, self, split)
 
-        for filename, fobj in path_iter:
-            assert filename is not None
-            assert fobj is not None
+    def _download_and_prepare(self, dl_manager, download_config):
+        """Generates the splits, writes their index and stores the channel statistics."""
 
-            m = re.match(path_regex, filename)
+        super(Phytoplankton, self)._download_and_prepare(dl_manager, download_config)
+        index.write(self)
+        stats.write(self)
 
-            if m.group(1) != rep or m.group(2) != split_name:
-                continue
 
-            species = m.group(3)
+def _decode_example(filename, fobj, config):
+    """Decodes a TIFF member into a `(key, features)` tuple."""
 
-            img = tiff.imread(fobj)
-            num_channels = img.shape[-1]
+    species = re.match(_PATH_REGEX, filename).group(3)
 
-            if num_channels == 12:
-                channels = {str(i): img[:, :, i - 1] for i in range(1, 13)}
+    features = ifc.decode(filename, fobj, ifc.PHYTOPLANKTON_LAYOUTS, _CHANNELS, config)
 
-            else:
-                raise AssertionError(f'Unknown number of channels ({num_channels}) for file {filename}')
+    if isinstance(features, ifc.Unknown):
+        return features
 
-            features = {
-                'channels': {**channels},
-                'filename': filename,
-                'species': species
-            }
+    features.update(filename=filename, species=species)
+    return filename, features
+
+
+def _route(filename):
+    """Routes a member to its `(rep, split)`."""
 
-            yield filename, features
+    m = re.match(_PATH_REGEX, filename)
+    return m.group(1, 2) if m else None
@@ -1,24 +1,19 @@
 """phytoplankton dataset."""
 
 import tensorflow_datasets as tfds
+from icyt import testing
 from . import phytoplankton
 
 
-class PhytoplanktonTest(tfds.testing.DatasetBuilderTestCase):
+class PhytoplanktonTest(testing.DatasetBuilderTestCase):
   """Tests for phytoplankton dataset."""
-  # TODO(phytoplankton):
   DATASET_CLASS = phytoplankton.Phytoplankton
   SPLITS = {
-      'train': 3,  # Number of fake train example
-      'test': 1,  # Number of fake test example
+      'train': 2,
+      'valid': 2,
+      'test': 2
   }
 
-  # If you are calling `download/download_and_extract` with a dict, like:
-  #   dl_manager.download({'some_key': 'http://a.org/out.txt', ...})
-  # then the tests needs to provide the fake output paths relative to the
-  # fake data directory
-  # DL_EXTRACT_RESULT = {'some_key': 'output_file1.txt', ...}
-
 
 if __name__ == '__main__':
   tfds.testing.test_main()
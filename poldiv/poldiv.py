@@ -1,12 +1,25 @@
 """poldiv dataset."""
 
-import csv
+import functools
 import os
 import re
 
 import tensorflow as tf
 import tensorflow_datasets as tfds
-import tifffile as tiff
+
+from icyt import archive
+from icyt import beam
+from icyt import connectors
+from icyt import decode_cache
+from icyt import grouping
+from icyt import ifc
+from icyt import index
+from icyt import instrument
+from icyt import metadata
+from icyt import parallel
+from icyt import quarantine
+from icyt import sharding
+from icyt import stats
 
 _DESCRIPTION = """The poldiv dataset contains IFC-measured pollen samples from 2018 to 2021 in 117 species and 57 
 genera. The images are R3/R4-gated and depict single in-focus, non-cropped cells (R4) or cells/multiple cells of the 
@@ -20,21 +33,55 @@ _CITATION = """
 
 _DATA_OPTIONS = ['all']
 
+_PATH_REGEX = r'^(?:([^/\n.A-Z]+)/)?([a-zA-Z]+\.?[a-zA-Z]+).*$'
+
+_SHARD_OPTIONS = ['species', 'genus', 'size']
+
+# Channels stored by the builder, in stacking order
+_CHANNELS = ['1', '2', '3', '4', '5', '6', '9']
+
+# Misspelled species names in the archive
+_SPECIES_FIXES = {
+    'chaenopodium.album': 'chenopodium.album',
+    'galium.mullogo': 'galium.mollugo',
+    'ginkgo.bilboa': 'ginkgo.biloba',
+}
+
 
 class PoldivConfig(tfds.core.BuilderConfig):
     """BuilderConfig for poldiv dataset."""
 
-    def __init__(self, dataset=None, selection=None, **kwargs):
+    def __init__(self, dataset=None, selection=None, layout='channels', codec='zlib', size=None, crop_margin=None,
+                 num_workers=None, use_beam=None, decode_cache=None,
+                 shard_by=None, mask_codec='tensor', quarantine=None, **kwargs):
         """Constructs a PoldivConfig.
 
         Args:
           selection: `str`, one of `_DATA_OPTIONS`.
+          layout: `str`, one of `connectors.LAYOUTS`, whether channels and masks are stored separately or stacked.
+          codec: `str`, one of `connectors.CODECS`, compression of the image tensors.
+          size: `int`, pads or crops the images to `size` x `size` around the cell, `None` keeps their size.
+          crop_margin: `int`, crops the images to the bounding box of the masks widened by `crop_margin` pixels, `None`
+            keeps the full frame.
+          num_workers: `int`, number of processes that decode the TIFFs, 0 for serial decoding. Defaults to the
+            `ICYT_NUM_WORKERS` environment variable.
+          use_beam: `bool`, whether to build with Apache Beam. Defaults to the `ICYT_BEAM` environment variable.
+          decode_cache: `bool`, whether to cache the encoded images of every decoded member, so that rebuilds only
+            decode new or changed members. Defaults to the `ICYT_DECODE_CACHE` environment variable.
+          shard_by: `str`, one of `_SHARD_OPTIONS`, writes the examples grouped by this label, or by size bucket for
+            `'size'`, instead of shuffled. `None` shuffles them.
+          mask_codec: `str`, one of `connectors.MASK_CODECS`, `'bits'` stores the binary masks as 1-bit bitmaps.
+          quarantine: `bool`, whether to skip and record members that fail to decode instead of aborting the build.
+            Defaults to the `ICYT_QUARANTINE` environment variable.
           **kwargs: keyword arguments forwarded to super.
         """
 
         if selection not in _DATA_OPTIONS:
             raise ValueError('Selection must be one of %s' % _DATA_OPTIONS)
 
+        connectors.validate(layout, codec, mask_codec, size, crop_margin)
+        grouping.validate(shard_by, _SHARD_OPTIONS, size, crop_margin)
+
         super(PoldivConfig, self).__init__(
             version=tfds.core.Version('3.0.0'),
             release_notes={
@@ -50,6 +97,16 @@ class PoldivConfig(tfds.core.BuilderConfig):
             **kwargs)
         self.selection = selection
         self.dataset = dataset
+        self.layout = layout
+        self.codec = codec
+        self.mask_codec = mask_codec
+        self.size = size
+        self.crop_margin = crop_margin
+        self.num_workers = num_workers
+        self.use_beam = use_beam
+        self.decode_cache = decode_cache
+        self.quarantine = quarantine
+        self.shard_by = shard_by
 
 
 class Poldiv(tfds.core.GeneratorBasedBuilder):
@@ -59,10 +116,29 @@ class Poldiv(tfds.core.GeneratorBasedBuilder):
     Place the dataset tar.gz file in the `~/tensorflow_datasets/downloads/manual` dir.
     """
 
+    # Plane layouts of the exported TIFFs, also used to decode live acquisitions with `icyt.streaming`
+    IFC_LAYOUTS = ifc.POLDIV_LAYOUTS
+
     # pytype: disable=wrong-keyword-args
     BUILDER_CONFIGS = [
         PoldivConfig(name='all', selection='all', dataset="poldiv-dataset-3.0.0.tar.gz",
                      description='All samples, channels 1/2/3/4/5/6/9 only'),
+        PoldivConfig(name='all-stacked', selection='all', layout='stacked', dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, stacked into one image and one mask'),
+        PoldivConfig(name='all-64', selection='all', size=64, dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, padded/cropped to 64x64 around the cell'),
+        PoldivConfig(name='all-96', selection='all', size=96, dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, padded/cropped to 96x96 around the cell'),
+        PoldivConfig(name='all-cropped', selection='all', crop_margin=4, dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, cropped to the masks with a 4 px margin'),
+        PoldivConfig(name='all-bits', selection='all', mask_codec='bits', dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, masks stored as 1-bit bitmaps'),
+        PoldivConfig(name='all-by-species', selection='all', shard_by='species', dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, grouped by species'),
+        PoldivConfig(name='all-by-genus', selection='all', shard_by='genus', dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, grouped by genus'),
+        PoldivConfig(name='all-by-size', selection='all', shard_by='size', dataset="poldiv-dataset-3.0.0.tar.gz",
+                     description='All samples, channels 1/2/3/4/5/6/9 only, grouped by image size bucket'),
     ]
 
     # pytype: enable=wrong-keyword-args
@@ -70,20 +146,22 @@ class Poldiv(tfds.core.GeneratorBasedBuilder):
     def _info(self) -> tfds.core.DatasetInfo:
         """Returns the dataset metadata."""
 
-        channels = {str(i + 1): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                    range(6)}
-        channels['9'] = tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib')
-        masks = {str(i + 1): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                 range(6)}
-        masks['9'] = tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib')
+        channels = connectors.image(_CHANNELS, tf.uint16, self.builder_config.layout, self.builder_config.codec,
+                                    self.builder_config.size)
+        masks = connectors.mask(_CHANNELS, self.builder_config.layout, self.builder_config.codec,
+                                self.builder_config.size, self.builder_config.mask_codec)
 
-        features = {'channels': {**channels},
-                    'masks': {**masks},
+        features = {'channels': channels,
+                    'masks': masks,
                     'filename': tf.string,
                     'species': tfds.features.ClassLabel(
-                        names_file=f'poldiv/classes-{self.builder_config.selection}-species.txt'),
+                        names_file=metadata.class_file('poldiv', 'species', self.builder_config.selection)),
                     'genus': tfds.features.ClassLabel(
-                        names_file=f'poldiv/classes-{self.builder_config.selection}-genus.txt')}
+                        names_file=metadata.class_file('poldiv', 'genus', self.builder_config.selection))}
+
+        if self.builder_config.crop_margin is not None:
+            features['frame_shape'] = tfds.features.Tensor(shape=(2,), dtype=tf.int32)
+            features['crop_offset'] = tfds.features.Tensor(shape=(2,), dtype=tf.int32)
 
         return tfds.core.DatasetInfo(
             builder=self,
@@ -92,6 +170,8 @@ class Poldiv(tfds.core.GeneratorBasedBuilder):
             supervised_keys=None,
             homepage='https://github.com/lahr/icyt-tfds',
             citation=_CITATION,
+            metadata=tfds.core.MetadataDict(channels=_CHANNELS),
+            disable_shuffling=self.builder_config.shard_by is not None,
         )
 
     def _split_generators(self, dl_manager: tfds.download.DownloadManager):
@@ -104,62 +184,90 @@ class Poldiv(tfds.core.GeneratorBasedBuilder):
                 f'You must download the dataset .tar.gz file and place it into {dl_manager.manual_dir}')
 
         if self.builder_config.selection == 'all':
+            decode = functools.partial(_decode_example, config=self.builder_config, mappings=metadata.genera('poldiv'))
+            decode = decode_cache.decoder(self, dl_manager, decode)
+            decode = stats.decoder(self, decode)
+            decode = quarantine.decoder(self.builder_config, decode)
+
+            if beam.enabled(self.builder_config) or self.builder_config.shard_by is not None:
+                preparation = instrument.Preparation(f'{self.name}/{self.builder_config.name}')
+
+                with preparation.stage('gunzip', os.path.getsize(path)) as step:
+                    tar_path = archive.unpack(path, archive.cache_dir(dl_manager), step.advance)
+
+                with preparation.stage('route'):
+                    members = archive.route(tar_path, lambda filename: 'train').get('train', [])
+
+                label = functools.partial(_label, shard_by=self.builder_config.shard_by,
+                                          mappings=metadata.genera('poldiv'))
+                members, keys = grouping.order(self, tar_path, members, label, preparation)
+
+                if beam.enabled(self.builder_config):
+                    return {
+                        'train': beam.generate_tar_examples(tar_path, members, decode, keys)
+                    }
+
+                path_iter = archive.iter_members(tar_path, members)
+                return {
+                    'train': self._generate_examples(path_iter, decode, keys, len(members), preparation)
+                }
+
             path_iter = dl_manager.iter_archive(path)
             return {
-                'train': self._generate_examples(path_iter)
+                'train': self._generate_examples(path_iter, decode)
             }
 
-    def _generate_examples(self, path_iter, split_name=None):
+    def _generate_examples(self, path_iter, decode_fn, keys=None, total=None, preparation=None):
         """Yields examples."""
 
-        path_regex = r'^(?:([^/\n.A-Z]+)/)?([a-zA-Z]+\.?[a-zA-Z]+).*$'
+        decode_fn = instrument.Measured(decode_fn)
+        examples = parallel.imap(decode_fn, path_iter, parallel.num_workers(self.builder_config))
+        examples = instrument.track(examples, f'{self.name}/{self.builder_config.name}/train', total, preparation)
+
+        if keys is not None:
+            examples = sharding.rekey(examples, keys)
+
+        examples = quarantine.skip_failed(examples, self, 'train')
+        examples = ifc.skip_unknown(examples)
+        yield from stats.collect(examples, self, 'train')
+
+    def _download_and_prepare(self, dl_manager, download_config):
+        """Generates the splits, writes their index and stores the channel statistics and group counts."""
+
+        super(Poldiv, self)._download_and_prepare(dl_manager, download_config)
+        splits = index.write(self)
+        stats.write(self)
+        grouping.write_counts(self, splits)
 
-        mapping_reader = csv.DictReader(open('poldiv/mapping-species-genus.csv'), fieldnames=['species', 'genus'])
-        mappings = list(mapping_reader)
 
-        for filename, fobj in path_iter:
-            assert filename is not None
-            assert fobj is not None
+def _species(filename):
+    """Returns the species of a member, with misspellings in the archive fixed."""
 
-            m = re.match(path_regex, filename)
-            species = m.group(2).lower()
+    species = re.match(_PATH_REGEX, filename).group(2).lower()
+    return _SPECIES_FIXES.get(species, species)
 
-            if 'chaenopodium.album' == species:
-                species = 'chenopodium.album'
 
-            elif 'galium.mullogo' == species:
-                species = 'galium.mollugo'
+def _label(filename, shard_by, mappings):
+    """Returns the species or genus of a member for class sharding."""
 
-            elif 'ginkgo.bilboa' == species:
-                species = 'ginkgo.biloba'
+    species = _species(filename)
+    return species if shard_by == 'species' else mappings.get(species)
 
-            mapping_result = next((item for item in mappings if item['species'] == species), None)
-            assert mapping_result is not None, f'Genus not found for {species}'
-            genus = mapping_result['genus']
 
-            img = tiff.imread(fobj)
-            num_channels = img.shape[-1] / 2  # for 2018 there are 7, 9 or 12 channels
+def _decode_example(filename, fobj, config, mappings):
+    """Decodes a TIFF member into a `(key, features)` tuple."""
 
-            if num_channels == 7 or num_channels == 9:
-                channels = {str(i + 1): img[:, :, i] for i in range(0, 6)}
-                channels['9'] = img[:, :, 6]
-                masks = {str(i - 6): img[:, :, i] for i in range(7, 13)}
-                masks['9'] = img[:, :, 13]
+    assert filename is not None
+    assert fobj is not None
 
-            elif num_channels == 12:
-                channels = {str(i + 1): img[:, :, i] for i in range(0, 6)}
-                channels['9'] = img[:, :, 8]
-                masks = {str(i - 11): img[:, :, i] for i in range(12, 18)}
-                masks['9'] = img[:, :, 20]
+    species = _species(filename)
+    genus = mappings.get(species)
+    assert genus is not None, f'Genus not found for {species}'
 
-            else:
-                raise AssertionError(f'Unknown number of channels ({num_channels}) for file {filename}')
+    features = ifc.decode(filename, fobj, ifc.POLDIV_LAYOUTS, _CHANNELS, config)
 
-            features = {
-                'channels': {**channels},
-                'masks': {**masks},
-                'filename': filename,
-                'species': species,
-                'genus': genus}
+    if isinstance(features, ifc.Unknown):
+        return features
 
-            yield filename, features
+    features.update(filename=filename, species=species, genus=genus)
+    return filename, features
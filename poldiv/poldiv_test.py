@@ -1,24 +1,17 @@
 """poldiv dataset."""
 
 import tensorflow_datasets as tfds
+from icyt import testing
 from . import poldiv
 
 
-class PoldivTest(tfds.testing.DatasetBuilderTestCase):
+class PoldivTest(testing.DatasetBuilderTestCase):
   """Tests for poldiv dataset."""
-  # TODO(poldiv):
   DATASET_CLASS = poldiv.Poldiv
   SPLITS = {
-      'train': 3,  # Number of fake train example
-      'test': 1,  # Number of fake test example
+      'train': 6
   }
 
-  # If you are calling `download/download_and_extract` with a dict, like:
-  #   dl_manager.download({'some_key': 'http://a.org/out.txt', ...})
-  # then the tests needs to provide the fake output paths relative to the
-  # fake data directory
-  # DL_EXTRACT_RESULT = {'some_key': 'output_file1.txt', ...}
-
 
 if __name__ == '__main__':
   tfds.testing.test_main()
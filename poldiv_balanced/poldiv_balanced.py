@@ -2,11 +2,22 @@
 
 import tensorflow_datasets as tfds
 import tensorflow as tf
-import tifffile as tiff
-import csv
+import functools
 import os
 import re
 
+from icyt import archive
+from icyt import beam
+from icyt import connectors
+from icyt import decode_cache
+from icyt import ifc
+from icyt import index
+from icyt import instrument
+from icyt import metadata
+from icyt import parallel
+from icyt import quarantine
+from icyt import stats
+
 _DESCRIPTION = """The poldiv_balanced dataset contains IFC-measured pollen samples from 2018, 2019, 2020 and REF in 12 
 classes. The images are R3/R4-gated and depict single in-focus, non-cropped cells (R4) or cells/multiple cells of the 
 same species of poor quality that are cropped or polluted (R3). The dataset yields the individual multispectral 
@@ -19,36 +30,102 @@ _CITATION = """
 
 _DATASET = "poldiv-dataset-balanced-3.0.0.tar.gz"
 
+_PATH_REGEX = r'^(?:([^/\n.A-Z]+)/)?([a-zA-Z]+\.?[a-zA-Z]+).*$'
+
+# Channels stored by the builder, in stacking order
+_CHANNELS = ['1', '2', '3', '4', '5', '6', '9']
+
+
+class PoldivBalancedConfig(tfds.core.BuilderConfig):
+    """BuilderConfig for poldiv_balanced dataset."""
+
+    def __init__(self, layout='channels', codec='zlib', size=None, crop_margin=None, num_workers=None, use_beam=None,
+                 decode_cache=None, mask_codec='tensor', quarantine=None, **kwargs):
+        """Constructs a PoldivBalancedConfig.
+
+        Args:
+          layout: `str`, one of `connectors.LAYOUTS`, whether channels and masks are stored separately or stacked.
+          codec: `str`, one of `connectors.CODECS`, compression of the image tensors.
+          size: `int`, pads or crops the images to `size` x `size` around the cell, `None` keeps their size.
+          crop_margin: `int`, crops the images to the bounding box of the masks widened by `crop_margin` pixels, `None`
+            keeps the full frame.
+          num_workers: `int`, number of processes that decode the TIFFs, 0 for serial decoding. Defaults to the
+            `ICYT_NUM_WORKERS` environment variable.
+          use_beam: `bool`, whether to build with Apache Beam. Defaults to the `ICYT_BEAM` environment variable.
+          decode_cache: `bool`, whether to cache the encoded images of every decoded member, so that rebuilds only
+            decode new or changed members. Defaults to the `ICYT_DECODE_CACHE` environment variable.
+          mask_codec: `str`, one of `connectors.MASK_CODECS`, `'bits'` stores the binary masks as 1-bit bitmaps.
+          quarantine: `bool`, whether to skip and record members that fail to decode instead of aborting the build.
+            Defaults to the `ICYT_QUARANTINE` environment variable.
+          **kwargs: keyword arguments forwarded to super.
+        """
+
+        connectors.validate(layout, codec, mask_codec, size, crop_margin)
+
+        super(PoldivBalancedConfig, self).__init__(
+            version=tfds.core.Version('3.1.0'),
+            release_notes={
+                '3.1.0': 'Builder configs, the initial dataset is the default config',
+                '3.0.0': 'Initial release.',
+            },
+            **kwargs)
+        self.layout = layout
+        self.codec = codec
+        self.mask_codec = mask_codec
+        self.size = size
+        self.crop_margin = crop_margin
+        self.num_workers = num_workers
+        self.use_beam = use_beam
+        self.decode_cache = decode_cache
+        self.quarantine = quarantine
+
 
 class PoldivBalanced(tfds.core.GeneratorBasedBuilder):
     """DatasetBuilder for poldiv_balanced dataset."""
 
-    VERSION = tfds.core.Version('3.0.0')
-    RELEASE_NOTES = {
-        '3.0.0': 'Initial release.',
-    }
-
     MANUAL_DOWNLOAD_INSTRUCTIONS = """
         Place the dataset tar.gz file in the `~/tensorflow_datasets/downloads/manual` dir.
         """
 
+    # Plane layouts of the exported TIFFs, also used to decode live acquisitions with `icyt.streaming`
+    IFC_LAYOUTS = ifc.POLDIV_LAYOUTS
+
+    # pytype: disable=wrong-keyword-args
+    BUILDER_CONFIGS = [
+        PoldivBalancedConfig(name='default', description='Channels 1/2/3/4/5/6/9 only'),
+        PoldivBalancedConfig(name='stacked', layout='stacked',
+                             description='Channels 1/2/3/4/5/6/9 only, stacked into one image and one mask'),
+        PoldivBalancedConfig(name='64', size=64,
+                             description='Channels 1/2/3/4/5/6/9 only, padded/cropped to 64x64 around the cell'),
+        PoldivBalancedConfig(name='96', size=96,
+                             description='Channels 1/2/3/4/5/6/9 only, padded/cropped to 96x96 around the cell'),
+        PoldivBalancedConfig(name='cropped', crop_margin=4,
+                             description='Channels 1/2/3/4/5/6/9 only, cropped to the masks with a 4 px margin'),
+        PoldivBalancedConfig(name='bits', mask_codec='bits',
+                             description='Channels 1/2/3/4/5/6/9 only, masks stored as 1-bit bitmaps'),
+    ]
+
+    # pytype: enable=wrong-keyword-args
+
     def _info(self) -> tfds.core.DatasetInfo:
         """Returns the dataset metadata."""
 
-        channels = {str(i + 1): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                    range(6)}
-        channels['9'] = tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib')
-        masks = {str(i + 1): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                 range(6)}
-        masks['9'] = tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib')
+        channels = connectors.image(_CHANNELS, tf.uint16, self.builder_config.layout, self.builder_config.codec,
+                                    self.builder_config.size)
+        masks = connectors.mask(_CHANNELS, self.builder_config.layout, self.builder_config.codec,
+                                self.builder_config.size, self.builder_config.mask_codec)
 
-        features = {'channels': {**channels},
-                    'masks': {**masks},
+        features = {'channels': channels,
+                    'masks': masks,
                     'filename': tf.string,
                     'species': tfds.features.ClassLabel(
-                        names_file=f'poldiv_balanced/classes-species.txt'),
+                        names_file=metadata.class_file('poldiv_balanced', 'species')),
                     'genus': tfds.features.ClassLabel(
-                        names_file=f'poldiv_balanced/classes-genus.txt')}
+                        names_file=metadata.class_file('poldiv_balanced', 'genus'))}
+
+        if self.builder_config.crop_margin is not None:
+            features['frame_shape'] = tfds.features.Tensor(shape=(2,), dtype=tf.int32)
+            features['crop_offset'] = tfds.features.Tensor(shape=(2,), dtype=tf.int32)
 
         return tfds.core.DatasetInfo(
             builder=self,
@@ -57,6 +134,7 @@ class PoldivBalanced(tfds.core.GeneratorBasedBuilder):
             supervised_keys=None,
             homepage='https://github.com/lahr/icyt-tfds',
             citation=_CITATION,
+            metadata=tfds.core.MetadataDict(channels=_CHANNELS),
         )
 
     def _split_generators(self, dl_manager: tfds.download.DownloadManager):
@@ -68,62 +146,76 @@ class PoldivBalanced(tfds.core.GeneratorBasedBuilder):
             raise AssertionError(
                 f'You must download the dataset .tar.gz file and place it into {dl_manager.manual_dir}')
 
+        # Decompress the archive only once and hand each split the members that belong to it
+        preparation = instrument.Preparation(f'{self.name}/{self.builder_config.name}')
+
+        with preparation.stage('gunzip', os.path.getsize(path)) as step:
+            tar_path = archive.unpack(path, archive.cache_dir(dl_manager), step.advance)
+
+        with preparation.stage('route'):
+            members = archive.route(tar_path, _route)
+
+        decode = functools.partial(_decode_example, config=self.builder_config,
+                                   mappings=metadata.genera('poldiv_balanced'))
+        decode = decode_cache.decoder(self, dl_manager, decode)
+        decode = stats.decoder(self, decode)
+        decode = quarantine.decoder(self.builder_config, decode)
+
+        if beam.enabled(self.builder_config):
+            return {
+                split: beam.generate_tar_examples(tar_path, members.get(split, []), decode)
+                for split in ['train', 'valid', 'test']
+            }
+
         return {
-            'train': self._generate_examples(dl_manager.iter_archive(path), 'train'),
-            'valid': self._generate_examples(dl_manager.iter_archive(path), 'valid'),
-            'test': self._generate_examples(dl_manager.iter_archive(path), 'test')
+            split: self._generate_examples(archive.iter_members(tar_path, members.get(split, [])), split, decode,
+                                           len(members.get(split, [])), preparation)
+            for split in ['train', 'valid', 'test']
         }
 
-    def _generate_examples(self, path_iter, split_name):
+    def _generate_examples(self, path_iter, split_name, decode_fn, total=None, preparation=None):
         """Yields examples."""
 
-        path_regex = r'^(?:([^/\n.A-Z]+)/)?([a-zA-Z]+\.?[a-zA-Z]+).*$'
+        decode_fn = instrument.Measured(decode_fn)
+        examples = parallel.imap(decode_fn, path_iter, parallel.num_workers(self.builder_config))
+        examples = instrument.track(examples, f'{self.name}/{self.builder_config.name}/{split_name}', total,
+                                    preparation)
+        examples = quarantine.skip_failed(examples, self, split_name)
+        examples = ifc.skip_unknown(examples)
+        yield from stats.collect(examples, self, split_name)
+
+    def _download_and_prepare(self, dl_manager, download_config):
+        """Generates the splits, writes their index and stores the channel statistics."""
 
-        mapping_reader = csv.DictReader(open('poldiv_balanced/mapping-species-genus.csv'),
-                                        fieldnames=['species', 'genus'])
-        mappings = list(mapping_reader)
+        super(PoldivBalanced, self)._download_and_prepare(dl_manager, download_config)
+        index.write(self)
+        stats.write(self)
 
-        for filename, fobj in path_iter:
-            assert filename is not None
-            assert fobj is not None
 
-            m = re.match(path_regex, filename)
+def _route(filename):
+    """Routes a member to its split, dropping the "others" class and members that are not images of a class."""
 
-            if m.group(1) != split_name:
-                continue
+    m = re.match(_PATH_REGEX, filename)
 
-            species = m.group(2).lower()
+    if m is None or m.group(2).lower() == 'others':
+        return None
 
-            if species == 'others':
-                continue
+    return m.group(1)
 
-            mapping_result = next((item for item in mappings if item['species'] == species), None)
-            assert mapping_result is not None, f'Genus not found for {species}'
-            genus = mapping_result['genus']
 
-            img = tiff.imread(fobj)
-            num_channels = img.shape[-1] / 2  # for 2018 there are 7, 9 or 12 channels
+def _decode_example(filename, fobj, config, mappings):
+    """Decodes a TIFF member into a `(key, features)` tuple."""
 
-            if num_channels == 7 or num_channels == 9:
-                channels = {str(i + 1): img[:, :, i] for i in range(0, 6)}
-                channels['9'] = img[:, :, 6]
-                masks = {str(i - 6): img[:, :, i] for i in range(7, 13)}
-                masks['9'] = img[:, :, 13]
+    m = re.match(_PATH_REGEX, filename)
+    species = m.group(2).lower()
 
-            elif num_channels == 12:
-                channels = {str(i + 1): img[:, :, i] for i in range(0, 6)}
-                channels['9'] = img[:, :, 8]
-                masks = {str(i - 11): img[:, :, i] for i in range(12, 18)}
-                masks['9'] = img[:, :, 20]
+    genus = mappings.get(species)
+    assert genus is not None, f'Genus not found for {species}'
 
-            else:
-                raise AssertionError(f'Unknown number of channels ({num_channels}) for file {filename}')
+    features = ifc.decode(filename, fobj, ifc.POLDIV_LAYOUTS, _CHANNELS, config)
 
-            features = {
-                'channels': {**channels},
-                'masks': {**masks},
-                'filename': filename,
-                'species': species,
-                'genus': genus}
+    if isinstance(features, ifc.Unknown):
+        return features
 
-            yield filename, features
+    features.update(filename=filename, species=species, genus=genus)
+    return filename, features
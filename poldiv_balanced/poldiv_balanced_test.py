@@ -1,23 +1,32 @@
 """poldiv_balanced dataset."""
 
+import unittest
+
 import tensorflow_datasets as tfds
+from icyt import testing
 from . import poldiv_balanced
 
 
-class PoldivBalancedTest(tfds.testing.DatasetBuilderTestCase):
+class PoldivBalancedTest(testing.DatasetBuilderTestCase):
   """Tests for poldiv_balanced dataset."""
-  # TODO(poldiv_balanced):
   DATASET_CLASS = poldiv_balanced.PoldivBalanced
   SPLITS = {
-      'train': 3,  # Number of fake train example
-      'test': 1,  # Number of fake test example
+      'train': 3,
+      'valid': 2,
+      'test': 3
   }
 
-  # If you are calling `download/download_and_extract` with a dict, like:
-  #   dl_manager.download({'some_key': 'http://a.org/out.txt', ...})
-  # then the tests needs to provide the fake output paths relative to the
-  # fake data directory
-  # DL_EXTRACT_RESULT = {'some_key': 'output_file1.txt', ...}
+
+class RouteTest(unittest.TestCase):
+  """Tests for the routing of poldiv_balanced members."""
+
+  def test_route(self):
+    self.assertEqual(poldiv_balanced._route('train/carpinus.betulus_000000.tif'), 'train')
+    self.assertIsNone(poldiv_balanced._route('train/others_000002.tif'))
+
+  def test_not_matching(self):
+    for filename in ['.DS_Store', 'train/._000003.tif', '__MACOSX/._train']:
+      self.assertIsNone(poldiv_balanced._route(filename))
 
 
 if __name__ == '__main__':
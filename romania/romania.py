@@ -2,10 +2,24 @@
 
 import tensorflow_datasets as tfds
 import tensorflow as tf
-import tifffile as tiff
+import functools
 import os
 import re
 
+from icyt import archive
+from icyt import beam
+from icyt import connectors
+from icyt import decode_cache
+from icyt import grouping
+from icyt import ifc
+from icyt import index
+from icyt import instrument
+from icyt import metadata
+from icyt import parallel
+from icyt import quarantine
+from icyt import sharding
+from icyt import stats
+
 _DESCRIPTION = """"""
 
 # TODO(romania): BibTeX citation
@@ -14,21 +28,51 @@ _CITATION = """
 
 _DATA_OPTIONS = ['all', 'artificial-mixtures', 'metabarcoding', 'metabarcoding2', 'metabarcoding3']
 
+_PATH_REGEX = r'^(?:([^/\n.A-Z]+)/)?([a-zA-Z]+\.?[a-zA-Z]+)/(.*)/.*$'
+
+_SHARD_OPTIONS = ['species', 'size']
+
+# Channels stored by the builder, in stacking order
+_CHANNELS = ['1', '2', '3', '4', '5', '6', '9']
+
+# Bump when `_parse_member` changes to invalidate cached manifests
+_MANIFEST_VERSION = '1'
+
 
 class RomaniaConfig(tfds.core.BuilderConfig):
     """BuilderConfig for romania dataset."""
 
-    def __init__(self, dataset=None, selection=None, **kwargs):
+    def __init__(self, dataset=None, selection=None, layout='channels', codec='zlib', size=None, crop_margin=None,
+                 num_workers=None, use_beam=None, decode_cache=None,
+                 shard_by=None, mask_codec='tensor', quarantine=None, **kwargs):
         """Constructs a RomaniaConfig.
 
         Args:
           selection: `str`, one of `_DATA_OPTIONS`.
+          layout: `str`, one of `connectors.LAYOUTS`, whether channels and masks are stored separately or stacked.
+          codec: `str`, one of `connectors.CODECS`, compression of the image tensors.
+          size: `int`, pads or crops the images to `size` x `size` around the cell, `None` keeps their size.
+          crop_margin: `int`, crops the images to the bounding box of the masks widened by `crop_margin` pixels, `None`
+            keeps the full frame.
+          num_workers: `int`, number of processes that decode the TIFFs, 0 for serial decoding. Defaults to the
+            `ICYT_NUM_WORKERS` environment variable.
+          use_beam: `bool`, whether to build with Apache Beam. Defaults to the `ICYT_BEAM` environment variable.
+          decode_cache: `bool`, whether to cache the encoded images of every decoded member, so that rebuilds only
+            decode new or changed members. Defaults to the `ICYT_DECODE_CACHE` environment variable.
+          shard_by: `str`, one of `_SHARD_OPTIONS`, writes the examples grouped by this label, or by size bucket for
+            `'size'`, instead of shuffled. `None` shuffles them.
+          mask_codec: `str`, one of `connectors.MASK_CODECS`, `'bits'` stores the binary masks as 1-bit bitmaps.
+          quarantine: `bool`, whether to skip and record members that fail to decode instead of aborting the build.
+            Defaults to the `ICYT_QUARANTINE` environment variable.
           **kwargs: keyword arguments forwarded to super.
         """
 
         if selection not in _DATA_OPTIONS:
             raise ValueError('Selection must be one of %s' % _DATA_OPTIONS)
 
+        connectors.validate(layout, codec, mask_codec, size, crop_margin)
+        grouping.validate(shard_by, _SHARD_OPTIONS, size, crop_margin)
+
         super(RomaniaConfig, self).__init__(
             version=tfds.core.Version('3.0.0'),
             release_notes={
@@ -39,6 +83,16 @@ class RomaniaConfig(tfds.core.BuilderConfig):
             **kwargs)
         self.selection = selection
         self.dataset = dataset
+        self.layout = layout
+        self.codec = codec
+        self.mask_codec = mask_codec
+        self.size = size
+        self.crop_margin = crop_margin
+        self.num_workers = num_workers
+        self.use_beam = use_beam
+        self.decode_cache = decode_cache
+        self.quarantine = quarantine
+        self.shard_by = shard_by
 
 
 class Romania(tfds.core.GeneratorBasedBuilder):
@@ -48,30 +102,47 @@ class Romania(tfds.core.GeneratorBasedBuilder):
     Place the dataset tar.gz file in the `~/tensorflow_datasets/downloads/manual` dir.
     """
 
+    # Plane layouts of the exported TIFFs, also used to decode live acquisitions with `icyt.streaming`
+    IFC_LAYOUTS = ifc.POLDIV_LAYOUTS
+
     # pytype: disable=wrong-keyword-args
     BUILDER_CONFIGS = [
         RomaniaConfig(name='all', selection='all', dataset="romania-train-3.0.0.tar.gz", description='All training samples'),
         RomaniaConfig(name='artificial-mixtures', selection='artificial-mixtures', dataset="romania-train-3.0.0.tar.gz", description='All training samples'),
         RomaniaConfig(name='metabarcoding', selection='metabarcoding', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding'),
         RomaniaConfig(name='metabarcoding2', selection='metabarcoding2', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding, monosamples and art. mixtures'),
-        RomaniaConfig(name='metabarcoding3', selection='metabarcoding3', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding, additional Hypericum samples')
+        RomaniaConfig(name='metabarcoding3', selection='metabarcoding3', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding, additional Hypericum samples'),
+        RomaniaConfig(name='all-stacked', selection='all', layout='stacked', dataset="romania-train-3.0.0.tar.gz", description='All training samples, stacked into one image and one mask'),
+        RomaniaConfig(name='artificial-mixtures-stacked', selection='artificial-mixtures', layout='stacked', dataset="romania-train-3.0.0.tar.gz", description='All training samples, stacked into one image and one mask'),
+        RomaniaConfig(name='metabarcoding-stacked', selection='metabarcoding', layout='stacked', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding, stacked into one image and one mask'),
+        RomaniaConfig(name='metabarcoding2-stacked', selection='metabarcoding2', layout='stacked', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding, monosamples and art. mixtures, stacked into one image and one mask'),
+        RomaniaConfig(name='metabarcoding3-stacked', selection='metabarcoding3', layout='stacked', dataset="romania-train-3.0.0.tar.gz", description='Training samples that were identified with metabarcoding, additional Hypericum samples, stacked into one image and one mask'),
+        RomaniaConfig(name='all-64', selection='all', size=64, dataset="romania-train-3.0.0.tar.gz", description='All training samples, padded/cropped to 64x64 around the cell'),
+        RomaniaConfig(name='all-96', selection='all', size=96, dataset="romania-train-3.0.0.tar.gz", description='All training samples, padded/cropped to 96x96 around the cell'),
+        RomaniaConfig(name='all-cropped', selection='all', crop_margin=4, dataset="romania-train-3.0.0.tar.gz", description='All training samples, cropped to the masks with a 4 px margin'),
+        RomaniaConfig(name='all-bits', selection='all', mask_codec='bits', dataset="romania-train-3.0.0.tar.gz", description='All training samples, masks stored as 1-bit bitmaps'),
+        RomaniaConfig(name='all-by-species', selection='all', shard_by='species', dataset="romania-train-3.0.0.tar.gz", description='All training samples, grouped by species'),
+        RomaniaConfig(name='all-by-size', selection='all', shard_by='size', dataset="romania-train-3.0.0.tar.gz", description='All training samples, grouped by image size bucket')
     ]
 
     # pytype: enable=wrong-keyword-args
     def _info(self) -> tfds.core.DatasetInfo:
         """Returns the dataset metadata."""
 
-        channels = {str(i + 1): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                    range(6)}
-        channels['9'] = tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib')
-        masks = {str(i + 1): tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib') for i in
-                 range(6)}
-        masks['9'] = tfds.features.Tensor(dtype=tf.uint16, shape=(None, None), encoding='zlib')
+        channels = connectors.image(_CHANNELS, tf.uint16, self.builder_config.layout, self.builder_config.codec,
+                                    self.builder_config.size)
+        masks = connectors.mask(_CHANNELS, self.builder_config.layout, self.builder_config.codec,
+                                self.builder_config.size, self.builder_config.mask_codec)
 
-        features = {'channels': {**channels},
-                    'masks': {**masks},
+        features = {'channels': channels,
+                    'masks': masks,
                     'filename': tf.string,
-                    'species': tfds.features.ClassLabel(names_file=f'romania/{self.builder_config.selection}-classes-species.txt')}
+                    'species': tfds.features.ClassLabel(
+                        names_file=metadata.class_file('romania', 'species', self.builder_config.selection))}
+
+        if self.builder_config.crop_margin is not None:
+            features['frame_shape'] = tfds.features.Tensor(shape=(2,), dtype=tf.int32)
+            features['crop_offset'] = tfds.features.Tensor(shape=(2,), dtype=tf.int32)
 
         return tfds.core.DatasetInfo(
             builder=self,
@@ -80,6 +151,8 @@ class Romania(tfds.core.GeneratorBasedBuilder):
             supervised_keys=None,
             homepage='https://github.com/lahr/icyt-tfds',
             citation=_CITATION,
+            metadata=tfds.core.MetadataDict(channels=_CHANNELS),
+            disable_shuffling=self.builder_config.shard_by is not None,
         )
 
     def _split_generators(self, dl_manager: tfds.download.DownloadManager):
@@ -91,54 +164,89 @@ class Romania(tfds.core.GeneratorBasedBuilder):
             raise AssertionError(
                 f'You must download the dataset .tar.gz file and place it into {dl_manager.manual_dir}')
 
-        path_iter = dl_manager.iter_archive(path)
+        # All configs select their measurements from the cached manifest and only read the selected members
+        preparation = instrument.Preparation(f'{self.name}/{self.builder_config.name}')
+        cache_dir = archive.cache_dir(dl_manager)
+
+        with preparation.stage('gunzip', os.path.getsize(path)) as step:
+            tar_path = archive.unpack(path, cache_dir, step.advance)
+
+        with preparation.stage('manifest'):
+            measurements = metadata.measurements(self.builder_config.selection)
+            members = [entry for entry in archive.manifest(path, tar_path, _parse_member, _MANIFEST_VERSION, cache_dir)
+                       if measurements is None or entry.fields['measurement'].startswith(measurements)]
+
+        members, keys = grouping.order(self, tar_path, members, _species, preparation)
+
+        decode = functools.partial(_decode_example, config=self.builder_config)
+        decode = decode_cache.decoder(self, dl_manager, decode)
+        decode = stats.decoder(self, decode)
+        decode = quarantine.decoder(self.builder_config, decode)
+
+        if beam.enabled(self.builder_config):
+            return {
+                'train': beam.generate_tar_examples(tar_path, members, decode, keys)
+            }
+
         return {
-            'train': self._generate_examples(path_iter)
+            'train': self._generate_examples(archive.iter_members(tar_path, members), decode, keys, len(members),
+                                             preparation)
         }
 
-    def _generate_examples(self, path_iter, split_name=None):
+    def _generate_examples(self, path_iter, decode_fn, keys=None, total=None, preparation=None):
         """Yields examples."""
 
-        path_regex = r'^(?:([^/\n.A-Z]+)/)?([a-zA-Z]+\.?[a-zA-Z]+)/(.*)/.*$'
+        decode_fn = instrument.Measured(decode_fn)
+        examples = parallel.imap(decode_fn, path_iter, parallel.num_workers(self.builder_config))
+        examples = instrument.track(examples, f'{self.name}/{self.builder_config.name}/train', total, preparation)
+
+        if keys is not None:
+            examples = sharding.rekey(examples, keys)
+
+        examples = quarantine.skip_failed(examples, self, 'train')
+        examples = ifc.skip_unknown(examples)
+        yield from stats.collect(examples, self, 'train')
+
+    def _download_and_prepare(self, dl_manager, download_config):
+        """Generates the splits, writes their index and stores the channel statistics and group counts."""
+
+        super(Romania, self)._download_and_prepare(dl_manager, download_config)
+        splits = index.write(self, _index_fields)
+        stats.write(self)
+        grouping.write_counts(self, splits)
+
+
+def _parse_member(filename):
+    """Parses species and measurement of a member for the manifest, `None` leaves out members that do not match."""
+
+    m = re.match(_PATH_REGEX, filename)
+    return {'species': m.group(2), 'measurement': m.group(3)} if m else None
+
+
+def _index_fields(filename):
+    """Returns the measurement of a member for the index."""
 
-        if self.builder_config.selection != 'all':
-            with open(f'romania/{self.builder_config.selection}-measurements.txt') as f:
-                measurements = tuple([line.rstrip() for line in f])
+    return {'measurement': _parse_member(filename)['measurement']}
 
-        for filename, fobj in path_iter:
-            assert filename is not None
-            assert fobj is not None
 
-            m = re.match(path_regex, filename)
+def _species(filename):
+    """Returns the species of a member."""
 
-            if self.builder_config.selection != 'all':
-                if not m.group(3).startswith(measurements):
-                    continue
+    return re.match(_PATH_REGEX, filename).group(2)
 
-            species = m.group(2)
 
-            img = tiff.imread(fobj)
-            num_channels = img.shape[-1] / 2
+def _decode_example(filename, fobj, config):
+    """Decodes a TIFF member into a `(key, features)` tuple."""
 
-            if num_channels == 7 or num_channels == 9:
-                channels = {str(i + 1): img[:, :, i] for i in range(0, 6)}
-                channels['9'] = img[:, :, 6]
-                masks = {str(i - 6): img[:, :, i] for i in range(7, 13)}
-                masks['9'] = img[:, :, 13]
+    assert filename is not None
+    assert fobj is not None
 
-            elif num_channels == 12:
-                channels = {str(i + 1): img[:, :, i] for i in range(0, 6)}
-                channels['9'] = img[:, :, 8]
-                masks = {str(i - 11): img[:, :, i] for i in range(12, 18)}
-                masks['9'] = img[:, :, 20]
+    species = _species(filename)
 
-            else:
-                raise AssertionError(f'Unknown number of channels ({num_channels}) for file {filename}')
+    features = ifc.decode(filename, fobj, ifc.POLDIV_LAYOUTS, _CHANNELS, config)
 
-            features = {
-                'channels': {**channels},
-                'masks': {**masks},
-                'filename': filename,
-                'species': species}
+    if isinstance(features, ifc.Unknown):
+        return features
 
-            yield filename, features
+    features.update(filename=filename, species=species)
+    return filename, features
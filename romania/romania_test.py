@@ -0,0 +1,147 @@
+"""romania dataset."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import tensorflow_datasets as tfds
+from icyt import archive
+from icyt import bucketing
+from icyt import index
+from icyt import testing
+from . import romania
+
+
+class RomaniaTest(testing.DatasetBuilderTestCase):
+  """Tests for romania dataset."""
+  DATASET_CLASS = romania.Romania
+  BUILDER_CONFIG_NAMES_TO_TEST = ['all', 'all-stacked', 'all-64', 'all-cropped', 'all-bits']
+  SPLITS = {
+      'train': 12
+  }
+
+
+class RomaniaArtificialMixturesTest(testing.DatasetBuilderTestCase):
+  """Tests for the artificial mixtures config of the romania dataset."""
+  DATASET_CLASS = romania.Romania
+  BUILDER_CONFIG_NAMES_TO_TEST = ['artificial-mixtures', 'artificial-mixtures-stacked']
+  SPLITS = {
+      'train': 9
+  }
+
+
+class RomaniaMetabarcodingTest(testing.DatasetBuilderTestCase):
+  """Tests for the metabarcoding configs of the romania dataset."""
+  DATASET_CLASS = romania.Romania
+  BUILDER_CONFIG_NAMES_TO_TEST = ['metabarcoding', 'metabarcoding2', 'metabarcoding3', 'metabarcoding-stacked']
+  SPLITS = {
+      'train': 10
+  }
+
+
+class RomaniaManifestTest(unittest.TestCase):
+  """Tests that the configs share the cached manifest of the archive."""
+
+  def setUp(self):
+    self.data_dir = tempfile.mkdtemp()
+    self.manifest_path = os.path.join(self.data_dir, 'icyt', 'romania-train-3.0.0.tar.gz.manifest.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.data_dir)
+
+  def _build(self, config):
+    with mock.patch.object(archive, 'route', wraps=archive.route) as route:
+      testing.build(romania.Romania, config, self.data_dir)
+
+    return route.call_count
+
+  def _version(self):
+    with open(self.manifest_path) as f:
+      return json.load(f)['version']
+
+  def test_reused(self):
+    self.assertEqual(self._build('all'), 1)
+    self.assertEqual(self._build('metabarcoding'), 0)
+    self.assertEqual(self._version(), romania._MANIFEST_VERSION)
+
+  def test_invalidated_by_version(self):
+    self.assertEqual(self._build('all'), 1)
+
+    with mock.patch.object(romania, '_MANIFEST_VERSION', romania._MANIFEST_VERSION + '-changed'):
+      self.assertEqual(self._build('artificial-mixtures'), 1)
+      self.assertEqual(self._version(), romania._MANIFEST_VERSION)
+
+    self.assertEqual(self._build('metabarcoding'), 1)
+
+
+class RomaniaBySpeciesTest(testing.DatasetBuilderTestCase):
+  """Tests for the species-sharded config of the romania dataset."""
+  DATASET_CLASS = romania.Romania
+  BUILDER_CONFIG_NAMES_TO_TEST = ['all-by-species']
+  SPLITS = {
+      'train': 12
+  }
+
+  def test_classes(self):
+    builder = testing.build(romania.Romania, 'all-by-species', self.tmp_dir)
+    classes = builder.info.metadata['classes']['train']
+    ix = index.load(builder, 'train')
+    names = builder.info.features['species'].names
+    end = 0
+
+    for name, counts in classes.items():
+      self.assertEqual((counts['start'], counts['end'] - counts['start']), (end, counts['count']))
+      in_range = (ix['position'] >= counts['start']) & (ix['position'] < counts['end'])
+      self.assertEqual({names[label] for label in ix['species'][in_range]}, {name})
+      end = counts['end']
+
+    self.assertEqual(end, 12)
+    self.assertEqual(list(classes), sorted(classes, key=names.index))
+
+
+class ParseMemberTest(unittest.TestCase):
+  """Tests for the manifest fields of romania members."""
+
+  def test_parse(self):
+    self.assertEqual(romania._parse_member('plantago.atra/20200130_40fach_vom20190902_34/000006.tif'),
+                     {'species': 'plantago.atra', 'measurement': '20200130_40fach_vom20190902_34'})
+
+  def test_not_matching(self):
+    for filename in ['.DS_Store', 'README.txt', 'plantago.atra/000006.tif']:
+      self.assertIsNone(romania._parse_member(filename))
+
+
+class RomaniaBySizeTest(testing.DatasetBuilderTestCase):
+  """Tests for the size-bucketed config of the romania dataset."""
+  DATASET_CLASS = romania.Romania
+  BUILDER_CONFIG_NAMES_TO_TEST = ['all-by-size']
+  SPLITS = {
+      'train': 12
+  }
+
+  def test_buckets(self):
+    builder = testing.build(romania.Romania, 'all-by-size', self.tmp_dir)
+    boundaries = builder.info.metadata['boundaries']
+    buckets = builder.info.metadata['buckets']['train']
+    ix = index.load(builder, 'train')
+
+    self.assertEqual(boundaries, bucketing.boundaries(list(map(max, ix['height'], ix['width']))))
+    self.assertEqual(list(buckets), [name for name in bucketing.names(boundaries) if name in buckets])
+    self.assertEqual(sum(bucket['count'] for bucket in buckets.values()), 12)
+
+    names = bucketing.names(boundaries)
+    assigned = bucketing.assign(list(map(max, ix['height'], ix['width'])), boundaries)
+    end = 0
+
+    for name, bucket in buckets.items():
+      self.assertEqual((bucket['start'], bucket['end'] - bucket['start']), (end, bucket['count']))
+      in_range = (ix['position'] >= bucket['start']) & (ix['position'] < bucket['end'])
+      self.assertEqual({names[i] for i in assigned[in_range]}, {name})
+      end = bucket['end']
+
+
+if __name__ == '__main__':
+  tfds.testing.test_main()